@@ -0,0 +1,70 @@
+import hashlib
+import os
+import time
+from functools import lru_cache
+
+from paperscope.config import DB_PATH
+from paperscope.file_utils import atomic_write
+
+# Content-addressed store for large text fields, one file per sha256 digest
+BLOB_DIR = os.getenv("PAPERSCOPE_BLOB_DIR", os.path.splitext(DB_PATH)[0] + ".blobs")
+
+# Unreferenced blobs younger than this are kept: a writer may be about to reference them
+GC_GRACE_SECONDS = 3600
+
+
+def _path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest[2:])
+
+
+def put(text):
+    """
+    Store a text and return its sha256 digest. Identical texts are stored once.
+    """
+    data = text.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    path = _path(digest)
+    if os.path.exists(path):
+        # Refresh the mtime so a concurrent garbage collection keeps it
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path, "wb") as f:
+            f.write(data)
+    return digest
+
+
+@lru_cache(maxsize=1024)
+def get(digest):
+    """
+    Load a text by digest. Blobs never change, so recent reads are cached.
+    """
+    with open(_path(digest), "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def collect_garbage(live_digests, grace_seconds=GC_GRACE_SECONDS):
+    """
+    Delete blobs that no stored paper references any more.
+    Returns the number of blobs removed.
+    """
+    if not os.path.isdir(BLOB_DIR):
+        return 0
+
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    for prefix in os.listdir(BLOB_DIR):
+        directory = os.path.join(BLOB_DIR, prefix)
+        if len(prefix) != 2 or not os.path.isdir(directory):
+            continue
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if prefix + name in live_digests:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
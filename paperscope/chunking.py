@@ -0,0 +1,97 @@
+import os
+import re
+
+# Passages are windows of about CHUNK_CHARS characters (roughly 200 tokens, within
+# the input limit of small sentence-transformers models). Consecutive windows of
+# a section share CHUNK_OVERLAP characters, so a sentence cut at a window edge is
+# still whole in one of them.
+CHUNK_CHARS = int(os.getenv("PAPERSCOPE_CHUNK_CHARS", "1000"))
+CHUNK_OVERLAP = int(os.getenv("PAPERSCOPE_CHUNK_OVERLAP", "200"))
+
+# Numbered ("3.1 Training setup", "IV. Results") or common unnumbered headings
+_HEADING = re.compile(
+    r"^(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^.!?]{0,80}"
+    r"|abstract|introduction|related work|background|methods?|methodology|experiments?"
+    r"|results|discussion|conclusions?|acknowledge?ments?|references|bibliography|appendix\b.{0,60})$",
+    re.IGNORECASE)
+# Nothing after these is worth searching
+_END = re.compile(r"^(?:\d+\.?\s+)?(?:references|bibliography)$", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _paragraphs(text):
+    """
+    (section, paragraph) pairs of text extracted from a PDF. A paragraph ends
+    at a blank line or a line ending a sentence; hyphenated line breaks are joined.
+    """
+    section, lines = "", []
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if line and len(line) < 100 and _HEADING.match(line):
+            if lines:
+                yield section, " ".join(lines)
+                lines = []
+            if _END.match(line):
+                return
+            section = line
+            continue
+        if line:
+            if lines and lines[-1].endswith("-") and line[:1].islower():
+                lines[-1] = lines[-1][:-1] + line
+            else:
+                lines.append(line)
+        if lines and (not line or line.endswith((".", "?", "!"))):
+            yield section, " ".join(lines)
+            lines = []
+    if lines:
+        yield section, " ".join(lines)
+
+
+def _pieces(paragraph, size):
+    """
+    A paragraph cut at sentence (or, for run-on text, word) boundaries into
+    pieces of at most `size` characters.
+    """
+    for sentence in _SENTENCE_END.split(paragraph):
+        while len(sentence) > size:
+            cut = sentence.rfind(" ", 0, size)
+            cut = cut if cut > 0 else size
+            yield sentence[:cut]
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            yield sentence
+
+
+def _tail(text, size):
+    """
+    The last `size` characters of text, starting at a word.
+    """
+    if len(text) <= size:
+        return text
+    start = text.find(" ", len(text) - size)
+    return text[start + 1:] if start >= 0 else ""
+
+
+def chunk_text(text, size=None, overlap=None):
+    """
+    Split a paper's full text into overlapping passages, yielded one at a time
+    as {"section", "text"}. Passages do not cross section headings, and the
+    reference list is skipped.
+    """
+    size = size or CHUNK_CHARS
+    overlap = min(CHUNK_OVERLAP if overlap is None else overlap, size // 2)
+    window, window_section, fresh = "", None, False
+    for section, paragraph in _paragraphs(text):
+        if section != window_section:
+            if fresh:
+                yield {"section": window_section, "text": window}
+            window, window_section, fresh = "", section, False
+        for piece in _pieces(paragraph, size):
+            if window and len(window) + 1 + len(piece) > size:
+                if fresh:
+                    yield {"section": window_section, "text": window}
+                window, fresh = _tail(window, overlap), False
+            window = f"{window} {piece}" if window else piece
+            fresh = True
+    if fresh:
+        yield {"section": window_section, "text": window}
@@ -0,0 +1,155 @@
+import json
+import os
+import struct
+
+# msgpack and zstandard are optional: without them the database stays in JSON
+try:
+    import msgpack
+    _HAS_MSGPACK = True
+except ImportError:
+    msgpack = None
+    _HAS_MSGPACK = False
+
+try:
+    import zstandard
+    _HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    _HAS_ZSTD = False
+
+# Serialization of the database snapshot: "json" (pretty-printed) or "msgpack"
+# (binary, one length-prefixed record per paper). Unset, an existing file keeps
+# its format and new databases are JSON. Files are recognized by their header
+# on load whatever the setting. msgpack files are smaller and save faster than
+# JSON but load a little slower (scripts/bench_db_format.py measures both).
+DB_FORMAT = os.getenv("PAPERSCOPE_DB_FORMAT", "").lower() or None
+
+# "none" or "zstd"; unset, an existing file keeps its compression
+DB_COMPRESSION = os.getenv("PAPERSCOPE_DB_COMPRESSION", "").lower() or None
+ZSTD_LEVEL = int(os.getenv("PAPERSCOPE_ZSTD_LEVEL", "3"))
+
+FORMATS = ("json", "msgpack")
+COMPRESSIONS = ("none", "zstd")
+
+MSGPACK_MAGIC = b"PSDB\x01"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_LENGTH = struct.Struct(">I")
+
+_warned = set()
+
+
+def _warn_once(message):
+    if message not in _warned:
+        _warned.add(message)
+        print(f"Warning: {message}")
+
+
+def resolve(fmt=None, compression=None, current=None):
+    """
+    The (format, compression) to write with: the arguments, else the configured
+    settings, else `current` (the existing file's), else uncompressed JSON.
+    Falls back to what is installed.
+    """
+    current_fmt, current_compression = current or ("json", "none")
+    fmt = (fmt or DB_FORMAT or current_fmt).lower()
+    compression = (compression or DB_COMPRESSION or current_compression).lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown database format '{fmt}'. Use one of: {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown database compression '{compression}'. Use one of: {', '.join(COMPRESSIONS)}")
+
+    if fmt == "msgpack" and not _HAS_MSGPACK:
+        _warn_once("msgpack is not installed; writing the database as JSON.")
+        fmt = "json"
+    if compression == "zstd" and not _HAS_ZSTD:
+        _warn_once("zstandard is not installed; writing the database uncompressed.")
+        compression = "none"
+    return fmt, compression
+
+
+def detect(raw):
+    """
+    (format, compression) of an encoded snapshot, from its leading bytes.
+    """
+    compression = "zstd" if raw.startswith(ZSTD_MAGIC) else "none"
+    if compression == "zstd":
+        if not _HAS_ZSTD:
+            return "json", compression
+        raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw[:4096])
+    return ("msgpack" if raw.startswith(MSGPACK_MAGIC) else "json"), compression
+
+
+def encode(generation, version, papers, fmt="json", compression="none"):
+    """
+    Serialize a snapshot to bytes.
+    """
+    fmt, compression = resolve(fmt, compression)
+
+    if fmt == "msgpack":
+        packer = msgpack.Packer(use_bin_type=True)
+        parts = [MSGPACK_MAGIC]
+        for item in [{"generation": generation, "version": version, "count": len(papers)}, *papers]:
+            packed = packer.pack(item)
+            parts.append(_LENGTH.pack(len(packed)))
+            parts.append(packed)
+        raw = b"".join(parts)
+    else:
+        raw = json.dumps({"generation": generation, "version": version, "papers": list(papers)},
+                         indent=2, ensure_ascii=False).encode("utf-8")
+
+    if compression == "zstd":
+        raw = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return raw
+
+
+def _decode_msgpack(raw):
+    view = memoryview(raw)
+    pos = len(MSGPACK_MAGIC)
+    items = []
+    while pos < len(view):
+        if pos + _LENGTH.size > len(view):
+            raise ValueError("truncated record header")
+        (length,) = _LENGTH.unpack_from(view, pos)
+        pos += _LENGTH.size
+        if pos + length > len(view):
+            raise ValueError("truncated record")
+        items.append(msgpack.unpackb(view[pos:pos + length], raw=False))
+        pos += length
+
+    if not items or not isinstance(items[0], dict):
+        raise ValueError("missing header")
+    header, papers = items[0], items[1:]
+    if header.get("count", len(papers)) != len(papers):
+        raise ValueError(f"expected {header['count']} records, found {len(papers)}")
+    return header.get("generation", 0), header.get("version", 0), papers
+
+
+def decode(raw):
+    """
+    Parse a snapshot in any supported format. Returns (generation, version, papers).
+    A legacy snapshot (a bare JSON list) is generation 0, version 0.
+    Raises ValueError if the data is damaged or needs a package that is not
+    installed, TypeError if it is JSON but not a database.
+    """
+    if raw.startswith(ZSTD_MAGIC):
+        if not _HAS_ZSTD:
+            raise ValueError("the database is zstd-compressed; install zstandard to read it")
+        try:
+            raw = zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e)) from e
+
+    if raw.startswith(MSGPACK_MAGIC):
+        if not _HAS_MSGPACK:
+            raise ValueError("the database is stored as msgpack; install msgpack to read it")
+        try:
+            return _decode_msgpack(raw)
+        except (ValueError, TypeError, msgpack.exceptions.UnpackException) as e:
+            raise ValueError(str(e)) from e
+
+    data = json.loads(raw)
+    if isinstance(data, list):
+        return 0, 0, data
+    if not isinstance(data, dict):
+        raise TypeError("unexpected JSON document")
+    return data.get("generation", 0), data.get("version", 0), data.get("papers", [])
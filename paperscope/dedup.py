@@ -0,0 +1,256 @@
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import struct
+from contextlib import contextmanager
+
+from paperscope.config import DB_PATH
+from paperscope.text_index import tokenize
+
+# Optional: signatures are computed vectorized with numpy (same values without it)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Near-duplicate detection: a MinHash signature of each paper's abstract, and an
+# LSH index over the signatures, so the same paper arriving again (as an arXiv
+# entry, from its PDF URL or as an upload, under another id) is recognised
+# before it is summarized and embedded. Kept in step with storage like the
+# keyword index (see text_index.py).
+DEDUP_INDEX_PATH = os.getenv("PAPERSCOPE_DEDUP_INDEX_PATH", os.path.splitext(DB_PATH)[0] + ".minhash.sqlite3")
+
+# A paper is a duplicate when this share of the shingles of the shorter text is
+# also in the other (estimated from the signatures); 0 disables the check
+DEDUP_THRESHOLD = float(os.getenv("PAPERSCOPE_DEDUP_THRESHOLD", "0.8"))
+
+# 128 hash functions in 32 bands of 4: papers sharing any band are compared,
+# which finds pairs with a Jaccard similarity of 0.5 87% of the time (0.7: 99.99%)
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+# Shingles are runs of this many words; texts with fewer shingles are too
+# short to tell apart and are never reported as duplicates
+SHINGLE_WORDS = 3
+MIN_SHINGLES = 8
+
+# Of a full text, only the abstract is compared (the window after the word
+# "abstract", else the opening of the text), so it matches the abstract of the
+# same paper from arXiv
+ABSTRACT_CHARS = 2000
+_ABSTRACT = re.compile(r"\babstract\b", re.IGNORECASE)
+
+# Hash functions h(x) = ((a x + b) mod 2^64) >> 32 with odd a (multiply-shift),
+# which numpy's wrapping uint64 arithmetic computes exactly
+_MASK = (1 << 64) - 1
+_rng = random.Random(20240601)
+_PERMUTATIONS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(MINHASH_PERMUTATIONS)]
+if np is not None:
+    _A = np.array([a for a, _ in _PERMUTATIONS], dtype="uint64")[:, None]
+    _B = np.array([b for _, b in _PERMUTATIONS], dtype="uint64")[:, None]
+_PACK = struct.Struct(f"<{MINHASH_PERMUTATIONS}I")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    paper_id TEXT PRIMARY KEY,
+    shingles INTEGER NOT NULL,
+    signature BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    key INTEGER NOT NULL,
+    paper_id TEXT NOT NULL,
+    PRIMARY KEY (band, key, paper_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS bands_paper ON bands (paper_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+_initialized = set()
+
+
+@contextmanager
+def _connect():
+    """
+    Open the index database in one committed transaction, creating the schema on first use.
+    """
+    conn = sqlite3.connect(DEDUP_INDEX_PATH, timeout=30)
+    try:
+        if DEDUP_INDEX_PATH not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized.add(DEDUP_INDEX_PATH)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _abstract_text(paper):
+    """
+    The text a paper is compared by: the abstract part of its full text, else its abstract.
+    """
+    text = paper.get("text")
+    if text:
+        head = text[:ABSTRACT_CHARS * 3]
+        match = _ABSTRACT.search(head)
+        start = match.end() if match else 0
+        return head[start:start + ABSTRACT_CHARS]
+    return paper.get("abstract") or ""
+
+
+def _shingle_hashes(text):
+    words = tokenize(text)
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    # hashlib, not hash(): signatures are stored and must match across processes
+    return [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+
+
+def signature(paper):
+    """
+    (shingle count, MinHash signature) of a paper, or None if its text is too short.
+    """
+    hashes = _shingle_hashes(_abstract_text(paper))
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    if np is not None:
+        with np.errstate(over="ignore"):
+            mins = (_A * np.array(hashes, dtype="uint64")[None, :] + _B).min(axis=1) >> np.uint64(32)
+        return len(hashes), tuple(int(m) for m in mins)
+    return len(hashes), tuple(min((a * x + b) & _MASK for x in hashes) >> 32 for a, b in _PERMUTATIONS)
+
+
+def _band_keys(mins):
+    """
+    (band, key) pairs of a signature: each band's rows hashed to one 63-bit key.
+    """
+    packed = _PACK.pack(*mins)
+    width = _ROWS * _PACK.size // MINHASH_PERMUTATIONS
+    return [(band, int.from_bytes(hashlib.blake2b(packed[band * width:(band + 1) * width],
+                                                  digest_size=8).digest(), "big") & 0x7FFFFFFFFFFFFFFF)
+            for band in range(LSH_BANDS)]
+
+
+def similarity(first, second):
+    """
+    Estimated share of the shingles of the shorter text found in the other,
+    from two signatures.
+    """
+    (size_a, mins_a), (size_b, mins_b) = first, second
+    jaccard = sum(a == b for a, b in zip(mins_a, mins_b)) / MINHASH_PERMUTATIONS
+    # |A & B| = J (|A| + |B|) / (1 + J)
+    shared = jaccard * (size_a + size_b) / (1 + jaccard)
+    return min(1.0, shared / min(size_a, size_b))
+
+
+def _get_meta(conn, key, default=0):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _remove(conn, paper_ids):
+    for paper_id in paper_ids:
+        conn.execute("DELETE FROM bands WHERE paper_id = ?", (paper_id,))
+        conn.execute("DELETE FROM docs WHERE paper_id = ?", (paper_id,))
+
+
+def _add(conn, papers):
+    """
+    Index papers, replacing any previous version of the same id.
+    """
+    papers = list(papers)
+    _remove(conn, [p.get("id") for p in papers])
+    for paper in papers:
+        sig = signature(paper)
+        if sig is None:
+            continue
+        size, mins = sig
+        conn.execute("INSERT INTO docs (paper_id, shingles, signature) VALUES (?, ?, ?)",
+                     (paper.get("id"), size, _PACK.pack(*mins)))
+        conn.executemany("INSERT OR IGNORE INTO bands (band, key, paper_id) VALUES (?, ?, ?)",
+                         [(band, key, paper.get("id")) for band, key in _band_keys(mins)])
+
+
+def _advance_version(conn, before, after):
+    """
+    Move the synced version from `before` to `after`. If the index was not at
+    `before` it missed a write; clear the version so the next lookup rebuilds.
+    """
+    if _get_meta(conn, "version", None) == before:
+        _set_meta(conn, "version", after)
+    else:
+        _set_meta(conn, "version", None)
+
+
+def add_papers(papers, before, after):
+    """
+    Incrementally index papers added by the storage write that took the
+    database from version `before` to `after`.
+    """
+    with _connect() as conn:
+        _add(conn, papers)
+        _advance_version(conn, before, after)
+
+
+def remove_papers(paper_ids, before, after):
+    """
+    Incrementally remove papers deleted by the storage write from `before` to `after`.
+    """
+    with _connect() as conn:
+        _remove(conn, paper_ids)
+        _advance_version(conn, before, after)
+
+
+def rebuild(papers, version):
+    """
+    Re-index the whole corpus from scratch.
+    """
+    with _connect() as conn:
+        conn.execute("DELETE FROM bands")
+        conn.execute("DELETE FROM docs")
+        _add(conn, papers)
+        _set_meta(conn, "version", version)
+
+
+def indexed_version():
+    """
+    The storage version the index was last synced with (None if never built).
+    """
+    with _connect() as conn:
+        return _get_meta(conn, "version", None)
+
+
+def find_duplicate(paper, threshold=None):
+    """
+    The stored paper `paper` is a near duplicate of, as (paper_id, similarity),
+    or None. Only papers sharing an LSH band with it are compared.
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    sig = signature(paper) if threshold > 0 else None
+    if sig is None:
+        return None
+
+    keys = _band_keys(sig[1])
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT paper_id, shingles, signature FROM docs WHERE paper_id IN "
+            f"(SELECT paper_id FROM bands WHERE (band, key) IN (VALUES {','.join(['(?, ?)'] * len(keys))}))",
+            [value for key in keys for value in key],
+        ).fetchall()
+
+    best = None
+    for paper_id, size, packed in rows:
+        score = similarity(sig, (size, _PACK.unpack(packed)))
+        if score >= threshold and (best is None or score > best[1]):
+            best = (paper_id, score)
+    return best
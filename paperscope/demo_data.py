@@ -1,4 +1,3 @@
-import json
 import os
 from typing import Tuple
 
@@ -7,7 +6,7 @@ from paperscope.summarizer_demo import summarize
 
 
 def load_demo_data(build_index: bool = False) -> tuple[bool,str]:
-    """Create a small demo database and metadata file.
+    """Create a small demo database.
 
     If build_index is True, attempt to call the repository's build_index function.
     Returns (success, message).
@@ -32,13 +31,6 @@ def load_demo_data(build_index: bool = False) -> tuple[bool,str]:
     except Exception as e:
         return False, f"Failed to save demo DB: {e}"
 
-    # Write meta.json for FAISS metadata fallback
-    try:
-        with open("meta.json", "w") as f:
-            json.dump(sample, f)
-    except Exception as e:
-        return False, f"Failed to write meta.json: {e}"
-
     if build_index:
         try:
             # Import lazily because vector_store may require faiss
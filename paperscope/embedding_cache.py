@@ -0,0 +1,195 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from paperscope.config import DB_PATH
+from paperscope.file_utils import file_lock
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except ImportError:
+    np = None
+    _HAS_NUMPY = False
+
+# On-disk cache of embeddings keyed by sha256(model name + normalization +
+# text): a model's normalized and raw vectors of a text differ. Vectors are
+# appended as raw float32 rows to one file per model and dimension (read through
+# a memory map); a small SQLite table maps each key to its file and row.
+EMBEDDING_CACHE_DIR = os.getenv("PAPERSCOPE_EMBEDDING_CACHE_DIR", os.path.splitext(DB_PATH)[0] + ".embeddings")
+
+# Set PAPERSCOPE_EMBEDDING_CACHE=0 to always run the model
+EMBEDDING_CACHE_ENABLED = os.getenv("PAPERSCOPE_EMBEDDING_CACHE", "1").lower() not in ("0", "false", "no")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vectors (
+    key TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    row INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+# Open memory maps by matrix path, with the row count they cover
+_maps = {}
+_initialized = set()
+
+
+def _index_path():
+    return os.path.join(EMBEDDING_CACHE_DIR, "index.sqlite3")
+
+
+@contextmanager
+def _connect():
+    """
+    Open the key index in one committed transaction, creating it on first use.
+    """
+    os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+    path = _index_path()
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        if path not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized.add(path)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def cache_key(model_name, normalize, text):
+    """
+    sha256 of the model name, whether its vectors are normalized, and the text.
+    """
+    return hashlib.sha256(f"{model_name}\0{int(bool(normalize))}\0{text}".encode()).hexdigest()
+
+
+def _matrix_file(model_name, dim):
+    safe_name = re.sub(r"[^\w.-]", "_", model_name)
+    return f"{safe_name}-{dim}.f32"
+
+
+def _rows(file, dim, needed):
+    """
+    Memory map of a matrix file covering at least `needed` rows.
+    """
+    path = os.path.join(EMBEDDING_CACHE_DIR, file)
+    mapped = _maps.get(path)
+    if mapped is None or len(mapped) < needed:
+        rows = os.path.getsize(path) // (dim * 4)
+        mapped = np.memmap(path, dtype="float32", mode="r", shape=(rows, dim))
+        _maps[path] = mapped
+    return mapped
+
+
+def _count(hits, misses):
+    with _stats_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += misses
+
+
+def stats():
+    """
+    Cache hits and misses (texts) counted in this process.
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats["hits"] = _stats["misses"] = 0
+
+
+def _select(conn, columns, keys):
+    """
+    Rows of the key index for the given keys.
+    """
+    # Stay well below SQLite's bound parameter limit
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        yield from conn.execute(f"SELECT {columns} FROM vectors WHERE key IN ({placeholders})", chunk)
+
+
+def _lookup(keys):
+    """
+    Cached vectors for the keys that are present, as {key: vector}.
+    """
+    with _connect() as conn:
+        found = list(_select(conn, "key, file, dim, row", keys))
+
+    vectors = {}
+    for key, file, dim, row in found:
+        rows = _rows(file, dim, row + 1)
+        if row < len(rows):
+            vectors[key] = rows[row]
+    return vectors
+
+
+def _store(model_name, keys, vectors):
+    """
+    Append new vectors and index their keys. Keys another process stored in
+    the meantime are skipped.
+    """
+    dim = vectors.shape[1]
+    file = _matrix_file(model_name, dim)
+    path = os.path.join(EMBEDDING_CACHE_DIR, file)
+    os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+    with file_lock(os.path.join(EMBEDDING_CACHE_DIR, "cache.lock")), _connect() as conn:
+        present = {key for (key,) in _select(conn, "key", keys)}
+        new = [i for i, key in enumerate(keys) if key not in present]
+        if not new:
+            return
+
+        first_row = os.path.getsize(path) // (dim * 4) if os.path.exists(path) else 0
+        with open(path, "ab") as f:
+            # Start at a row boundary even if an interrupted append left a partial row
+            f.truncate(first_row * dim * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(vectors[new], dtype="float32").tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        conn.executemany("INSERT INTO vectors (key, file, dim, row) VALUES (?, ?, ?, ?)",
+                         [(keys[i], file, dim, first_row + n) for n, i in enumerate(new)])
+
+
+def embed(model_name, normalize, texts, compute):
+    """
+    Embeddings of `texts` by `model_name`, L2-normalized or not as `normalize`
+    says, as a float32 matrix. Cached vectors are reused;
+    the rest are computed with compute(list of texts) -> matrix and cached.
+    `compute` is only called when something is missing, so a warm cache
+    never needs the model.
+    """
+    texts = list(texts)
+    if not EMBEDDING_CACHE_ENABLED or not _HAS_NUMPY or not texts:
+        return compute(texts)
+
+    keys = [cache_key(model_name, normalize, text) for text in texts]
+    try:
+        cached = _lookup(list(dict.fromkeys(keys)))
+    except Exception as e:
+        print(f"Warning: Failed to read embedding cache: {str(e)}")
+        cached = {}
+
+    misses = sum(1 for key in keys if key not in cached)
+    _count(len(keys) - misses, misses)
+    missing = list(dict.fromkeys(key for key in keys if key not in cached))
+    if missing:
+        text_by_key = dict(zip(keys, texts))
+        computed = np.asarray(compute([text_by_key[key] for key in missing]), dtype="float32")
+        try:
+            _store(model_name, missing, computed)
+        except Exception as e:
+            print(f"Warning: Failed to write embedding cache: {str(e)}")
+        cached.update(zip(missing, computed))
+
+    return np.stack([cached[key] for key in keys]).astype("float32", copy=False)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Advisory locking: fcntl on POSIX, msvcrt on Windows
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+
+@contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive cross-process advisory lock on `path` for the duration of the block.
+    The lock file is created if needed. Blocks until the lock is free.
+    """
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        elif msvcrt:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            elif msvcrt:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def atomic_write(path, mode="w", encoding=None):
+    """
+    Write to a temporary file next to `path` and rename it over `path` on success,
+    so readers see either the old or the new contents, never a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
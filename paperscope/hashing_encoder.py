@@ -0,0 +1,62 @@
+import hashlib
+import math
+import re
+from collections import Counter
+from itertools import pairwise
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Feature-hashing text encoder: words and word bigrams are hashed into a fixed
+# number of signed buckets, weighted by 1 + log(term frequency), and the vector
+# is L2-normalized. It needs no model download and no training, so it embeds
+# thousands of texts per second on one CPU core. It only matches shared words,
+# not meaning, so it is a fallback for hosts that cannot run a neural model.
+# hashed_vector gives the same vector as a list where numpy is not installed.
+_TOKEN = re.compile(r"\w+")
+
+
+def _features(text):
+    words = _TOKEN.findall((text or "").lower())
+    return Counter(words + [f"{a} {b}" for a, b in pairwise(words)])
+
+
+def _bucket(feature, dim):
+    # hashlib, not hash(): vectors must be the same in every process
+    value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+    return value % dim, 1.0 if value >> 63 else -1.0
+
+
+def hashed_vector(text, dim=512):
+    """
+    The embedding of one text, as a list of floats.
+    """
+    vector = [0.0] * dim
+    for feature, count in _features(text).items():
+        column, sign = _bucket(feature, dim)
+        vector[column] += sign * (1.0 + math.log(count))
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+class HashingEncoder:
+    """
+    Embeds texts like a sentence-transformers model: encode(texts) -> matrix.
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for feature, count in _features(text).items():
+                column, sign = _bucket(feature, self.dim)
+                vectors[row, column] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
@@ -3,12 +3,14 @@ from paperscope.url_handler import is_url, fetch_paper_from_url
 from paperscope.pdf_parser import extract_text_from_pdf
 import os
 
-from paperscope.storage import add_entry, load_db
+from paperscope.storage import (add_entry, add_entries, find_duplicate, find_paper, get_entries, load_db,
+                                search_entries)
 
 def fetch_and_summarize(keywords):
     """
     Search arXiv papers by keyword, summarize abstracts, and store results.
     Also supports paper URLs (arXiv or direct PDF links).
+    Returns the stored papers the search found, new or stored before, in search order.
     """
     try:
         # Validate input
@@ -35,26 +37,37 @@ def fetch_and_summarize(keywords):
         if not results:
             raise Exception(f"No papers found for keywords: '{keywords}'. Try different keywords or check spelling.")
         
-        processed_count = 0
+        entries = []
+        found = []
         for pid, title, abstract in results:
+            # Papers already stored (under any id) are not summarized and embedded again
+            stored = find_paper(pid)
+            if stored is None:
+                stored = find_duplicate({"id": pid, "abstract": abstract})
+            if stored is not None:
+                found.append(stored["id"])
+                continue
             try:
                 summary = summarize(abstract)
-                entry = {
+                entries.append({
                     "id": pid,
                     "title": title,
                     "abstract": abstract,
                     "summary": summary
-                }
-                add_entry(entry)
-                processed_count += 1
+                })
+                found.append(pid)
             except Exception as e:
                 print(f"Warning: Failed to process paper '{title}': {str(e)}")
                 continue
         
-        if processed_count == 0:
+        if not found:
             raise Exception("Failed to process any papers. Please try again.")
         
-        return load_db()
+        # Store the whole batch with a single write
+        if entries:
+            add_entries(entries)
+        
+        return get_entries(list(dict.fromkeys(found)))
     except Exception as e:
         raise Exception(f"Search failed: {str(e)}")
 
@@ -63,12 +76,18 @@ def fetch_and_summarize_from_url(url):
     """
     Fetch paper from URL, extract text, summarize, and store result.
     Handles arXiv URLs and direct PDF links.
+    Returns the stored paper, as a one-element list.
     """
     try:
         # Validate URL
         if not url or not url.strip():
             raise ValueError("Please provide a valid URL.")
         
+        # A paper stored before under this URL, or another form of its id, is not fetched again
+        stored = find_paper(url)
+        if stored is not None:
+            return [stored]
+
         if os.getenv("DEMO_MODE", "").lower() in ("1", "true", "yes"):
             from paperscope.summarizer_demo import summarize
         else:
@@ -92,23 +111,28 @@ def fetch_and_summarize_from_url(url):
             if not text or len(text.strip()) == 0:
                 raise ValueError("Failed to extract text from PDF. The PDF may be empty, corrupted, or password-protected.")
             
-            # Summarize the extracted text
-            summary = summarize(text)
-            
-            # Store the entry
-            entry = {
-                "id": paper_id,
-                "title": title,
-                "abstract": text[:500] + "...",  # Store first 500 chars as abstract
-                "summary": summary
-            }
-            add_entry(entry)
+            # A paper already stored (e.g. found by keyword search) keeps its entry
+            stored = find_duplicate({"id": paper_id, "text": text})
+            if stored is None:
+                # Summarize the extracted text
+                summary = summarize(text)
+
+                # Store the entry
+                entry = {
+                    "id": paper_id,
+                    "title": title,
+                    "abstract": text[:500] + "...",  # Store first 500 chars as abstract
+                    "summary": summary,
+                    "text": text  # Full text, for passage search
+                }
+                add_entry(entry)
+                stored = find_paper(paper_id)
             
             # Clean up the temporary PDF file
             if os.path.exists(pdf_path):
                 os.remove(pdf_path)
             
-            return load_db()
+            return [stored] if stored is not None else []
         except Exception as e:
             # Clean up the temporary PDF file
             if pdf_path and os.path.exists(pdf_path):
@@ -123,7 +147,8 @@ def fetch_and_summarize_from_url(url):
 
 def query_db(query):
     """
-    Perform simple keyword search on stored summaries.
+    Keyword search over stored papers (title, abstract and summary).
+    Results are ranked by BM25 relevance, best first.
     """
     try:
         if not query or not query.strip():
@@ -133,7 +158,6 @@ def query_db(query):
         if not db:
             raise Exception("No papers found in database. Please add some papers first.")
         
-        results = [item for item in db if query.lower() in item["summary"].lower()]
-        return results
+        return search_entries(query)
     except Exception as e:
         raise Exception(f"Search failed: {str(e)}")
@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+
+from paperscope.file_utils import atomic_write
+
+# Exact vector search in NumPy, used where FAISS is not installed. NumpyIndex
+# answers the part of the FAISS index API that vector_store uses (d, ntotal,
+# add_with_ids, remove_ids, search, reconstruct_batch), so generations are
+# written, loaded and updated the same way with either engine. Vectors are one
+# float32 matrix, saved as .npy next to an array of their ids and memory-mapped
+# when loaded with mmap. Distances are squared L2, as FAISS reports them.
+
+# Query rows scored per matrix product are capped so that a block of distances
+# stays around this many floats (64 MiB), however large the corpus
+_BLOCK_FLOATS = 2 ** 24
+
+
+def _ids_path(path):
+    return path + ".ids.npy"
+
+
+class NumpyIndex:
+    """
+    A flat, id-mapped L2 index over a float32 matrix.
+    """
+
+    is_trained = True
+
+    def __init__(self, d, vectors=None, ids=None):
+        self.d = d
+        self._vectors = np.empty((0, d), dtype="float32") if vectors is None else vectors
+        self._ids = np.empty(0, dtype="int64") if ids is None else ids
+        # Added batches are concatenated once, when the index is next read
+        self._pending = []
+        self._norms = None
+        self._positions = None
+
+    @property
+    def ntotal(self):
+        return len(self._ids) + sum(len(ids) for _, ids in self._pending)
+
+    def _matrix(self):
+        if self._pending:
+            self._vectors = np.concatenate([self._vectors] + [vectors for vectors, _ in self._pending])
+            self._ids = np.concatenate([self._ids] + [ids for _, ids in self._pending])
+            self._pending = []
+            self._norms = self._positions = None
+        return self._vectors, self._ids
+
+    def add_with_ids(self, vectors, ids):
+        vectors = np.ascontiguousarray(vectors, dtype="float32").reshape(-1, self.d)
+        self._pending.append((vectors, np.asarray(ids, dtype="int64")))
+
+    def remove_ids(self, ids):
+        vectors, stored = self._matrix()
+        keep = ~np.isin(stored, np.asarray(ids, dtype="int64"))
+        removed = int(len(stored) - keep.sum())
+        if removed:
+            self._vectors, self._ids = vectors[keep], stored[keep]
+            self._norms = self._positions = None
+        return removed
+
+    def reconstruct_batch(self, ids):
+        """
+        The vectors stored under `ids`, in that order.
+        """
+        vectors, stored = self._matrix()
+        if self._positions is None:
+            self._positions = np.argsort(stored, kind="stable")
+        ids = np.asarray(ids, dtype="int64")
+        found = np.searchsorted(stored, ids, sorter=self._positions)
+        rows = self._positions[np.minimum(found, len(stored) - 1)]
+        if len(ids) and (not len(stored) or (stored[rows] != ids).any()):
+            raise KeyError("id not in index")
+        return np.asarray(vectors[rows], dtype="float32")
+
+    def reconstruct(self, key):
+        return self.reconstruct_batch([key])[0]
+
+    def search(self, x, k, ids=None):
+        """
+        (distances, ids) of the k nearest vectors to each row of x, closest
+        first, padded with -1 ids. With `ids`, only those vectors are searched.
+        """
+        vectors, stored = self._matrix()
+        if self._norms is None:
+            self._norms = np.einsum("ij,ij->i", vectors, vectors)
+        norms = self._norms
+        if ids is not None:
+            rows = np.flatnonzero(np.isin(stored, ids))
+            vectors, stored, norms = vectors[rows], stored[rows], norms[rows]
+
+        x = np.ascontiguousarray(x, dtype="float32").reshape(-1, self.d)
+        D = np.full((len(x), k), np.inf, dtype="float32")
+        I = np.full((len(x), k), -1, dtype="int64")
+        found = min(k, len(stored))
+        if not found:
+            return D, I
+        step = max(1, _BLOCK_FLOATS // len(stored))
+        for start in range(0, len(x), step):
+            queries = x[start:start + step]
+            # |q - v|^2 = |q|^2 - 2 q.v + |v|^2, one matrix product per block
+            distances = norms[None, :] - 2.0 * (queries @ vectors.T)
+            distances += np.einsum("ij,ij->i", queries, queries)[:, None]
+            if found < len(stored):
+                top = np.argpartition(distances, found - 1, axis=1)[:, :found]
+            else:
+                top = np.broadcast_to(np.arange(len(stored)), (len(queries), found))
+            top_distances = np.take_along_axis(distances, top, axis=1)
+            order = np.argsort(top_distances, axis=1, kind="stable")
+            rows = slice(start, start + len(queries))
+            D[rows, :found] = np.maximum(np.take_along_axis(top_distances, order, axis=1), 0.0)
+            I[rows, :found] = stored[np.take_along_axis(top, order, axis=1)]
+        return D, I
+
+
+def write_index(index, path):
+    """
+    Save an index as two .npy files: the vector matrix at `path` and its ids.
+    """
+    vectors, ids = index._matrix()
+    with atomic_write(_ids_path(path), "wb") as f:
+        np.save(f, ids)
+    with atomic_write(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+
+
+def read_index(path, mmap=False):
+    """
+    Load an index saved by write_index, memory-mapping the matrix with mmap.
+    """
+    if not os.path.exists(_ids_path(path)):
+        raise ValueError(f"'{path}' has no id file")
+    vectors = np.load(path, mmap_mode="r" if mmap else None)
+    ids = np.load(_ids_path(path))
+    if vectors.ndim != 2 or len(vectors) != len(ids):
+        raise ValueError(f"'{path}' has {len(vectors)} vectors for {len(ids)} ids")
+    return NumpyIndex(vectors.shape[1], vectors, ids)
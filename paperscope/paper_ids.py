@@ -0,0 +1,53 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# One paper reaches PaperScope under many identifiers: arXiv entry ids
+# (http://arxiv.org/abs/2401.01234v2), bare arXiv ids, abs/pdf/html URLs,
+# DOIs (arXiv's own included) and plain PDF URLs. canonical_id maps each to
+# one key, so storage can tell a paper is already stored before anything is
+# downloaded or summarized.
+_ARXIV = r"(\d{4}\.\d{4,5}|[a-z][a-z\-]*(?:\.[a-z]{2})?/\d{7})(?:v\d+)?"
+_ARXIV_ID = re.compile(rf"^(?:arxiv:)?{_ARXIV}$", re.IGNORECASE)
+_ARXIV_PATH = re.compile(rf"^/(?:abs|pdf|html)/{_ARXIV}(?:\.pdf)?$", re.IGNORECASE)
+_ARXIV_DOI = re.compile(rf"^10\.48550/arxiv\.{_ARXIV}$", re.IGNORECASE)
+_DOI = re.compile(r"^(?:doi:\s*|https?://(?:dx\.)?doi\.org/)?(10\.\d{4,9}/\S+)$", re.IGNORECASE)
+
+# Query parameters that do not change which document a URL points to
+_TRACKING = re.compile(r"^(?:utm_\w+|fbclid|gclid|ref|source)$", re.IGNORECASE)
+
+
+def _arxiv(match):
+    return f"arxiv:{match.group(1).lower()}"
+
+
+def canonical_id(identifier):
+    """
+    The canonical form of a paper identifier: "arxiv:<id>" without version for
+    arXiv ids and URLs, "doi:<doi>" (lowercased) for DOIs, "url:<host/path?query>"
+    for other web URLs (scheme, "www.", default ports, fragments, trailing
+    slashes and tracking parameters dropped), and the identifier itself otherwise.
+    """
+    value = str(identifier or "").strip()
+    match = _ARXIV_ID.match(value)
+    if match:
+        return _arxiv(match)
+
+    match = _DOI.match(value)
+    if match:
+        doi = match.group(1)
+        arxiv = _ARXIV_DOI.match(doi)
+        return _arxiv(arxiv) if arxiv else f"doi:{doi.lower()}"
+
+    parts = urlsplit(value)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        return value
+    host = parts.hostname.lower().removeprefix("www.")
+    if host == "arxiv.org" or host.endswith(".arxiv.org"):
+        match = _ARXIV_PATH.match(parts.path.rstrip("/"))
+        if match:
+            return _arxiv(match)
+    if parts.port not in (None, 80, 443):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted((key, item) for key, item in parse_qsl(parts.query, keep_blank_values=True)
+                             if not _TRACKING.match(key)))
+    return f"url:{host}{parts.path.rstrip('/')}" + (f"?{query}" if query else "")
@@ -0,0 +1,239 @@
+import json
+import os
+
+from paperscope import vector_store
+from paperscope.chunking import chunk_text
+from paperscope.storage import (
+    ReadOnlyRecord,
+    db_version,
+    get_entries,
+    load_db,
+    search_entries,
+)
+
+# Second vector index, over passages of the papers' full text (see chunking.py),
+# so semantic search also finds papers by details that never reach the summary.
+# It is stored like the paper index, as generations (and their segments) under
+# faiss.index.passages.*.
+# A passage's vector id derives from its paper id and position, so the passages
+# of a paper are found by probing positions 0, 1, ... in the record file. The
+# manifest lists the ids of the papers indexed ("papers").
+
+# Passage hits fetched per paper asked for, before they are collapsed to papers
+PASSAGE_FANOUT = int(os.getenv("PAPERSCOPE_PASSAGE_FANOUT", "10"))
+
+# How a paper is scored from its passage hits: "max" (its best passage) or
+# "sum" (the similarities of its best PASSAGE_SUM_TOP passages added up, which
+# favours papers that match in several places)
+PASSAGE_SCORING = os.getenv("PAPERSCOPE_PASSAGE_SCORING", "max").lower()
+PASSAGE_SUM_TOP = 3
+
+
+def _base():
+    return vector_store.VECTOR_INDEX_PATH + ".passages"
+
+
+_searcher = vector_store._Searcher(_base)
+
+
+def _passage_id(paper_id, n):
+    return vector_store._vector_id(f"{paper_id}\0{n}")
+
+
+def _paper_text(item):
+    # Papers fetched from a URL or uploaded keep their full text; others only have an abstract
+    return item.get("text") or item.get("abstract") or ""
+
+
+def _passages(papers):
+    """
+    (vector id, record, text) of every passage of `papers`, chunked one paper at a time.
+    """
+    for item in papers:
+        paper_id = item.get("id")
+        for n, passage in enumerate(chunk_text(_paper_text(item))):
+            record = {"paper": paper_id, "n": n, "section": passage["section"], "text": passage["text"]}
+            yield _passage_id(paper_id, n), json.dumps(record, ensure_ascii=False).encode("utf-8"), passage["text"]
+
+
+def _batches(papers, batch_size):
+    """
+    Passages embedded in batches of `batch_size`, as (ids, vectors, records).
+    Only one batch of passages is held at a time, however long the papers are.
+    """
+    batch = []
+    for passage in _passages(papers):
+        batch.append(passage)
+        if len(batch) == batch_size:
+            yield _embedded(batch)
+            batch = []
+    if batch:
+        yield _embedded(batch)
+
+
+def _embedded(batch):
+    ids, records, texts = zip(*batch)
+    return list(ids), vector_store.embed_texts(texts, len(texts)), list(records)
+
+
+def _paper_passage_ids(records, paper_id):
+    ids = []
+    while _passage_id(paper_id, len(ids)) in records:
+        ids.append(_passage_id(paper_id, len(ids)))
+    return ids
+
+
+def _indexed_papers(manifest, records):
+    """
+    Ids of the papers in the index. An index written before its manifest
+    listed them has them read from its records.
+    """
+    if not manifest:
+        return []
+    if "papers" in manifest:
+        return manifest["papers"]
+    return sorted({json.loads(data)["paper"] for _, data in records.items()})
+
+
+def _update(add=(), remove=(), before=None, after=None, version=None, rebuild=False, batch_size=None):
+    """
+    Drop the passages of `remove` (paper ids) and add those of `add` papers,
+    chunked and embedded batch by batch. A paper that is added again replaces
+    its passages. Each batch is written as a segment of the current generation
+    as soon as it is embedded (see vector_store._write_changes); with rebuild,
+    a new generation is built from the passages of `add` alone.
+    """
+    base = _base()
+    batch_size = batch_size or vector_store.EMBED_BATCH_SIZE
+    with vector_store._updating(base):
+        manifest, records = vector_store._current(base)
+        if rebuild:
+            index, params, records, state = None, None, {}, {}
+            for ids, vectors, batch_records in _batches(add, batch_size):
+                index, params = vector_store._modify(state, index, records, add_ids=ids, vectors=vectors,
+                                                     add_records=batch_records, field="text")
+                state = {"index_params": params}
+            vector_store._write_generation(index, records, version, manifest["generation"] if manifest else 0,
+                                           params, base, papers=sorted({item.get("id") for item in add}))
+            return
+
+        added_papers = [item.get("id") for item in add]
+        stale = [key for paper_id in [*remove, *added_papers] for key in _paper_passage_ids(records or {}, paper_id)]
+        changed = {*remove, *added_papers}
+        papers = [paper_id for paper_id in _indexed_papers(manifest, records) if paper_id not in changed]
+        # The synced version and the papers added are only recorded with the
+        # last batch: an update cut short leaves them missing, and the next
+        # sync adds them again
+        synced = manifest.get("db_version") if manifest else None
+        batches = _batches(add, batch_size)
+        ids, vectors, added = next(batches, ([], None, []))
+        for following in batches:
+            vector_store._write_changes(stale, ids, vectors, added, version=synced, base=base, field="text",
+                                        papers=papers)
+            stale, (ids, vectors, added) = [], following
+        vector_store._write_changes(stale, ids, vectors, added, before, after, version, base, field="text",
+                                    papers=sorted({*papers, *added_papers}))
+
+
+def add_papers(papers, before=None, after=None):
+    """
+    Chunk, embed and index the full text of papers added by the storage write
+    that took the database from version `before` to `after`.
+    """
+    papers = list(papers)
+    if not vector_store._HAS_VECTOR_ENGINE or not papers:
+        return
+    _update(add=papers, before=before, after=after)
+
+
+def remove_papers(paper_ids, before=None, after=None):
+    """
+    Drop the passages of deleted papers.
+    """
+    if not vector_store._HAS_VECTOR_ENGINE:
+        return
+    with vector_store._updating(_base()):
+        if vector_store._read_manifest(_base()) is None:
+            return
+    _update(remove=list(paper_ids), before=before, after=after)
+
+
+def build_index(batch_size=None):
+    """
+    Rebuild the passage index from the full text of every stored paper.
+    """
+    if not vector_store._HAS_VECTOR_ENGINE:
+        return
+    version = db_version()
+    _update(add=load_db(), version=version, rebuild=True, batch_size=batch_size)
+
+
+def sync():
+    """
+    Index the passages of papers the index is missing and drop those of deleted
+    papers. Returns (added, removed) paper counts.
+    """
+    if not vector_store._HAS_VECTOR_ENGINE:
+        return 0, 0
+
+    version = db_version()
+    db = load_db()
+    with vector_store._updating(_base()):
+        manifest, records = vector_store._current(_base())
+        present = set(_indexed_papers(manifest, records))
+
+    wanted = {item.get("id") for item in db}
+    missing = [item for item in db if item.get("id") not in present]
+    stale = [paper_id for paper_id in present if paper_id not in wanted]
+    _update(add=missing, remove=stale, version=version)
+    return len(missing), len(stale)
+
+
+def _score(similarities):
+    if PASSAGE_SCORING == "sum":
+        return sum(sorted(similarities, reverse=True)[:PASSAGE_SUM_TOP])
+    return max(similarities)
+
+
+def search_passages(text, k=5):
+    """
+    Semantic search over full-text passages, collapsed to papers. Each result
+    is the paper with its best-matching passage under "passage" and the
+    passage's section heading under "passage_section".
+    """
+    if not vector_store._HAS_VECTOR_ENGINE:
+        # In demo mode, fall back to keyword search
+        return list(search_entries(text, limit=k))
+
+    manifest, index, records = _searcher.current()
+    if (manifest or {}).get("db_version") != db_version():
+        sync()
+        manifest, index, records = _searcher.current()
+    if not records:
+        return []
+
+    query_vec = vector_store.embed_text(text).reshape(1, -1)
+    if vector_store._embedding_changed(manifest, index, query_vec.shape[1]):
+        vector_store.reembed(base=_base(), field="text")
+        manifest, index, records = _searcher.current()
+    if index is None or not index.ntotal:
+        return []
+
+    D, I = index.search(query_vec, min(k * PASSAGE_FANOUT + manifest.get("orphans", 0), index.ntotal))
+    hits, seen = {}, set()
+    for distance, i in zip(D[0], I[0]):
+        if i == -1 or int(i) in seen:
+            continue
+        seen.add(int(i))
+        data = records.get(int(i))
+        if data is not None:
+            passage = json.loads(data)
+            # Similarity in (0, 1], higher is closer
+            hits.setdefault(passage["paper"], []).append((1.0 / (1.0 + float(distance)), passage))
+
+    ranked = sorted(hits, key=lambda paper_id: _score([s for s, _ in hits[paper_id]]), reverse=True)[:k]
+    results = []
+    for paper in get_entries(ranked):
+        best = max(hits[paper["id"]], key=lambda hit: hit[0])[1]
+        results.append(ReadOnlyRecord({**paper.stored(), "passage": best["text"], "passage_section": best["section"]}))
+    return results
@@ -0,0 +1,142 @@
+import mmap
+import struct
+
+from paperscope.file_utils import atomic_write
+
+# Immutable file of records keyed by 64-bit ids:
+#   header: magic, generation, record count
+#   table:  one fixed-width (id, offset, length) entry per record, sorted by id
+#   data:   the record bytes
+# A lookup is a binary search over the table plus one read, so fetching k
+# records touches k records whatever the file size.
+MAGIC = b"PSRF\x01"
+_HEADER = struct.Struct(">5sQQ")
+_ENTRY = struct.Struct(">qQI")
+
+
+def write(path, generation, records):
+    """
+    Atomically write (id, bytes) pairs to `path`.
+    """
+    items = sorted(records, key=lambda item: item[0])
+    with atomic_write(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, generation, len(items)))
+        offset = _HEADER.size + len(items) * _ENTRY.size
+        for record_id, data in items:
+            f.write(_ENTRY.pack(record_id, offset, len(data)))
+            offset += len(data)
+        for _, data in items:
+            f.write(data)
+
+
+class RecordFile:
+    """
+    Read-only view of a file written by write(), memory-mapped so only the
+    table entries and records that are looked up are read from disk.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            raise ValueError(f"'{path}' is not a record file")
+        magic, self.generation, self.count = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or len(self._map) < _HEADER.size + self.count * _ENTRY.size:
+            raise ValueError(f"'{path}' is not a record file")
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, position):
+        return _ENTRY.unpack_from(self._map, _HEADER.size + position * _ENTRY.size)
+
+    def get(self, record_id):
+        """
+        The bytes stored under `record_id`, or None.
+        """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry_id, offset, length = self._entry(mid)
+            if entry_id == record_id:
+                return self._map[offset:offset + length]
+            if entry_id < record_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def __contains__(self, record_id):
+        return self.get(record_id) is not None
+
+    def ids(self):
+        return [self._entry(i)[0] for i in range(self.count)]
+
+    def items(self):
+        """
+        All (id, bytes) pairs in id order.
+        """
+        for i in range(self.count):
+            entry_id, offset, length = self._entry(i)
+            yield entry_id, self._map[offset:offset + length]
+
+    def close(self):
+        self._map.close()
+
+
+class LayeredRecords:
+    """
+    Read-only view of a record file with later files layered over it. Each
+    layer lists the ids it removed from the layers below it (a layer that
+    re-adds an id lists it too), so an id is served by the one layer that
+    holds it and no later layer removed it. Only the small later layers are
+    written by an update; the first file is left as it is.
+    """
+
+    def __init__(self, paths, removed):
+        """
+        `paths` are the record files, oldest first; `removed[i]` are the ids
+        removed by the file paths[i + 1].
+        """
+        self._layers = [RecordFile(path) for path in paths]
+        self.generation = self._layers[0].generation
+        # id -> the newest layer that removed it; it is hidden below that layer
+        self._dead = {}
+        for layer, ids in enumerate(removed, start=1):
+            for record_id in ids:
+                self._dead[record_id] = layer
+        self.count = sum(len(layer) for layer in self._layers) - sum(
+            record_id in self._layers[layer] for record_id, dead in self._dead.items() for layer in range(dead))
+
+    def __len__(self):
+        return self.count
+
+    def get(self, record_id):
+        """
+        The bytes stored under `record_id`, or None.
+        """
+        dead = self._dead.get(record_id, -1)
+        for layer in range(len(self._layers) - 1, dead - 1, -1):
+            data = self._layers[layer].get(record_id)
+            if data is not None:
+                return data
+        return None
+
+    def __contains__(self, record_id):
+        return self.get(record_id) is not None
+
+    def ids(self):
+        return [record_id for record_id, _ in self.items()]
+
+    def items(self):
+        """
+        All live (id, bytes) pairs, layer by layer.
+        """
+        for layer, records in enumerate(self._layers):
+            for record_id, data in records.items():
+                if self._dead.get(record_id, -1) <= layer:
+                    yield record_id, data
+
+    def close(self):
+        for layer in self._layers:
+            layer.close()
@@ -1,59 +1,942 @@
 import json
 import os
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from paperscope import blob_store, db_format
 from paperscope.config import DB_PATH
+from paperscope.file_utils import atomic_write, file_lock
+from paperscope.paper_ids import canonical_id
+
+# Changes are appended to this log as one JSON record per line and folded
+# back into the DB_PATH snapshot by compact().
+LOG_PATH = DB_PATH + ".log"
+
+# Writers in every process serialize on this lock file. Readers never take it:
+# snapshots are replaced atomically and torn log tails are ignored.
+LOCK_PATH = DB_PATH + ".lock"
+
+# Compact automatically once the log grows past this many bytes.
+LOG_COMPACT_BYTES = int(os.getenv("PAPERSCOPE_LOG_COMPACT_BYTES", str(4 * 1024 * 1024)))
+
+# "json" (snapshot + append-only log) or "sqlite" (see paperscope.storage_sqlite)
+STORAGE_BACKEND = os.getenv("PAPERSCOPE_STORAGE_BACKEND", "json").lower()
+
+# How often a reader retries when a compaction swaps the snapshot and log mid-read
+_READ_RETRIES = 20
+
+_migration_checked = False
+
+# Process-wide cache of the parsed database: the current _State, keyed by a
+# stamp built from the on-disk state (file mtime/size, or the SQLite generation)
+# plus _version, which every write made through this module bumps. A state is
+# never changed once published; writers publish a new one, so readers use it
+# without locking. _lock only guards swapping it in, and _load_lock makes
+# readers that find the cache stale wait for one re-read instead of each doing it.
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_version = 0
+
+# Writers queue on _write_lock (threads) and the lock file (processes)
+_write_lock = threading.Lock()
+_writer = None
+_write_depth = 0
+
+# History orderings (and filtered views of them) computed for one stamp
+_orders = {"stamp": None}
+
+# Sort keys accepted by get_history
+HISTORY_SORTS = ("newest", "oldest", "title")
+
+# Large text fields are moved to the content-addressed blob store and only the
+# digest is kept in the record, so listings never parse full texts.
+BODY_FIELDS = ("abstract", "summary", "text")
+BLOB_MIN_CHARS = int(os.getenv("PAPERSCOPE_BLOB_MIN_CHARS", "256"))
+
+
+def _parse_quotas(value):
+    """
+    Parse "arxiv=500,upload=50" into {"arxiv": 500, "upload": 50}.
+    """
+    quotas = {}
+    for part in value.split(","):
+        if "=" in part:
+            source, limit = part.split("=", 1)
+            quotas[source.strip().lower()] = int(limit)
+    return quotas
+
+
+# Retention rules, applied by apply_retention() and on every compact().
+# Unset (0 / empty) means no limit. Papers without a source count as "arxiv".
+RETENTION_MAX_PAPERS = int(os.getenv("PAPERSCOPE_RETENTION_MAX_PAPERS", "0"))
+RETENTION_MAX_AGE_DAYS = float(os.getenv("PAPERSCOPE_RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_SOURCE_QUOTAS = _parse_quotas(os.getenv("PAPERSCOPE_RETENTION_SOURCE_QUOTAS", ""))
+
+
+class StorageError(Exception):
+    """
+    The database on disk could not be read consistently.
+    """
+
+
+class ConcurrentModificationError(StorageError):
+    """
+    The database changed since the version the caller based its write on.
+    """
+
+
+class ReadOnlyRecord(dict):
+    """
+    A stored paper as handed out by load_db/get_history.
+    Body fields kept in the blob store are loaded on first access, so the record
+    itself only holds metadata. Records are shared between callers, so mutation
+    is refused; use dict(record) for a (fully loaded) copy.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("stored paper records are read-only; copy with dict(record) first")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def _refs(self):
+        return dict.get(self, "blobs") or {}
+
+    def __getitem__(self, key):
+        digest = self._refs().get(key)
+        if digest:
+            return blob_store.get(digest)
+        if key == "blobs":
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._refs() or (key != "blobs" and dict.__contains__(self, key))
+
+    def keys(self):
+        return [key for key in dict.keys(self) if key != "blobs"] + list(self._refs())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def copy(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        return dict(self.items()) == (dict(other.items()) if isinstance(other, dict) else other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def stored(self):
+        """
+        The record as stored, with blob digests instead of body texts.
+        """
+        return dict(dict.items(self))
+
+    def __reduce__(self):
+        return (ReadOnlyRecord, (self.stored(),))
+
+
+def _split(entry):
+    """
+    The stored form of a paper: large body fields are written to the blob store
+    and replaced by their digests.
+    """
+    if isinstance(entry, ReadOnlyRecord):
+        entry = entry.stored()
+    stored = {}
+    refs = dict(entry.get("blobs") or {})
+    for key, value in entry.items():
+        if key in BODY_FIELDS and isinstance(value, str) and len(value) >= BLOB_MIN_CHARS:
+            refs[key] = blob_store.put(value)
+        elif key != "blobs":
+            stored[key] = value
+    if refs:
+        stored["blobs"] = refs
+    return stored
+
+
+def _sqlite():
+    """
+    Return the SQLite backend module when it is selected, else None.
+    The existing JSON database is migrated into it on first use.
+    """
+    global _migration_checked
+    if STORAGE_BACKEND != "sqlite":
+        return None
+
+    from paperscope import storage_sqlite
+
+    if not _migration_checked:
+        _migration_checked = True
+        migrate_json_to_sqlite()
+    return storage_sqlite
+
+
+def migrate_json_to_sqlite():
+    """
+    One-shot import of the JSON database at DB_PATH into the SQLite backend.
+    Returns the number of papers imported (0 if the migration already ran).
+    """
+    from paperscope import storage_sqlite
+
+    _, _, papers = _load_json_db()
+    return storage_sqlite.import_entries([_split(item) for item in papers.values()], source=DB_PATH)
+
+
+def _read_snapshot():
+    """
+    Read the compacted snapshot in whichever format it was written.
+    Returns (generation, version, papers).
+    """
+    try:
+        with open(DB_PATH, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return 0, 0, []
+
+    if not raw.strip():
+        return 0, 0, []
+    try:
+        return db_format.decode(raw)
+    except (ValueError, TypeError) as e:
+        # Never treat a damaged file as empty: the next write would wipe the database
+        raise StorageError(f"Database file '{DB_PATH}' is corrupt or unreadable: {e}") from e
+
+
+def _read_log():
+    """
+    Read the append-only log. Returns (base generation, records), with a base of
+    None if there is no log. A torn trailing line (interrupted write) is ignored.
+    """
+    base, records = 0, []
+    try:
+        with open(LOG_PATH, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("op") == "base":
+                    base = record.get("generation", 0)
+                else:
+                    records.append(record)
+    except FileNotFoundError:
+        return None, []
+    return base, records
+
+
+def _log_head():
+    """
+    (base generation, whether the last line is complete) of the log, or None
+    if there is no log or it is empty.
+    """
+    try:
+        with open(LOG_PATH, "rb") as f:
+            first = f.readline()
+            if not first:
+                return None
+            f.seek(-1, os.SEEK_END)
+            complete = f.read(1) == b"\n"
+    except FileNotFoundError:
+        return None
+    try:
+        record = json.loads(first)
+    except ValueError:
+        record = {}
+    return (record.get("generation", 0) if record.get("op") == "base" else 0), complete
+
+
+def _append_log(records, generation):
+    """
+    Append records to the log. Each insert or delete costs one small write.
+    A new log starts with a base record naming the snapshot generation it extends;
+    so does one replacing a stale log (based on an older snapshot, see _load_json_db).
+    """
+    head = _log_head()
+    if head is None or head[0] < generation:
+        with atomic_write(LOG_PATH, "w", encoding="utf-8") as f:
+            for record in [{"op": "base", "generation": generation}] + list(records):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return
+
+    with open(LOG_PATH, "ab") as f:
+        # Terminate a torn tail left by an interrupted writer
+        if not head[1]:
+            f.write(b"\n")
+        for record in records:
+            f.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _apply(papers, record):
+    """
+    Apply one log record to an id -> paper mapping.
+    """
+    if record.get("op") == "put":
+        entry = record.get("entry", {})
+        papers.setdefault(entry.get("id"), ReadOnlyRecord(entry))
+    elif record.get("op") == "del":
+        papers.pop(record.get("id"), None)
+
+
+def _load_json_db():
+    """
+    Replay the append-only log on top of the JSON snapshot.
+    Returns (generation, version, id -> paper mapping in insertion order).
+    """
+    for _ in range(_READ_RETRIES):
+        generation, version, snapshot = _read_snapshot()
+        base, records = _read_log()
+        if base is None or base == generation:
+            break
+        # A log based on an older snapshot was left by a crash between the two
+        # replaces in _write_snapshot; the snapshot already holds its records
+        if base < generation:
+            records = []
+            break
+        # A compaction swapped the files between the two reads; read again
+        time.sleep(0.01)
+    else:
+        raise StorageError("The database kept changing while it was being read. Please try again.")
+
+    papers = {}
+    for item in snapshot:
+        papers.setdefault(item.get("id"), ReadOnlyRecord(item))
+    for record in records:
+        _apply(papers, record)
+
+    return generation, version + len(records), papers
+
+
+def _snapshot_format():
+    """
+    (format, compression) of the current snapshot file, from its header.
+    """
+    try:
+        with open(DB_PATH, "rb") as f:
+            return db_format.detect(f.read(4096))
+    except FileNotFoundError:
+        return None
+
+
+def _write_snapshot(papers, generation, version, fmt=None, compression=None):
+    """
+    Atomically replace the snapshot, then start a fresh log based on it.
+    Unless a format is given, the configured one (or else the current file's) is used.
+    """
+    fmt, compression = db_format.resolve(fmt, compression, current=_snapshot_format())
+    raw = db_format.encode(generation, version, list(papers), fmt, compression)
+    with atomic_write(DB_PATH, "wb") as f:
+        f.write(raw)
+    with atomic_write(LOG_PATH, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "base", "generation": generation}) + "\n")
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _stamp():
+    backend = _sqlite()
+    if backend:
+        return ("sqlite", backend.generation(), _version)
+    return (_file_stamp(DB_PATH), _file_stamp(LOG_PATH), _version)
+
+
+class _State:
+    """
+    The parsed database as of one stamp: the id -> paper mapping, with the
+    snapshot generation and version it was read at. Views derived from it
+    (the load_db tuple, the identity index) are filled in on first use.
+    """
+
+    def __init__(self, stamp, papers, generation=0, version=0, identities=None):
+        self.stamp = stamp
+        self.papers = papers
+        self.generation = generation
+        self.version = version
+        self.view = None
+        # Canonical id -> stored paper id (see paper_ids.py)
+        self.identities = identities
+
+
+_state = None
+
+
+def _publish(state):
+    global _state
+    with _lock:
+        _state = state
+
+
+def _current():
+    """
+    The cached _State, re-read only when the stamp has changed.
+    """
+    stamp = _stamp()
+    state = _state
+    if state is not None and state.stamp == stamp:
+        return state
+    with _load_lock:
+        state = _state
+        if state is None or state.stamp != stamp:
+            backend = _sqlite()
+            if backend:
+                papers = {}
+                for item in backend.load_db():
+                    papers.setdefault(item.get("id"), ReadOnlyRecord(item))
+                state = _State(stamp, papers, version=stamp[1])
+            else:
+                generation, version, papers = _load_json_db()
+                state = _State(stamp, papers, generation, version)
+            _publish(state)
+        return state
+
+
+def _papers():
+    """
+    The cached id -> paper mapping. It is shared: never modify it.
+    """
+    return _current().papers
+
+
+def _written():
+    """
+    Invalidate the cache after a write this module could not apply to it.
+    """
+    global _version
+    with _lock:
+        _version += 1
+
+
+@contextmanager
+def _writing():
+    """
+    Serialize writers: threads through _write_lock, processes through the lock
+    file. Re-entrant within a thread. Inside the block the cache reflects the
+    disk. Readers do not wait for writers: they keep using the published state.
+    """
+    global _writer, _write_depth
+    if _writer == threading.get_ident():
+        _write_depth += 1
+        try:
+            yield
+        finally:
+            _write_depth -= 1
+        return
+
+    with _write_lock, file_lock(LOCK_PATH):
+        _writer, _write_depth = threading.get_ident(), 1
+        try:
+            yield
+        finally:
+            _writer, _write_depth = None, 0
+
+
+def _write_log(records, compact_after=True):
+    """
+    Append records to the JSON log and publish the cached state with them
+    applied. Must be called inside _writing(). Returns (version before, version after).
+    """
+    global _version
+    state = _current()
+    before = state.version
+    papers = dict(state.papers)
+    # The identity index follows the papers instead of being rebuilt
+    identities = dict(state.identities) if state.identities is not None else None
+    _append_log(records, state.generation)
+    for record in records:
+        _apply(papers, record)
+        if identities is not None:
+            _apply_identity(identities, record)
+    _version += 1
+    _publish(_State(_stamp(), papers, state.generation, before + len(records), identities))
+
+    if compact_after and os.path.getsize(LOG_PATH) >= LOG_COMPACT_BYTES:
+        compact()
+    return before, before + len(records)
+
+
+def _sqlite_versions(backend):
+    """
+    (version before, version after) of the SQLite write that just committed.
+    """
+    after = backend.generation()
+    return after - 1, after
+
+
+# Derived indexes are updated after each write with the papers as stored
+# (ReadOnlyRecord, bodies loaded on access). A failure there never fails the
+# write: the index notices the version gap and is rebuilt on next use.
+def _notify_added(entries, before, after):
+    try:
+        from paperscope import text_index
+        text_index.add_papers(entries, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update search index: {str(e)}")
+    try:
+        from paperscope import dedup
+        dedup.add_papers(entries, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update duplicate index: {str(e)}")
+    try:
+        from paperscope import vector_store
+        vector_store.add_papers(entries, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update vector index: {str(e)}")
+    try:
+        from paperscope import passage_index
+        passage_index.add_papers(entries, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update passage index: {str(e)}")
+
+
+def _notify_removed(paper_ids, before, after):
+    try:
+        from paperscope import text_index
+        text_index.remove_papers(paper_ids, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update search index: {str(e)}")
+    try:
+        from paperscope import dedup
+        dedup.remove_papers(paper_ids, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update duplicate index: {str(e)}")
+    try:
+        from paperscope import vector_store
+        vector_store.remove_papers(paper_ids, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update vector index: {str(e)}")
+    try:
+        from paperscope import passage_index
+        passage_index.remove_papers(paper_ids, before, after)
+    except Exception as e:
+        print(f"Warning: Failed to update passage index: {str(e)}")
+
+
+def _notify_reset(papers, version):
+    try:
+        from paperscope import text_index
+        text_index.rebuild(papers, version)
+    except Exception as e:
+        print(f"Warning: Failed to rebuild search index: {str(e)}")
+    try:
+        from paperscope import dedup
+        dedup.rebuild(papers, version)
+    except Exception as e:
+        print(f"Warning: Failed to rebuild duplicate index: {str(e)}")
+
+
+def db_version():
+    """
+    Version of the database contents, for optimistic concurrency with save_db.
+    """
+    backend = _sqlite()
+    if backend:
+        return backend.generation()
+    return _current().version
 
 
 def load_db():
     """
-    Load the local database of papers (stored as JSON).
+    Load the local database of papers.
+    Returns a shared read-only snapshot; repeated calls reuse the parsed data
+    until the database changes on disk.
     """
-    if os.path.exists(DB_PATH):
-        with open(DB_PATH, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
-    return []
+    state = _current()
+    if state.view is None:
+        state.view = tuple(state.papers.values())
+    return state.view
 
 
-def save_db(data):
+def save_db(data, expected_version=None):
     """
-    Save the database to disk.
+    Save the database to disk as a new snapshot.
+
+    If expected_version is given (from db_version()), the write is refused with
+    ConcurrentModificationError when another writer changed the database since.
     """
-    with open(DB_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    stored = [_split(item) for item in data]
+
+    backend = _sqlite()
+    if backend:
+        backend.save_db(stored, expected_generation=expected_version)
+        _written()
+        _notify_reset([ReadOnlyRecord(item) for item in stored], backend.generation())
+        return
+
+    global _version
+    with _writing():
+        state = _current()
+        version = state.version
+        if expected_version is not None and expected_version != version:
+            raise ConcurrentModificationError(
+                f"Database changed (version {version}, expected {expected_version}); reload and retry."
+            )
+
+        generation = state.generation + 1
+        _write_snapshot(stored, generation, version + 1)
+
+        papers = {}
+        for item in stored:
+            papers.setdefault(item.get("id"), ReadOnlyRecord(item))
+        _version += 1
+        _publish(_State(_stamp(), papers, generation, version + 1))
+    _notify_reset([ReadOnlyRecord(item) for item in stored], version + 1)
+
+
+def compact():
+    """
+    Apply the retention rules, fold the append-only log into the snapshot, move
+    body fields still stored inline into the blob store, and delete blobs no
+    paper references any more. Returns the number of papers in the new snapshot.
+    """
+    apply_retention()
+
+    backend = _sqlite()
+    if backend:
+        stored = []
+        changed = []
+        for item in backend.load_db():
+            stored.append(_split(item))
+            if stored[-1] != item:
+                changed.append(stored[-1])
+        if changed:
+            backend.update_entries(changed)
+            _written()
+        blob_store.collect_garbage({d for item in stored for d in item.get("blobs", {}).values()})
+        return backend.compact()
+
+    global _version
+    with _writing():
+        state = _current()
+        stored = [_split(item) for item in state.papers.values()]
+        generation = state.generation + 1
+        _write_snapshot(stored, generation, state.version)
+
+        papers = {}
+        for item in stored:
+            papers[item.get("id")] = ReadOnlyRecord(item)
+        _version += 1
+        _publish(_State(_stamp(), papers, generation, state.version))
+    blob_store.collect_garbage({d for item in stored for d in item.get("blobs", {}).values()})
+    return len(papers)
+
+
+def convert_db(fmt, compression="none"):
+    """
+    Rewrite the JSON-backend database in another on-disk format, e.g.
+    convert_db("msgpack", "zstd") or back with convert_db("json").
+    The log is folded in as by compact(). Returns the number of papers written.
+    Later writes keep the new format unless PAPERSCOPE_DB_FORMAT or
+    PAPERSCOPE_DB_COMPRESSION select another.
+    """
+    if _sqlite():
+        raise StorageError("convert_db applies to the JSON backend; the SQLite backend has its own file format.")
+    fmt, compression = db_format.resolve(fmt, compression)
+
+    global _version
+    with _writing():
+        state = _current()
+        stored = [_split(item) for item in state.papers.values()]
+        generation = state.generation + 1
+        _write_snapshot(stored, generation, state.version, fmt, compression)
+
+        papers = {}
+        for item in stored:
+            papers[item.get("id")] = ReadOnlyRecord(item)
+        _version += 1
+        _publish(_State(_stamp(), papers, generation, state.version))
+    return len(papers)
+
+
+def _apply_identity(identities, record):
+    """
+    Apply one log record to a canonical id -> paper id mapping.
+    """
+    if record.get("op") == "put":
+        paper_id = record.get("entry", {}).get("id")
+        identities.setdefault(canonical_id(paper_id), paper_id)
+    elif record.get("op") == "del":
+        key = canonical_id(record.get("id"))
+        if identities.get(key) == record.get("id"):
+            del identities[key]
+
+
+def _identity_index():
+    """
+    The canonical id -> paper id mapping of the current JSON database (the
+    SQLite backend keeps canonical ids in an indexed column instead).
+    """
+    state = _current()
+    if state.identities is None:
+        ids = {}
+        for paper_id in state.papers:
+            ids.setdefault(canonical_id(paper_id), paper_id)
+        state.identities = ids
+    return state.identities
+
+
+def find_paper(identifier):
+    """
+    The stored paper known under `identifier` in any form: an arXiv id with or
+    without version, an arXiv abs/pdf URL or entry id, a DOI or another URL
+    (see paper_ids.canonical_id). None if it is not stored. A dict (or, on
+    SQLite, index) lookup, so ingest can check it before any network, PDF or LLM work.
+    """
+    key = canonical_id(identifier)
+    if not key:
+        return None
+    backend = _sqlite()
+    paper_id = backend.find_id(key) if backend else _identity_index().get(key)
+    if paper_id is None:
+        return None
+    found = get_entries([paper_id])
+    return found[0] if found else None
 
 
 def add_entry(entry):
     """
-    Add a new paper summary entry if it doesn't already exist.
+    Add a new paper summary entry if it doesn't already exist, under its id
+    or another form of it (see find_paper).
     Automatically adds timestamp if not present.
     """
-    db = load_db()
-
     # Add timestamp if not present
     if "timestamp" not in entry:
         entry["timestamp"] = datetime.now().isoformat()
 
+    backend = _sqlite()
+    if backend:
+        stored = _split(entry)
+        added = backend.add_entry(stored)
+        if added:
+            _written()
+            _notify_added([ReadOnlyRecord(stored)], *_sqlite_versions(backend))
+        return added
+
     # Check for duplicates by ID
-    if not any(item.get("id") == entry.get("id") for item in db):
-        db.append(entry)
-        save_db(db)
-        return True
-    return False
+    with _writing():
+        if entry.get("id") in _papers() or canonical_id(entry.get("id")) in _identity_index():
+            return False
+        stored = _split(entry)
+        versions = _write_log([{"op": "put", "entry": stored}])
+    _notify_added([ReadOnlyRecord(stored)], *versions)
+    return True
+
+
+def add_entries(entries):
+    """
+    Add many paper entries with a single write.
+    Entries whose id, in any form, is already stored (or repeated within the
+    batch) are skipped. Returns the number of entries added.
+    """
+    now = datetime.now().isoformat()
+    for entry in entries:
+        # Add timestamp if not present
+        if "timestamp" not in entry:
+            entry["timestamp"] = now
 
+    backend = _sqlite()
+    if backend:
+        added = [ReadOnlyRecord(item) for item in backend.add_entries([_split(entry) for entry in entries])]
+        if added:
+            _written()
+            _notify_added(added, *_sqlite_versions(backend))
+        return len(added)
 
-def get_history(limit=None):
+    with _writing():
+        papers = _papers()
+        added = [entry for entry in _unknown(entries, _identity_index()) if entry.get("id") not in papers]
+        if not added:
+            return 0
+        stored = [_split(entry) for entry in added]
+        versions = _write_log([{"op": "put", "entry": item} for item in stored])
+    _notify_added([ReadOnlyRecord(item) for item in stored], *versions)
+    return len(added)
+
+
+def _unknown(entries, identities):
+    """
+    The entries whose canonical id is neither in `identities` nor repeated earlier in the batch.
+    """
+    seen = set()
+    unknown = []
+    for entry in entries:
+        key = canonical_id(entry.get("id"))
+        if key not in identities and key not in seen:
+            seen.add(key)
+            unknown.append(entry)
+    return unknown
+
+
+def get_entries(paper_ids):
+    """
+    Look up stored papers by id, in the given order. Unknown ids are skipped.
+    """
+    backend = _sqlite()
+    if backend:
+        return [ReadOnlyRecord(item) for item in backend.get_entries(paper_ids)]
+
+    papers = _papers()
+    return [papers[paper_id] for paper_id in paper_ids if paper_id in papers]
+
+
+def _text_index():
+    """
+    The keyword index, rebuilt first if it is out of step with the database.
+    """
+    from paperscope import text_index
+
+    version = db_version()
+    if text_index.indexed_version() != version:
+        text_index.rebuild(load_db(), version)
+    return text_index
+
+
+def rank_entries(query, limit=None):
     """
-    Get all papers sorted by timestamp (newest first).
+    Keyword search over title, abstract and summary, ranked by BM25.
+    Returns (paper_id, score) pairs, best first.
     """
-    db = load_db()
-    sorted_db = sorted(db, key=lambda x: x.get("timestamp", ""), reverse=True)
+    return _text_index().search(query, limit)
+
+
+def search_entries(query, limit=None):
+    """
+    Keyword search over title, abstract and summary, ranked by BM25.
+    """
+    return get_entries([paper_id for paper_id, _ in rank_entries(query, limit)])
+
+
+def find_duplicate(entry):
+    """
+    The stored paper that `entry` (not stored yet) is a near duplicate of,
+    judged by its abstract or the abstract part of its full text, or None.
+    Ingest calls this before summarizing and embedding a paper. A failure
+    never blocks ingest: it counts as no duplicate.
+    """
+    try:
+        from paperscope import dedup
+
+        version = db_version()
+        if dedup.indexed_version() != version:
+            dedup.rebuild(load_db(), version)
+        match = dedup.find_duplicate(entry)
+    except Exception as e:
+        print(f"Warning: Duplicate check failed: {str(e)}")
+        return None
+    if match is None:
+        return None
+    found = get_entries([match[0]])
+    return found[0] if found else None
+
+
+def _history_ids(sort="newest", query=None):
+    """
+    Paper ids in history order, optionally filtered to papers matching every
+    word of `query`. Orderings and filtered views are computed once per
+    database version and reused for every page.
+    """
+    if sort not in HISTORY_SORTS:
+        raise ValueError(f"Unknown sort '{sort}'. Use one of: {', '.join(HISTORY_SORTS)}")
+    query = " ".join((query or "").lower().split())
+
+    global _orders
+    stamp = _stamp()
+    orders = _orders
+    if orders["stamp"] != stamp:
+        orders = {"stamp": stamp}
+        with _lock:
+            _orders = orders
+
+    if sort not in orders:
+        backend = _sqlite()
+        if backend:
+            orders[sort] = backend.sorted_ids(sort)
+        else:
+            papers = _papers().values()
+            if sort == "title":
+                ordered = sorted(papers, key=lambda x: (x.get("title") or "").lower())
+            else:
+                ordered = sorted(papers, key=lambda x: x.get("timestamp", ""), reverse=(sort == "newest"))
+            orders[sort] = [item.get("id") for item in ordered]
+    ids = orders[sort]
 
-    if limit:
-        return sorted_db[:limit]
-    return sorted_db
+    if not query:
+        return ids
+    if (sort, query) not in orders:
+        matches = _text_index().matching_ids(query)
+        orders[(sort, query)] = [paper_id for paper_id in ids if paper_id in matches]
+    return orders[(sort, query)]
+
+
+def get_history(limit=None, offset=0, sort="newest", query=None):
+    """
+    Get one page of papers in history order.
+
+    Args:
+        limit (int): Page size (all remaining papers if None)
+        offset (int): Number of papers to skip
+        sort (str): 'newest', 'oldest' or 'title'
+        query (str): Only papers whose title, abstract or summary contain every word
+    """
+    ids = _history_ids(sort, query)
+    end = offset + limit if limit else None
+    return get_entries(ids[offset:end])
+
+
+def count_history(query=None, since=None):
+    """
+    Number of papers in the history, optionally only those matching `query`
+    or stored at or after the ISO timestamp `since`.
+    """
+    backend = _sqlite()
+    if backend and since is not None and not query:
+        return backend.count_since(since)
+
+    ids = _history_ids("newest", query)
+    if since is None:
+        return len(ids)
+
+    if backend:
+        return sum(1 for item in backend.get_entries(ids) if item.get("timestamp", "") >= since)
+
+    # Newest-first ids are sorted by timestamp, so stop at the first older one
+    papers = _papers()
+    count = 0
+    for paper_id in ids:
+        if papers[paper_id].get("timestamp", "") < since:
+            break
+        count += 1
+    return count
 
 
 def clear_history():
@@ -64,33 +947,111 @@ def clear_history():
     return True
 
 
+def _retention_victims(rows, max_papers, max_age_days, source_quotas, now):
+    """
+    Ids to drop from (id, timestamp, source) rows ordered newest first: papers
+    older than max_age_days, then anything past a source quota or max_papers.
+    Papers without a timestamp have no age and are the first to go over a quota.
+    """
+    cutoff = (now - timedelta(days=max_age_days)).isoformat() if max_age_days else None
+    quotas = {source.lower(): limit for source, limit in (source_quotas or {}).items()}
+    kept = 0
+    kept_by_source = {}
+    victims = []
+    for paper_id, timestamp, source in rows:
+        source = (source or "arxiv").lower()
+        if ((cutoff and timestamp and timestamp < cutoff)
+                or (source in quotas and kept_by_source.get(source, 0) >= quotas[source])
+                or (max_papers and kept >= max_papers)):
+            victims.append(paper_id)
+        else:
+            kept += 1
+            kept_by_source[source] = kept_by_source.get(source, 0) + 1
+    return victims
+
+
+def apply_retention(max_papers=None, max_age_days=None, source_quotas=None, now=None):
+    """
+    Delete papers that fall outside the retention rules (by default the
+    PAPERSCOPE_RETENTION_* settings), together with their index entries and vectors.
+    Only the dropped papers are written (tombstones / one bulk delete); their
+    blobs are reclaimed by the next compact(). Returns the number of papers removed.
+
+    Args:
+        max_papers (int): Keep at most this many papers, newest first
+        max_age_days (float): Drop papers stored more than this many days ago
+        source_quotas (dict): Per-source limits, e.g. {"arxiv": 500, "upload": 50}
+        now (datetime): Reference time for max_age_days (default: now)
+    """
+    max_papers = RETENTION_MAX_PAPERS if max_papers is None else max_papers
+    max_age_days = RETENTION_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    source_quotas = RETENTION_SOURCE_QUOTAS if source_quotas is None else source_quotas
+    if not (max_papers or max_age_days or source_quotas):
+        return 0
+    now = now or datetime.now()
+
+    backend = _sqlite()
+    if backend:
+        victims = _retention_victims(backend.retention_rows(), max_papers, max_age_days, source_quotas, now)
+        removed = backend.delete_entries(victims)
+        if removed:
+            _written()
+            _notify_removed(victims, *_sqlite_versions(backend))
+        return removed
+
+    with _writing():
+        papers = _papers()
+        rows = ((paper_id, papers[paper_id].get("timestamp", ""), papers[paper_id].get("source"))
+                for paper_id in _history_ids("newest"))
+        victims = _retention_victims(rows, max_papers, max_age_days, source_quotas, now)
+        if not victims:
+            return 0
+        # compact() runs retention first, so do not start a nested compaction here
+        versions = _write_log([{"op": "del", "id": paper_id} for paper_id in victims], compact_after=False)
+    _notify_removed(victims, *versions)
+    return len(victims)
+
+
 def delete_entry(paper_id):
     """
     Delete a specific paper entry by its ID.
     Returns True if deleted, False if not found.
     """
-    db = load_db()
-    original_length = len(db)
+    backend = _sqlite()
+    if backend:
+        deleted = backend.delete_entry(paper_id)
+        if deleted:
+            _written()
+            _notify_removed([paper_id], *_sqlite_versions(backend))
+        return deleted
 
-    db = [item for item in db if item.get("id") != paper_id]
-
-    if len(db) < original_length:
-        save_db(db)
-        return True
-    return False
+    with _writing():
+        if paper_id not in _papers():
+            return False
+        # Record a tombstone instead of rewriting the snapshot
+        versions = _write_log([{"op": "del", "id": paper_id}])
+    _notify_removed([paper_id], *versions)
+    return True
 
 
 # ✅ New helper function added for streamlit_app.py compatibility
-def save_history_entry(paper_id, title, summary, source="uploaded_pdf"):
+def save_history_entry(paper_id, title=None, summary=None, source="uploaded_pdf"):
     """
     Save a new summary entry into the history file.
 
     Args:
-        paper_id (str): Unique identifier (e.g., file name or arxiv id)
+        paper_id (str): Unique identifier (e.g., file name or arxiv id), or a
+            complete entry dict (as streamlit_app.py passes), stored as given
         title (str): Paper title or filename
         summary (str): The summarized text
         source (str): Either 'arxiv', 'uploaded_pdf', or 'manual'
     """
+    if isinstance(paper_id, dict):
+        entry = dict(paper_id)
+        entry.setdefault("source", source)
+        entry.setdefault("timestamp", datetime.now().isoformat())
+        return add_entry(entry)
+
     entry = {
         "id": paper_id,
         "title": title,
@@ -99,13 +1060,4 @@ def save_history_entry(paper_id, title, summary, source="uploaded_pdf"):
         "timestamp": datetime.now().isoformat()
     }
 
-    db = load_db()
-
-    # Avoid duplicate entries
-    existing_ids = [item.get("id") for item in db]
-    if paper_id not in existing_ids:
-        db.append(entry)
-        save_db(db)
-        return True
-
-    return False
+    return add_entry(entry)
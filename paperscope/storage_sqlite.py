@@ -0,0 +1,299 @@
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+
+from paperscope.config import DB_PATH
+from paperscope.paper_ids import canonical_id
+
+# SQLite file used when PAPERSCOPE_STORAGE_BACKEND=sqlite
+SQLITE_PATH = os.getenv("PAPERSCOPE_SQLITE_PATH", os.path.splitext(DB_PATH)[0] + ".sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    canonical_id TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    title TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS papers_timestamp ON papers (timestamp);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_initialized = set()
+
+
+@contextmanager
+def _connect():
+    """
+    Open a connection to the papers database, creating the schema on first use.
+    The block runs in one transaction that is committed on success.
+    """
+    conn = sqlite3.connect(SQLITE_PATH, timeout=30)
+    try:
+        if SQLITE_PATH not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _upgrade_schema(conn)
+            _initialized.add(SQLITE_PATH)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _upgrade_schema(conn):
+    """
+    Bring databases created by older versions up to the current schema.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(papers)")}
+    if "title" not in columns:
+        conn.execute("ALTER TABLE papers ADD COLUMN title TEXT NOT NULL DEFAULT ''")
+        conn.executemany("UPDATE papers SET title = ? WHERE id = ?",
+                         [(json.loads(data).get("title") or "", paper_id)
+                          for paper_id, data in conn.execute("SELECT id, data FROM papers").fetchall()])
+        conn.commit()
+    if "canonical_id" not in columns:
+        conn.execute("ALTER TABLE papers ADD COLUMN canonical_id TEXT NOT NULL DEFAULT ''")
+        conn.executemany("UPDATE papers SET canonical_id = ? WHERE id = ?",
+                         [(canonical_id(paper_id), paper_id)
+                          for (paper_id,) in conn.execute("SELECT id FROM papers").fetchall()])
+        conn.commit()
+    conn.execute("CREATE INDEX IF NOT EXISTS papers_title ON papers (title COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS papers_canonical_id ON papers (canonical_id)")
+
+
+def _bump_generation(conn):
+    """
+    Advance the write generation that readers use to invalidate cached views.
+    """
+    conn.execute("INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                 "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+
+
+def generation():
+    """
+    Current write generation (0 for a fresh database).
+    """
+    return int(get_meta("generation", 0))
+
+
+def _row(entry):
+    return (entry.get("id"), canonical_id(entry.get("id")), entry.get("timestamp") or "",
+            entry.get("title") or "", json.dumps(entry, ensure_ascii=False))
+
+
+# Inserts a row unless a paper with the same canonical id is stored (index lookup)
+_INSERT_UNKNOWN = ("INSERT OR IGNORE INTO papers (id, canonical_id, timestamp, title, data) "
+                   "SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM papers WHERE canonical_id = ?)")
+
+
+def load_db():
+    """
+    Load all papers in insertion order.
+    """
+    with _connect() as conn:
+        return [json.loads(data) for (data,) in conn.execute("SELECT data FROM papers ORDER BY rowid")]
+
+
+def save_db(data, expected_generation=None):
+    """
+    Replace the whole database with the given list of papers.
+    With expected_generation, the write is refused if another writer got there first.
+    """
+    from paperscope.storage import ConcurrentModificationError
+
+    with _connect() as conn:
+        # Take the write lock up front so the generation check and the write are atomic
+        conn.execute("BEGIN IMMEDIATE")
+        if expected_generation is not None:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+            current = int(row[0]) if row else 0
+            if current != expected_generation:
+                raise ConcurrentModificationError(
+                    f"Database changed (version {current}, expected {expected_generation}); reload and retry."
+                )
+        conn.execute("DELETE FROM papers")
+        conn.executemany("INSERT OR IGNORE INTO papers (id, canonical_id, timestamp, title, data) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [_row(entry) for entry in data])
+        _bump_generation(conn)
+
+
+def add_entry(entry):
+    """
+    Insert a paper unless its id, or another form of it, is already stored
+    (primary key and canonical id index lookups). Returns True if inserted.
+    """
+    row = _row(entry)
+    with _connect() as conn:
+        cur = conn.execute(_INSERT_UNKNOWN, row + (row[1],))
+        if cur.rowcount > 0:
+            _bump_generation(conn)
+            return True
+        return False
+
+
+def add_entries(entries):
+    """
+    Insert many papers in one transaction, skipping ids that are already
+    stored in any form (or repeated within the batch).
+    Returns the entries that were inserted.
+    """
+    added = []
+    with _connect() as conn:
+        for entry in entries:
+            row = _row(entry)
+            cur = conn.execute(_INSERT_UNKNOWN, row + (row[1],))
+            if cur.rowcount > 0:
+                added.append(entry)
+        if added:
+            _bump_generation(conn)
+    return added
+
+
+def update_entries(entries):
+    """
+    Rewrite the stored data of existing papers (e.g. after moving fields to the blob store).
+    """
+    with _connect() as conn:
+        conn.executemany("UPDATE papers SET title = ?, data = ? WHERE id = ?",
+                         [(entry.get("title") or "", json.dumps(entry, ensure_ascii=False), entry.get("id"))
+                          for entry in entries])
+        _bump_generation(conn)
+
+
+def delete_entry(paper_id):
+    """
+    Delete a paper by id. Returns True if it existed.
+    """
+    with _connect() as conn:
+        cur = conn.execute("DELETE FROM papers WHERE id = ?", (paper_id,))
+        if cur.rowcount > 0:
+            _bump_generation(conn)
+            return True
+        return False
+
+
+def delete_entries(paper_ids):
+    """
+    Delete many papers in one transaction. Returns the number deleted.
+    """
+    paper_ids = list(paper_ids)
+    if not paper_ids:
+        return 0
+    with _connect() as conn:
+        before = conn.total_changes
+        conn.executemany("DELETE FROM papers WHERE id = ?", [(paper_id,) for paper_id in paper_ids])
+        deleted = conn.total_changes - before
+        if deleted:
+            _bump_generation(conn)
+    return deleted
+
+
+def retention_rows():
+    """
+    (id, timestamp, source) of every paper, newest first, for the retention rules.
+    """
+    with _connect() as conn:
+        return conn.execute("SELECT id, timestamp, json_extract(data, '$.source') FROM papers "
+                            "ORDER BY timestamp DESC").fetchall()
+
+
+# ORDER BY clauses for the history sort keys, each served by an index
+_HISTORY_ORDER = {
+    "newest": "timestamp DESC",
+    "oldest": "timestamp ASC",
+    "title": "title COLLATE NOCASE ASC",
+}
+
+
+def sorted_ids(sort="newest"):
+    """
+    All paper ids in history order, read from the matching index.
+    """
+    with _connect() as conn:
+        return [paper_id for (paper_id,) in conn.execute(f"SELECT id FROM papers ORDER BY {_HISTORY_ORDER[sort]}")]
+
+
+def find_id(key):
+    """
+    Id of the paper stored under a canonical id (see paper_ids.canonical_id), or None.
+    """
+    with _connect() as conn:
+        row = conn.execute("SELECT id FROM papers WHERE canonical_id = ? ORDER BY rowid LIMIT 1", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def get_entries(paper_ids):
+    """
+    Papers for the given ids (primary key lookups), in the given order.
+    """
+    paper_ids = list(paper_ids)
+    found = {}
+    with _connect() as conn:
+        # Stay well below SQLite's bound parameter limit
+        for start in range(0, len(paper_ids), 500):
+            chunk = paper_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for paper_id, data in conn.execute(f"SELECT id, data FROM papers WHERE id IN ({placeholders})", chunk):
+                found[paper_id] = json.loads(data)
+    return [found[paper_id] for paper_id in paper_ids if paper_id in found]
+
+
+def count_since(timestamp):
+    """
+    Number of papers stored at or after an ISO timestamp (timestamp index range scan).
+    """
+    with _connect() as conn:
+        return conn.execute("SELECT COUNT(*) FROM papers WHERE timestamp >= ?", (timestamp,)).fetchone()[0]
+
+
+def count():
+    """
+    Number of stored papers.
+    """
+    with _connect() as conn:
+        return conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+
+def compact():
+    """
+    Checkpoint the WAL into the main database file. Returns the paper count.
+    """
+    with _connect() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return count()
+
+
+def get_meta(key, default=None):
+    with _connect() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(key, value):
+    with _connect() as conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def import_entries(entries, source):
+    """
+    One-shot import of existing papers, recorded in the meta table so it never repeats.
+    Returns the number of papers imported, or 0 if an import already ran.
+    """
+    with _connect() as conn:
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from'").fetchone():
+            return 0
+        before = conn.total_changes
+        conn.executemany("INSERT OR IGNORE INTO papers (id, canonical_id, timestamp, title, data) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         [_row(entry) for entry in entries])
+        imported = conn.total_changes - before
+        _bump_generation(conn)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from', ?)", (source,))
+        return imported
@@ -0,0 +1,235 @@
+import math
+import os
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from heapq import nlargest
+
+from paperscope.config import DB_PATH
+
+# Persistent inverted index over title/abstract/summary used for keyword search
+TEXT_INDEX_PATH = os.getenv("PAPERSCOPE_TEXT_INDEX_PATH", os.path.splitext(DB_PATH)[0] + ".index.sqlite3")
+
+# Fields of a paper that are indexed
+INDEXED_FIELDS = ("title", "abstract", "summary")
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc INTEGER PRIMARY KEY,
+    paper_id TEXT UNIQUE,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+_initialized = set()
+
+
+@contextmanager
+def _connect():
+    """
+    Open the index database in one committed transaction, creating the schema on first use.
+    """
+    conn = sqlite3.connect(TEXT_INDEX_PATH, timeout=30)
+    try:
+        if TEXT_INDEX_PATH not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _initialized.add(TEXT_INDEX_PATH)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens of a text.
+    """
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _document_tokens(paper):
+    tokens = []
+    for field in INDEXED_FIELDS:
+        tokens.extend(tokenize(paper.get(field)))
+    return tokens
+
+
+def _get_meta(conn, key, default=0):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def _remove(conn, paper_ids):
+    """
+    Drop documents and their postings. Returns (documents removed, tokens removed).
+    """
+    removed, removed_length = 0, 0
+    for paper_id in paper_ids:
+        row = conn.execute("SELECT doc, length FROM docs WHERE paper_id = ?", (paper_id,)).fetchone()
+        if not row:
+            continue
+        doc, length = row
+        conn.execute("DELETE FROM postings WHERE doc = ?", (doc,))
+        conn.execute("DELETE FROM docs WHERE doc = ?", (doc,))
+        removed += 1
+        removed_length += length
+    return removed, removed_length
+
+
+def _add(conn, papers):
+    """
+    Index papers, replacing any previous version of the same id.
+    """
+    papers = list(papers)
+    removed, removed_length = _remove(conn, [p.get("id") for p in papers])
+    added, added_length = 0, 0
+    for paper in papers:
+        tokens = _document_tokens(paper)
+        cur = conn.execute("INSERT INTO docs (paper_id, length) VALUES (?, ?)", (paper.get("id"), len(tokens)))
+        conn.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)",
+                         [(term, cur.lastrowid, tf) for term, tf in Counter(tokens).items()])
+        added += 1
+        added_length += len(tokens)
+
+    _set_meta(conn, "doc_count", _get_meta(conn, "doc_count") - removed + added)
+    _set_meta(conn, "total_length", _get_meta(conn, "total_length") - removed_length + added_length)
+
+
+def _advance_version(conn, before, after):
+    """
+    Move the synced version from `before` to `after`. If the index was not at
+    `before` it missed a write; clear the version so the next search rebuilds.
+    """
+    if _get_meta(conn, "version", None) == before:
+        _set_meta(conn, "version", after)
+    else:
+        _set_meta(conn, "version", None)
+
+
+def add_papers(papers, before, after):
+    """
+    Incrementally index papers added by the storage write that took the
+    database from version `before` to `after`.
+    """
+    with _connect() as conn:
+        _add(conn, papers)
+        _advance_version(conn, before, after)
+
+
+def remove_papers(paper_ids, before, after):
+    """
+    Incrementally remove papers deleted by the storage write from `before` to `after`.
+    """
+    with _connect() as conn:
+        removed, removed_length = _remove(conn, paper_ids)
+        _set_meta(conn, "doc_count", _get_meta(conn, "doc_count") - removed)
+        _set_meta(conn, "total_length", _get_meta(conn, "total_length") - removed_length)
+        _advance_version(conn, before, after)
+
+
+def rebuild(papers, version):
+    """
+    Re-index the whole corpus from scratch.
+    """
+    with _connect() as conn:
+        conn.execute("DELETE FROM postings")
+        conn.execute("DELETE FROM docs")
+        _set_meta(conn, "doc_count", 0)
+        _set_meta(conn, "total_length", 0)
+        _add(conn, papers)
+        _set_meta(conn, "version", version)
+
+
+def indexed_version():
+    """
+    The storage version the index was last synced with (None if never built).
+    """
+    with _connect() as conn:
+        return _get_meta(conn, "version", None)
+
+
+def matching_ids(query):
+    """
+    Ids of papers containing every query term, where each term also matches
+    longer words it is a prefix of ("learn" matches "learning").
+    Each term is a range scan over the term index.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return set()
+
+    matches = None
+    with _connect() as conn:
+        for term in terms:
+            rows = conn.execute(
+                "SELECT DISTINCT d.paper_id FROM postings p JOIN docs d ON d.doc = p.doc "
+                "WHERE p.term >= ? AND p.term < ?",
+                (term, term + "\U0010ffff"),
+            )
+            ids = {paper_id for (paper_id,) in rows}
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                break
+    return matches
+
+
+def search(query, limit=None):
+    """
+    Rank papers against a multi-term query with BM25.
+    Only the postings of the query terms are read.
+    Returns a list of (paper_id, score), best first.
+    """
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return []
+
+    with _connect() as conn:
+        doc_count = _get_meta(conn, "doc_count")
+        if not doc_count:
+            return []
+        avg_length = _get_meta(conn, "total_length") / doc_count
+
+        postings = defaultdict(list)
+        placeholders = ",".join("?" * len(terms))
+        rows = conn.execute(
+            "SELECT p.term, p.tf, d.length, d.paper_id FROM postings p "
+            f"JOIN docs d ON d.doc = p.doc WHERE p.term IN ({placeholders})",
+            terms,
+        )
+        for term, tf, length, paper_id in rows:
+            postings[term].append((tf, length, paper_id))
+
+    scores = defaultdict(float)
+    for term, hits in postings.items():
+        df = len(hits)
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        for tf, length, paper_id in hits:
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[paper_id] += idf * tf * (BM25_K1 + 1) / norm
+
+    if limit:
+        return nlargest(limit, scores.items(), key=lambda hit: hit[1])
+    return sorted(scores.items(), key=lambda hit: hit[1], reverse=True)
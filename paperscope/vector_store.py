@@ -1,99 +1,1299 @@
+import hashlib
 import json
 import os
-from paperscope.storage import load_db, save_db
-from paperscope.config import DB_PATH
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import UTC, date, datetime
+
+from paperscope import embedding_cache, record_file
+from paperscope.file_utils import atomic_write, file_lock
+from paperscope.storage import (
+    ReadOnlyRecord,
+    db_version,
+    get_entries,
+    load_db,
+    rank_entries,
+)
 
 # Try to import optional dependencies
 try:
-    import faiss
     import numpy as np
-    from sentence_transformers import SentenceTransformer
-    _HAS_FAISS = True
+
+    from paperscope import numpy_index
+    _HAS_NUMPY = True
 except ImportError:
-    _HAS_FAISS = False
-    # Create dummy classes for when dependencies are missing
-    class DummyModel:
-        def encode(self, text):
-            return [0.1] * 768  # Dummy embedding
-    SentenceTransformer = lambda x: DummyModel()
     np = None
+    _HAS_NUMPY = False
+
+try:
+    import faiss
+except ImportError:
     faiss = None
 
+try:
+    from sentence_transformers import SentenceTransformer
+    _HAS_SENTENCE_TRANSFORMERS = True
+except ImportError:
+    # Models are then served by the hashing encoder (see embedding_backend)
+    _HAS_SENTENCE_TRANSFORMERS = False
+    SentenceTransformer = None
+
+from paperscope.hashing_encoder import HashingEncoder, hashed_vector
+
+# Vectors are stored under ids derived from the paper id (see _vector_id), so
+# papers can be added and removed without renumbering. A build writes a new
+# generation: the FAISS index (faiss.index.<N>) and a record file mapping vector
+# ids to papers (faiss.index.<N>.records), then switches the manifest
+# (faiss.index.manifest.json) to it. Readers follow the manifest, so they always
+# see an index and records of the same generation.
 VECTOR_INDEX_PATH = "faiss.index"
-VECTOR_DIM = 768  
+# meta.json is only read to convert an index written by older versions
+VECTOR_META_PATH = "meta.json"
+
+# Embedding backends by name. "model" identifies the vectors (it names the
+# sentence-transformers model, and keys the embedding cache); "dim" is what the
+# backend produces. "hashing" needs no model (see hashing_encoder.py); it is
+# used in place of sentence-transformers models where those are not installed.
+EMBEDDING_BACKENDS = {
+    "minilm": {"kind": "sentence-transformers", "model": "all-MiniLM-L6-v2", "dim": 384, "normalize": True},
+    "mpnet": {"kind": "sentence-transformers", "model": "all-mpnet-base-v2", "dim": 768, "normalize": True},
+    "bge-large": {"kind": "sentence-transformers", "model": "BAAI/bge-large-en-v1.5", "dim": 1024, "normalize": True},
+    "hashing": {"kind": "hashing", "model": "hashing-512", "dim": 512, "normalize": True},
+}
+
+# A backend name above, or the name of any sentence-transformers model
+EMBEDDING_MODEL = os.getenv("PAPERSCOPE_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Texts per model.encode call when building the index
+EMBED_BATCH_SIZE = int(os.getenv("PAPERSCOPE_EMBED_BATCH_SIZE", "64"))
+
+# Memory-map the index for searching (PAPERSCOPE_VECTOR_MMAP=1) instead of reading
+# it into memory, so several app processes share its pages via the OS page cache
+VECTOR_MMAP = os.getenv("PAPERSCOPE_VECTOR_MMAP", "").lower() in ("1", "true", "yes")
+
+# Index type: "flat" (exact scan), "ivf" (IVF-Flat), "ivfpq" (IVF-PQ) or "hnsw"
+VECTOR_INDEX_TYPE = os.getenv("PAPERSCOPE_VECTOR_INDEX", "flat").lower()
+VECTOR_INDEX_TYPES = ("flat", "ivf", "ivfpq", "hnsw")
+
+# Approximate indexes are used from this many vectors on; below it an exact scan is as fast
+VECTOR_ANN_MIN_VECTORS = int(os.getenv("PAPERSCOPE_VECTOR_ANN_MIN", "10000"))
+
+# IVF and PQ are trained on a random sample of at most this many vectors
+VECTOR_TRAIN_SAMPLE = int(os.getenv("PAPERSCOPE_VECTOR_TRAIN_SAMPLE", "50000"))
+
+# Build parameters (0: derived from the corpus size and dimension)
+IVF_NLIST = int(os.getenv("PAPERSCOPE_IVF_NLIST", "0"))
+PQ_M = int(os.getenv("PAPERSCOPE_PQ_M", "0"))
+HNSW_M = int(os.getenv("PAPERSCOPE_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("PAPERSCOPE_HNSW_EF_CONSTRUCTION", "80"))
+
+# Search parameters. They are saved with the index; set these to override them
+IVF_NPROBE = int(os.getenv("PAPERSCOPE_IVF_NPROBE", "0"))
+HNSW_EF_SEARCH = int(os.getenv("PAPERSCOPE_HNSW_EF_SEARCH", "0"))
+
+# An HNSW index cannot delete vectors; deleted papers leave orphan vectors
+# that search skips, and the index is rebuilt once they pass this share
+VECTOR_MAX_ORPHANS = 0.2
+
+# Adding or removing papers does not rewrite a generation: the update is
+# written as a segment of it (faiss.index.<N>.seg<S>: the added vectors, their
+# records and attributes) that the manifest lists with the vector ids it
+# removed, and loading applies the segments in order. The newest segments are
+# folded into a new one while they are no larger than it, so there are few of
+# them; the generation is rewritten once they add up to this share of its papers.
+VECTOR_SEGMENT_SHARE = 0.25
+
+# Index distances are L2; with normalized embeddings they rank like cosine similarity
+VECTOR_METRIC = "l2"
+
+
+def embedding_backend(name=None):
+    """
+    The backend for a registry name or model name. Models that are not in the
+    registry are loaded with sentence-transformers; their dimension is read
+    from the model once it is loaded.
+    """
+    name = name or EMBEDDING_MODEL
+    backend = EMBEDDING_BACKENDS.get(name) or next(
+        (backend for backend in EMBEDDING_BACKENDS.values() if backend["model"] == name),
+        {"kind": "sentence-transformers", "model": name, "dim": None, "normalize": False})
+    if backend["kind"] == "sentence-transformers" and not _HAS_SENTENCE_TRANSFORMERS:
+        return EMBEDDING_BACKENDS["hashing"]
+    return backend
+
+
+# Vector search runs on FAISS, or on the NumPy engine (numpy_index.py) where
+# FAISS is not installed; without numpy it falls back to keyword search
+_HAS_VECTOR_ENGINE = _HAS_NUMPY
+
+# Hybrid search: how the keyword and vector rankings are fused ("rrf" or
+# "weighted"), the vector ranking's share, and the hits taken from each
+HYBRID_FUSION = os.getenv("PAPERSCOPE_HYBRID_FUSION", "rrf").lower()
+HYBRID_FUSIONS = ("rrf", "weighted")
+HYBRID_VECTOR_WEIGHT = float(os.getenv("PAPERSCOPE_HYBRID_VECTOR_WEIGHT", "0.5"))
+HYBRID_DEPTH = int(os.getenv("PAPERSCOPE_HYBRID_DEPTH", "50"))
+# The usual RRF constant: damps the head of each ranking
+HYBRID_RRF_K = 60
+
+# Threads for the vector leg of hybrid searches, started on first use
+_executor = None
+_executor_lock = threading.Lock()
+
+# Process-wide model registry: each model is loaded once, on first use
+_models = {}
+_model_info = {}
+_load_errors = {}
+_models_lock = threading.Lock()
+
+
+def get_model(name=None):
+    """
+    The shared instance of an embedding model, loaded on first use.
+    Threads that ask while it is loading wait for that one load.
+    A failed load is remembered, so callers fall back at once instead of
+    retrying a slow load on every call; warm_up() tries again.
+    """
+    backend = embedding_backend(name)
+    name = backend["model"]
+    model = _models.get(name)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        if name in _models:
+            return _models[name]
+        if name in _load_errors:
+            raise _load_errors[name]
+        start = time.perf_counter()
+        try:
+            if backend["kind"] == "hashing":
+                model = HashingEncoder(backend["dim"])
+            else:
+                model = SentenceTransformer(name)
+        except Exception as e:
+            _load_errors[name] = e
+            print(f"Warning: Failed to load embedding model '{name}': {str(e)}")
+            raise
+        dim = getattr(model, "get_sentence_embedding_dimension", lambda: backend["dim"])()
+        _model_info[name] = {
+            "name": name,
+            "dim": dim,
+            "load_seconds": time.perf_counter() - start,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        _models[name] = model
+        return model
+
+
+def warm_up(name=None):
+    """
+    Load the embedding model now (e.g. at app start-up) so the first query
+    does not pay for it. Returns model_info(), or None if the load failed.
+    """
+    name = embedding_backend(name)["model"]
+    if not _HAS_VECTOR_ENGINE:
+        return None
+    with _models_lock:
+        _load_errors.pop(name, None)
+    try:
+        get_model(name)
+    except Exception:
+        return None
+    return model_info(name)
+
+
+def model_info(name=None):
+    """
+    Which model is loaded, its dimension and how long the load took:
+    {"name", "dim", "load_seconds", "loaded_at"}, or None if it is not loaded.
+    """
+    return _model_info.get(embedding_backend(name)["model"])
+
+
+def embedding_dim():
+    """
+    Dimension of the configured backend's vectors: from the registry, else
+    from the loaded model, else None.
+    """
+    backend = embedding_backend()
+    info = _model_info.get(backend["model"])
+    return backend["dim"] or (info and info["dim"])
+
+
+def _embedding_manifest(dim):
+    """
+    What the vectors of an index were made with, as recorded in its manifest.
+    """
+    backend = embedding_backend()
+    return {"model": backend["model"], "dim": dim, "metric": VECTOR_METRIC, "normalize": backend["normalize"]}
+
+
+def _embedding_changed(manifest, index, dim):
+    """
+    Whether `index` was built with another backend than the configured one,
+    whose `dim`-sized vectors it cannot be searched with, or could not be
+    loaded (see _load).
+    """
+    if index is None:
+        return bool((manifest or {}).get("index"))
+    recorded = (manifest or {}).get("embedding") or {}
+    return index.d != dim or recorded.get("model", embedding_backend()["model"]) != embedding_backend()["model"]
 
 
 def embed_text(text):
     """
     Returns a text embedding.
-    Uses real model if available, otherwise falls back to a mock embedding.
-    """
-    if not _HAS_FAISS:
-        # Return a simple hash-based embedding for demo mode
-        import hashlib
-        hash_val = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
-        return [float((hash_val >> i) & 1) for i in range(VECTOR_DIM)]
-    
+    Uses the configured model, or the hashing encoder as a plain list where
+    numpy is not installed.
+    """
+    if not _HAS_VECTOR_ENGINE:
+        return hashed_vector(text, embedding_dim() or EMBEDDING_BACKENDS["hashing"]["dim"])
+
+    return embed_texts([text])[0]
+
+
+def embed_texts(texts, batch_size=None):
+    """
+    Embed a list of texts, reusing vectors from the embedding cache and running
+    the rest through one model.encode call.
+    Returns a float32 matrix with one row per text. A model that fails to
+    load raises: vectors of another model must not enter an index that
+    records this one.
+    """
+    texts = list(texts)
+    backend = embedding_backend()
+    if not texts:
+        return np.empty((0, embedding_dim() or 0), dtype="float32")
+
+    def encode(missing):
+        # The model is only loaded when the cache cannot answer
+        vectors = get_model().encode(missing, batch_size=batch_size or len(missing), convert_to_numpy=True,
+                                     show_progress_bar=False, normalize_embeddings=backend["normalize"])
+        return np.asarray(vectors, dtype="float32").reshape(len(missing), -1)
+
+    if backend["kind"] == "hashing":
+        # Hashing is cheaper than a cache lookup
+        return encode(texts)
+    return embedding_cache.embed(backend["model"], backend["normalize"], texts, encode)
+
+
+def _vector_id(paper_id):
+    """
+    Stable 63-bit FAISS id for a paper id.
+    """
+    digest = hashlib.sha1(str(paper_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def index_params(kind, dim, count):
+    """
+    Build and search parameters for an index of `kind` over `count` vectors.
+    Small corpora get an exact flat index whatever the kind.
+    """
+    if kind not in VECTOR_INDEX_TYPES:
+        raise ValueError(f"Unknown vector index type '{kind}'. Use one of: {', '.join(VECTOR_INDEX_TYPES)}")
+    # The NumPy engine only scans
+    if count < VECTOR_ANN_MIN_VECTORS or faiss is None:
+        kind = "flat"
+
+    params = {"type": kind}
+    if kind in ("ivf", "ivfpq"):
+        params["nlist"] = IVF_NLIST or max(16, min(65536, int(4 * count ** 0.5)))
+        params["nprobe"] = IVF_NPROBE or 16
+    if kind == "ivfpq":
+        # About 8 dimensions per sub-quantizer, which must divide the dimension
+        m = PQ_M or max(1, dim // 8)
+        while dim % m:
+            m -= 1
+        params["m"] = m
+    if kind == "hnsw":
+        params["m"] = HNSW_M
+        params["ef_construction"] = HNSW_EF_CONSTRUCTION
+        params["ef_search"] = HNSW_EF_SEARCH or 64
+    return params
+
+
+def _factory_string(params):
+    # IVF indexes store ids themselves (an id map over them breaks on removal);
+    # flat and HNSW indexes are wrapped in one
+    kind = params["type"]
+    if kind == "ivf":
+        return f"IVF{params['nlist']},Flat"
+    if kind == "ivfpq":
+        return f"IVF{params['nlist']},PQ{params['m']}"
+    if kind == "hnsw":
+        return f"IDMap2,HNSW{params['m']}"
+    return "IDMap2,Flat"
+
+
+def _apply_search_params(index, params):
+    """
+    Set nprobe / efSearch on a loaded index. The environment overrides saved values.
+    """
+    if params.get("type") in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE or params["nprobe"]
+    elif params.get("type") == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efSearch = HNSW_EF_SEARCH or params["ef_search"]
+
+
+def make_index(dim, vectors, params):
+    """
+    An empty id-mapped index for `params`, trained on a sample of `vectors`
+    if the index type needs training. Without FAISS it is a NumPy index.
+    """
+    if faiss is None:
+        return numpy_index.NumpyIndex(dim)
+    index = faiss.index_factory(dim, _factory_string(params))
+    if params["type"] == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = params["ef_construction"]
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > VECTOR_TRAIN_SAMPLE:
+            rows = np.random.default_rng(0).choice(len(vectors), VECTOR_TRAIN_SAMPLE, replace=False)
+            sample = vectors[np.sort(rows)]
+        index.train(np.ascontiguousarray(sample, dtype="float32"))
+    _apply_search_params(index, params)
+    return index
+
+
+def _index_from(vectors, ids, kind=None):
+    """
+    A new index of the configured type holding `vectors` under `ids`.
+    Returns (index, params).
+    """
+    params = index_params(kind or VECTOR_INDEX_TYPE, vectors.shape[1], len(vectors))
+    index = make_index(vectors.shape[1], vectors, params)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index, params
+
+
+def _stored_vectors(index, ids):
+    """
+    The vectors held under `ids` in a flat or HNSW index.
+    """
+    if isinstance(index, numpy_index.NumpyIndex):
+        return index.reconstruct_batch(ids) if len(ids) else None
+    return np.vstack([index.reconstruct(int(i)) for i in ids]).astype("float32") if len(ids) else None
+
+
+def _encode_record(item):
+    """
+    A paper as stored in the record file: blob-backed bodies stay digests.
+    """
+    stored = item.stored() if isinstance(item, ReadOnlyRecord) else dict(item)
+    return json.dumps(stored, ensure_ascii=False).encode("utf-8")
+
+
+# The generation helpers below take the base path of an index, so other indexes
+# (see passage_index.py) are stored the same way; None is the paper index.
+def _manifest_path(base=None):
+    return (base or VECTOR_INDEX_PATH) + ".manifest.json"
+
+
+def _generation_paths(generation, base=None):
+    """
+    (index path, record file path) of a generation.
+    """
+    base = base or VECTOR_INDEX_PATH
+    return f"{base}.{generation}", f"{base}.{generation}.records"
+
+
+def _segment_path(generation, number, base=None):
+    """
+    Path of a segment's vectors; its records and attributes are stored next to it.
+    """
+    return f"{_generation_paths(generation, base)[0]}.seg{number}"
+
+
+@contextmanager
+def _updating(base=None):
+    """
+    Serialize index updates across threads and processes.
+    """
+    with file_lock((base or VECTOR_INDEX_PATH) + ".lock"):
+        yield
+
+
+def _read_manifest(base=None):
     try:
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        return model.encode(text).astype("float32")
-    except:
-        np.random.seed(abs(hash(text)) % (2**32))
-        return np.random.rand(VECTOR_DIM).astype("float32")
+        with open(_manifest_path(base), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_generation(index, records, version, previous, params=None, base=None, fresh=(), papers=None):
+    """
+    Write `index` and `records` (vector id -> bytes) as the generation after
+    `previous`, then switch the manifest to it. `fresh` are the ids whose
+    records are not carried over from the current generation; `papers`, if
+    given, is listed in the manifest (see passage_index). Must hold _updating().
+    """
+    generation = previous + 1
+    index_path, records_path = _generation_paths(generation, base)
+    engine = "numpy" if isinstance(index, numpy_index.NumpyIndex) else "faiss"
+    if engine == "numpy":
+        numpy_index.write_index(index, index_path)
+    elif index is not None:
+        tmp_path = index_path + ".tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, index_path)
+    record_file.write(records_path, generation, records.items())
+    # Papers carry filterable attributes; other indexes (passages) do not
+    attributes = _write_attributes(records, generation, fresh) if base is None else None
+
+    manifest = {
+        "generation": generation,
+        "db_version": version,
+        "index": os.path.basename(index_path) if index is not None else None,
+        "records": os.path.basename(records_path),
+        "count": len(records),
+        "index_params": params or {"type": "flat"},
+        "engine": engine,
+        "embedding": _embedding_manifest(index.d) if index is not None else None,
+        "orphans": index.ntotal - len(records) if index is not None else 0,
+    }
+    if attributes:
+        manifest["attributes"], manifest["sources"] = attributes
+    if papers is not None:
+        manifest["papers"] = papers
+    with atomic_write(_manifest_path(base), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    _remove_old_generations(generation, base)
+    return manifest
+
+
+# Per-paper attributes for filtered search, stored with each generation as
+# arrays in vector id order (faiss.index.<N>.attrs.npy): the paper's source as
+# an index into the manifest's "sources" list, and its timestamp in seconds.
+_ATTRIBUTE_DTYPE = [("id", "<i8"), ("source", "<u2"), ("time", "<i8")]
+_NO_TIME = -(2 ** 63)
+
+
+def _attributes_path(generation):
+    return _generation_paths(generation)[0] + ".attrs.npy"
+
+
+def _epoch_seconds(value):
+    """
+    Seconds since the epoch of a datetime, date or ISO string; None if unparseable.
+    """
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(UTC).replace(tzinfo=None)
+    return int((value - datetime(1970, 1, 1)).total_seconds())
+
+
+def _attribute_rows(records, sources, known=None):
+    """
+    Attribute rows for `records` (vector id -> bytes), reusing rows of `known`
+    (a previous attribute array) and parsing only the other records. New
+    sources are appended to `sources`.
+    """
+    ids = np.array(sorted(records), dtype="int64")
+    rows = np.zeros(len(ids), dtype=_ATTRIBUTE_DTYPE)
+    rows["id"] = ids
+    todo = np.ones(len(ids), dtype=bool)
+    if known is not None and len(known) and len(ids):
+        positions = np.minimum(np.searchsorted(known["id"], ids), len(known) - 1)
+        found = known["id"][positions] == ids
+        rows["source"][found] = known["source"][positions[found]]
+        rows["time"][found] = known["time"][positions[found]]
+        todo = ~found
+
+    codes = {source: code for code, source in enumerate(sources)}
+    for row in np.flatnonzero(todo):
+        paper = json.loads(records[int(ids[row])])
+        # As in retention, a paper without a source came from arXiv
+        source = paper.get("source") or "arxiv"
+        if source not in codes:
+            codes[source] = len(sources)
+            sources.append(source)
+        rows["source"][row] = codes[source]
+        seconds = _epoch_seconds(paper.get("timestamp"))
+        rows["time"][row] = _NO_TIME if seconds is None else seconds
+    return rows
+
+
+def _layered_attributes(manifest, records=None, mmap=False):
+    """
+    (attribute rows, sources) of the papers in the generation of `manifest`:
+    its rows without those its segments removed, then each segment's rows.
+    A generation written before attributes existed has them computed from
+    its `records`.
+    """
+    if not manifest.get("attributes"):
+        sources = []
+        return _attribute_rows(dict(records.items()), sources), sources
+    generation = manifest["generation"]
+    segments = manifest.get("segments") or []
+    layers = [np.load(_attributes_path(generation), mmap_mode="r" if mmap else None)]
+    layers += [np.load(_segment_path(generation, segment["number"]) + ".attrs.npy") for segment in segments]
+    parts = []
+    for layer, rows in enumerate(layers):
+        removed = [key for segment in segments[layer:] for key in segment["removed"]]
+        parts.append(rows[~np.isin(rows["id"], removed)] if removed else rows)
+    return (np.concatenate(parts) if len(parts) > 1 else parts[0]), list(manifest.get("sources") or [])
+
+
+def _write_attributes(records, generation, fresh=()):
+    """
+    Write the attribute arrays of a paper index generation, carrying over the
+    rows of the current one except those of `fresh` ids. Returns (file name, sources).
+    """
+    manifest = _read_manifest()
+    known, sources = None, []
+    if manifest and manifest.get("attributes"):
+        try:
+            known, sources = _layered_attributes(manifest, mmap=True)
+            known = np.sort(known[~np.isin(known["id"], list(fresh))], order="id")
+        except (OSError, ValueError):
+            known, sources = None, []
+    rows = _attribute_rows(records, sources, known)
+    path = _attributes_path(generation)
+    with atomic_write(path, "wb") as f:
+        np.save(f, rows)
+    return os.path.basename(path), sources
+
+
+def _remove_old_segments(generation, keep, base=None):
+    """
+    Delete the files of segments of `generation` that were folded into a newer
+    one, except those in `keep` (the segments of the current and previous manifest).
+    """
+    base = base or VECTOR_INDEX_PATH
+    directory = os.path.dirname(os.path.abspath(base))
+    prefix = f"{os.path.basename(base)}.{generation}.seg"
+    for name in os.listdir(directory):
+        number = name[len(prefix):].split(".")[0]
+        if name.startswith(prefix) and number.isdigit() and int(number) not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _remove_old_generations(current, base=None):
+    """
+    Delete generation files older than the previous one; readers that picked up
+    the previous manifest just before the switch can still open theirs.
+    """
+    base = base or VECTOR_INDEX_PATH
+    directory = os.path.dirname(os.path.abspath(base))
+    prefix = os.path.basename(base) + "."
+    for name in os.listdir(directory):
+        generation = name[len(prefix):].split(".")[0]
+        if name.startswith(prefix) and generation.isdigit() and int(generation) < current - 1:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
 
 
-def build_index():
+def _convert_legacy():
+    """
+    Convert an index written by older versions (faiss.index + meta.json) into
+    the first generation, without re-embedding. Must hold _updating().
+    """
+    with open(VECTOR_META_PATH, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = list(data.get("papers", {}).values())
+    records = {_vector_id(item.get("id")): _encode_record(item) for item in data}
+
+    index = None
+    if os.path.exists(VECTOR_INDEX_PATH) and faiss is not None:
+        old = faiss.read_index(VECTOR_INDEX_PATH)
+        if isinstance(old, faiss.IndexIDMap2) and old.ntotal == len(records):
+            index = old
+        elif old.ntotal == len(data):
+            # A flat index: vectors are in the same order as the meta.json list
+            index = faiss.index_factory(old.d, "IDMap2,Flat")
+            if old.ntotal:
+                ids = np.array([_vector_id(item.get("id")) for item in data], dtype="int64")
+                index.add_with_ids(old.reconstruct_n(0, old.ntotal), ids)
+    if index is None:
+        # Vectors and metadata disagree: start empty and let sync() re-embed
+        return _write_generation(None, {}, None, 0)
+    return _write_generation(index, records, None, 0)
+
+
+def _load(mmap=False, base=None):
+    """
+    Load the current generation: (manifest, index, records), all None before
+    the first build. With mmap, the index is mapped read-only instead of read
+    into memory. Must hold _updating().
+    """
+    manifest = _read_manifest(base)
+    if manifest is None:
+        if base is not None or not os.path.exists(VECTOR_META_PATH):
+            return None, None, None
+        manifest = _convert_legacy()
+
+    index_path = _generation_paths(manifest["generation"], base)[0]
+    records = _open_records(manifest, base)
+
+    index = None
+    if manifest.get("engine") == "numpy":
+        index = numpy_index.read_index(index_path, mmap)
+    elif manifest.get("index") and faiss is None:
+        # Written with FAISS, which is gone: the papers are re-embedded on next use
+        print(f"Warning: FAISS is not installed; '{index_path}' will be rebuilt")
+    elif manifest.get("index"):
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = faiss.read_index(index_path, flags)
+    if index is not None:
+        params = manifest.get("index_params") or {"type": "flat"}
+        for segment in manifest.get("segments") or []:
+            added = numpy_index.read_index(_segment_path(manifest["generation"], segment["number"], base))
+            if segment["removed"] and params["type"] != "hnsw":
+                index.remove_ids(np.array(segment["removed"], dtype="int64"))
+            vectors, ids = added._matrix()
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+        if index.ntotal != len(records) + manifest.get("orphans", 0):
+            raise ValueError(f"'{index_path}' has {index.ntotal} vectors for {len(records)} records")
+        _apply_search_params(index, params)
+    return manifest, index, records
+
+
+def _open_records(manifest, base=None):
+    """
+    The records of the generation of `manifest`, with those of its segments
+    layered over them.
+    """
+    generation = manifest["generation"]
+    segments = manifest.get("segments") or []
+    records_path = _generation_paths(generation, base)[1]
+    paths = [records_path] + [_segment_path(generation, segment["number"], base) + ".records"
+                              for segment in segments]
+    records = record_file.LayeredRecords(paths, [segment["removed"] for segment in segments])
+    if records.generation != generation:
+        raise ValueError(f"'{records_path}' does not belong to generation {generation}")
+    return records
+
+
+def _current(base=None):
+    """
+    (manifest, records) of the current generation without loading its index;
+    (None, None) before the first build. Must hold _updating().
+    """
+    manifest = _read_manifest(base)
+    if manifest is None and base is None and os.path.exists(VECTOR_META_PATH):
+        manifest = _convert_legacy()
+    return (manifest, _open_records(manifest, base)) if manifest else (None, None)
+
+
+def _modify(manifest, index, records, remove_ids=(), add_ids=(), vectors=None, add_records=(), field="summary"):
+    """
+    Remove and add vectors in a loaded generation. `records` (vector id -> bytes)
+    is updated in place; returns the new (index, params). If the index was built
+    with another embedding backend, the remaining records are re-embedded from
+    their `field` first.
+    """
+    params = (manifest or {}).get("index_params") or {"type": "flat"}
+    ids = list(remove_ids) + list(add_ids)
+    if index is not None and ids and params["type"] != "hnsw":
+        index.remove_ids(np.array(ids, dtype="int64"))
+    for key in remove_ids:
+        records.pop(key, None)
+
+    if add_ids and _embedding_changed(manifest, index, vectors.shape[1]):
+        # The new vectors come from another model: re-embed the rest to match
+        index, params = _reembedded(records, field=field)
+
+    if add_ids:
+        if index is None:
+            index, params = _index_from(vectors, add_ids)
+        else:
+            index.add_with_ids(vectors, np.array(add_ids, dtype="int64"))
+        records.update(zip(add_ids, add_records))
+
+    if index is not None and records:
+        orphans = index.ntotal - len(records)
+        # Switch a flat index to the configured type once the corpus is large
+        # enough to train it (or to FAISS once it is installed), and drop the
+        # orphans an HNSW index has piled up
+        grown = params["type"] == "flat" and index_params(VECTOR_INDEX_TYPE, index.d, len(records))["type"] != "flat"
+        grown = grown or faiss is not None and isinstance(index, numpy_index.NumpyIndex)
+        if grown or orphans > VECTOR_MAX_ORPHANS * index.ntotal:
+            live = list(records)
+            index, params = _index_from(_stored_vectors(index, live), live)
+    return index, params
+
+
+def _synced_version(manifest, before, after, version):
+    """
+    The database version a new generation is in step with: `version` if given,
+    else `after` if the index was at `before` (a gap clears it, so the next
+    search re-syncs).
+    """
+    if version is not None:
+        return version
+    synced = manifest.get("db_version") if manifest else None
+    return after if synced == before else None
+
+
+def _segment_size(segment):
+    return segment["count"] + len(segment["removed"])
+
+
+def _write_changes(remove_ids=(), add_ids=(), vectors=None, add_records=(), before=None, after=None,
+                   version=None, base=None, field="summary", papers=None):
+    """
+    Remove and add vectors (with their records) in the index at `base`: as a
+    segment of the current generation while its segments stay within
+    VECTOR_SEGMENT_SHARE, else by writing a new generation (also when the index
+    has to be re-embedded, switch type or engine, or drop its orphans). The
+    synced version is as in _synced_version; `papers` replaces the manifest's
+    list if given. Must hold _updating(base).
+    """
+    manifest, records = _current(base)
+    version = _synced_version(manifest, before, after, version)
+    if papers is None and manifest:
+        papers = manifest.get("papers")
+    if manifest and manifest.get("index"):
+        params = manifest.get("index_params") or {"type": "flat"}
+        added = dict(zip(add_ids, add_records))
+        # Live ids the update deletes or replaces
+        removed = {key for key in [*remove_ids, *add_ids] if key in records}
+        count = manifest["count"] - len(removed) + len(added)
+        orphans = manifest.get("orphans", 0) + (len(removed) if params["type"] == "hnsw" else 0)
+        recorded = manifest.get("embedding") or {}
+        dim = vectors.shape[1] if add_ids else recorded.get("dim")
+        rewrite = (
+            add_ids and (dim != recorded.get("dim") or recorded.get("model") != embedding_backend()["model"])
+            or params["type"] == "flat" and index_params(VECTOR_INDEX_TYPE, dim, count)["type"] != "flat"
+            or manifest.get("engine") == "numpy" and faiss is not None
+            or orphans > VECTOR_MAX_ORPHANS * (count + orphans)
+            or sum(map(_segment_size, manifest.get("segments") or [])) + len(removed) + len(added)
+            > VECTOR_SEGMENT_SHARE * count
+        )
+        if not rewrite:
+            ids = np.array(add_ids, dtype="int64")
+            vectors = vectors if add_ids else np.empty((0, dim), dtype="float32")
+            return _write_segment(manifest, removed, ids, vectors, added, count, orphans, version, base, papers)
+
+    manifest, index, current = _load(base=base)
+    records = dict(current.items()) if current else {}
+    index, params = _modify(manifest, index, records, remove_ids, add_ids, vectors, add_records, field)
+    return _write_generation(index, records, version, manifest["generation"] if manifest else 0, params, base,
+                             fresh=add_ids, papers=papers)
+
+
+def _write_segment(manifest, removed, ids, vectors, records, count, orphans, version, base=None, papers=None):
+    """
+    Write the vectors `ids` and `records` added, and the live ids `removed`,
+    as a new segment, folding in the newest segments while they are no
+    larger, then switch the manifest to it. Only segment files are written.
+    """
+    generation = manifest["generation"]
+    hnsw = (manifest.get("index_params") or {}).get("type") == "hnsw"
+    segments = list(manifest.get("segments") or [])
+    number = max((segment["number"] for segment in segments), default=0) + 1
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    removed = set(removed)
+    attributes = base is None and manifest.get("attributes")
+    known = []
+
+    while segments and _segment_size(segments[-1]) <= len(removed) + len(records):
+        older = segments.pop()
+        path = _segment_path(generation, older["number"], base)
+        older_vectors, older_ids = numpy_index.read_index(path)._matrix()
+        older_records = record_file.RecordFile(path + ".records")
+        # The newer segment's removals apply to what the older one added
+        keep = ~np.isin(older_ids, list(removed))
+        if hnsw:
+            orphans -= int(len(keep) - keep.sum())
+        records = {**{key: data for key, data in older_records.items() if key not in removed}, **records}
+        older_records.close()
+        ids = np.concatenate([older_ids[keep], ids])
+        vectors = np.concatenate([older_vectors[keep], vectors])
+        if attributes:
+            rows = np.load(path + ".attrs.npy")
+            known.append(rows[~np.isin(rows["id"], list(removed))])
+        removed |= set(older["removed"])
+
+    path = _segment_path(generation, number, base)
+    numpy_index.write_index(numpy_index.NumpyIndex(vectors.shape[1], vectors, ids), path)
+    record_file.write(path + ".records", generation, records.items())
+    sources = list(manifest.get("sources") or [])
+    if attributes:
+        known = np.sort(np.concatenate(known), order="id") if known else None
+        with atomic_write(path + ".attrs.npy", "wb") as f:
+            np.save(f, _attribute_rows(records, sources, known))
+
+    segments.append({"number": number, "count": len(records), "removed": sorted(int(key) for key in removed)})
+    previous = manifest
+    manifest = dict(manifest, db_version=version, count=count, orphans=orphans, segments=segments)
+    if attributes:
+        manifest["sources"] = sources
+    if papers is not None:
+        manifest["papers"] = papers
+    with atomic_write(_manifest_path(base), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    keep = {segment["number"] for segment in [*(previous.get("segments") or []), *segments]}
+    _remove_old_segments(generation, keep, base)
+    return manifest
+
+
+def _update(add=(), vectors=None, remove=(), before=None, after=None, version=None):
+    """
+    Add papers (with their embedded vectors) and remove papers (by paper id)
+    in the index. The synced database version moves from `before` to `after`
+    (a gap clears it, so the next search re-syncs), or is set to `version`.
+    """
+    with _updating():
+        _write_changes(remove_ids=[_vector_id(paper_id) for paper_id in remove],
+                       add_ids=[_vector_id(item.get("id")) for item in add], vectors=vectors,
+                       add_records=[_encode_record(item) for item in add], before=before, after=after,
+                       version=version)
+
+
+def _embed_papers(papers, batch_size=None, field="summary"):
+    """
+    Embed the summaries (or another `field`) of papers in batches into one
+    preallocated float32 matrix.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+
+    vectors = None
+    for start in range(0, len(papers), batch_size):
+        # Summaries are read batch by batch, so only one batch of texts is in memory
+        batch = embed_texts([item.get(field) or "" for item in papers[start:start + batch_size]], batch_size)
+        if vectors is None:
+            vectors = np.empty((len(papers), batch.shape[1]), dtype="float32")
+        vectors[start:start + len(batch)] = batch
+    return vectors
+
+
+def _reembedded(records, batch_size=None, field="summary"):
+    """
+    A new index over the entries in `records`, embedded from their `field` with
+    the configured backend. Returns (index, params); (None, None) if there are none.
+    """
+    if not records:
+        return None, None
+    papers = [ReadOnlyRecord(json.loads(data)) for data in records.values()]
+    return _index_from(_embed_papers(papers, batch_size, field), list(records))
+
+
+def reembed(batch_size=None, base=None, field="summary"):
+    """
+    Re-embed the indexed papers with the configured backend, e.g. after
+    PAPERSCOPE_EMBEDDING_MODEL changed. Unlike build_index() the database is not
+    read: the index keeps its papers and synced version. Returns the paper count.
+    """
+    if not _HAS_VECTOR_ENGINE:
+        return 0
+    with _updating(base):
+        manifest, _, current = _load(base=base)
+        if manifest is None:
+            return 0
+        records = dict(current.items())
+        index, params = _reembedded(records, batch_size, field)
+        _write_generation(index, records, manifest["db_version"], manifest["generation"], params, base,
+                          papers=manifest.get("papers"))
+    print(f"Re-embedded {len(records)} entries with '{embedding_backend()['model']}'.")
+    return len(records)
+
+
+def build_index(batch_size=None):
     """
     Build FAISS index from summaries in the local database.
+    The corpus is embedded in batches of `batch_size` (PAPERSCOPE_EMBED_BATCH_SIZE)
+    written straight into one preallocated float32 matrix.
+    Without FAISS there is nothing to build: searches fall back to keyword search.
     """
-    if not _HAS_FAISS:
-        # In demo mode, just save metadata
-        db = load_db()
-        with open("meta.json", "w") as f:
-            json.dump(db, f)
+    if not _HAS_VECTOR_ENGINE:
         return
-    
-    db = load_db()
-    vectors = []
-    metadata = []
-    for item in db:
-        embedding = embed_text(item['summary'])
-        vectors.append(embedding)
-        metadata.append(item)
-    if not vectors:
+
+    version = db_version()
+    db = list(load_db())
+    index, params = None, None
+    if db:
+        # The index type, its training and its parameters follow PAPERSCOPE_VECTOR_INDEX
+        index, params = _index_from(_embed_papers(db, batch_size), [_vector_id(item.get("id")) for item in db])
+    records = {_vector_id(item.get("id")): _encode_record(item) for item in db}
+
+    with _updating():
+        manifest = _read_manifest()
+        _write_generation(index, records, version, manifest["generation"] if manifest else 0, params,
+                          fresh=list(records))
+
+
+def add_papers(papers, before=None, after=None):
+    """
+    Embed and index papers added by the storage write that took the database
+    from version `before` to `after`. Only the new papers are embedded.
+    """
+    papers = list(papers)
+    if not _HAS_VECTOR_ENGINE or not papers:
         return
-    index = faiss.IndexFlatL2(VECTOR_DIM)
-    index.add(np.array(vectors))
-    faiss.write_index(index, VECTOR_INDEX_PATH)
-    with open("meta.json", "w") as f:
-        json.dump(metadata, f)
-
-def search_similar(text, k=5):
-    """
-    Perform vector similarity search using FAISS.
-    """
-    if not _HAS_FAISS:
-        # In demo mode, return simple keyword-based results
-        if not os.path.exists("meta.json"):
-            return []
-        with open("meta.json") as f:
-            metadata = json.load(f)
-        # Simple keyword matching for demo
-        results = []
-        text_lower = text.lower()
-        for item in metadata:
-            if any(word in item.get('summary', '').lower() or word in item.get('title', '').lower() 
-                   for word in text_lower.split()):
-                results.append(item)
-        return results[:k]
-    
-    if not os.path.exists(VECTOR_INDEX_PATH):
+    _update(add=papers, vectors=_embed_papers(papers), before=before, after=after)
+
+
+def remove_papers(paper_ids, before=None, after=None):
+    """
+    Drop the vectors and records of deleted papers, so they no longer show up
+    in search_similar. Nothing is re-embedded.
+    """
+    if not _HAS_VECTOR_ENGINE:
+        return
+    with _updating():
+        if _read_manifest() is None and not os.path.exists(VECTOR_META_PATH):
+            return
+    _update(remove=list(paper_ids), before=before, after=after)
+
+
+def sync():
+    """
+    Bring the index in step with the database: embed the papers it is missing
+    and drop the ones that were deleted. Returns (added, removed).
+    """
+    if not _HAS_VECTOR_ENGINE:
+        return 0, 0
+
+    version = db_version()
+    db = load_db()
+    with _updating():
+        _, records = _current()
+        present = set(records.ids()) if records else set()
+
+    wanted = {_vector_id(item.get("id")): item for item in db}
+    missing = [item for key, item in wanted.items() if key not in present]
+    stale = [json.loads(records.get(key)).get("id") for key in present if key not in wanted]
+    vectors = _embed_papers(missing) if missing else None
+    _update(add=missing, vectors=vectors, remove=stale, version=version)
+    return len(missing), len(stale)
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (path, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class _Searcher:
+    """
+    Keeps the current generation loaded between queries. Every update switches
+    the manifest atomically, so a changed manifest means a new generation: it
+    is loaded and swapped in while queries in flight keep using the old one.
+    """
+
+    def __init__(self, base=lambda: None):
+        # base() is the index's base path, looked up on each call
+        self._base = base
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._state = (None, None, None)
+        self._attributes = (None, None)
+
+    def _stamp_now(self):
+        return (_file_stamp(_manifest_path(self._base())), VECTOR_MMAP)
+
+    def current(self):
+        """
+        The resident (manifest, index, records), reloaded first if the manifest changed.
+        """
+        if self._stamp_now() != self._stamp:
+            with self._lock:
+                if self._stamp_now() != self._stamp:
+                    with _updating(self._base()):
+                        state = _load(mmap=VECTOR_MMAP, base=self._base())
+                        stamp = self._stamp_now()
+                    self._state, self._stamp = state, stamp
+        return self._state
+
+    def attributes(self, manifest, records):
+        """
+        (attribute rows, sources) of the generation of `manifest`, loaded once.
+        A generation written before attributes existed has them computed from
+        its records.
+        """
+        key = (manifest["generation"], [segment["number"] for segment in manifest.get("segments") or []])
+        loaded, attributes = self._attributes
+        if loaded != key:
+            attributes = _layered_attributes(manifest, records, VECTOR_MMAP)
+            self._attributes = (key, attributes)
+        return attributes
+
+
+_searcher = _Searcher()
+
+
+def _bound(value, end=False):
+    """
+    Epoch seconds of a since/until bound. A bare date as the `end` bound
+    covers the whole day.
+    """
+    seconds = _epoch_seconds(value)
+    if seconds is None:
+        raise ValueError(f"Unrecognized date '{value}'. Use a datetime, a date or an ISO string")
+    is_day = isinstance(value, date) and not isinstance(value, datetime) or isinstance(value, str) and len(value) == 10
+    return seconds + 86399 if end and is_day else seconds
+
+
+def _filters(sources=None, since=None, until=None, ids=None):
+    """
+    The filters given, as a dict (None if there are none).
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    filters = {"sources": sources, "since": since, "until": until, "ids": ids}
+    return {key: value for key, value in filters.items() if value is not None} or None
+
+
+def _selection(manifest, records, filters):
+    """
+    Vector ids of the papers that pass `filters`, from the generation's
+    attribute arrays: papers from one of `sources`, with a timestamp between
+    `since` and `until` (inclusive), and among the paper `ids`.
+    """
+    rows, sources = _searcher.attributes(manifest, records)
+    mask = np.ones(len(rows), dtype=bool)
+    if "sources" in filters:
+        wanted = set(filters["sources"])
+        mask &= np.isin(rows["source"], [code for code, source in enumerate(sources) if source in wanted])
+    if "since" in filters or "until" in filters:
+        times = rows["time"]
+        mask &= times != _NO_TIME
+        if "since" in filters:
+            mask &= times >= _bound(filters["since"])
+        if "until" in filters:
+            mask &= times <= _bound(filters["until"], end=True)
+    if "ids" in filters:
+        mask &= np.isin(rows["id"], [_vector_id(paper_id) for paper_id in filters["ids"]])
+    return np.ascontiguousarray(rows["id"][mask], dtype="int64")
+
+
+def _filtered_search(index, manifest, query_vecs, n, selected):
+    """
+    index.search over the vectors in `selected` only, pushed into FAISS with
+    an id selector. Approximate indexes can miss selected vectors outside the
+    IVF lists or the part of the HNSW graph they visit, so the search is widened
+    until every query has min(n, selected) hits; HNSW ends with an exact scan
+    of the selected vectors.
+    """
+    n = min(n, len(selected) + manifest.get("orphans", 0))
+    if n == 0:
+        return np.empty((len(query_vecs), 0), dtype="float32"), np.empty((len(query_vecs), 0), dtype="int64")
+    if isinstance(index, numpy_index.NumpyIndex):
+        return index.search(query_vecs, n, ids=selected)
+    wanted = min(n, len(selected))
+    selector = faiss.IDSelectorBatch(selected)
+    kind = (manifest.get("index_params") or {}).get("type", "flat")
+
+    if kind == "flat":
+        return index.search(query_vecs, n, params=faiss.SearchParameters(sel=selector))
+    if kind in ("ivf", "ivfpq"):
+        ivf = faiss.extract_index_ivf(index)
+        nprobe = ivf.nprobe
+        while True:
+            D, I = index.search(query_vecs, n, params=faiss.SearchParametersIVF(sel=selector, nprobe=nprobe))
+            # With every list probed the search is exhaustive
+            if (I != -1).sum(axis=1).min() >= wanted or nprobe >= ivf.nlist:
+                return D, I
+            nprobe = min(ivf.nlist, nprobe * 4)
+
+    ef = max(faiss.downcast_index(index.index).hnsw.efSearch, n)
+    while ef < index.ntotal:
+        D, I = index.search(query_vecs, n, params=faiss.SearchParametersHNSW(sel=selector, efSearch=ef))
+        if (I != -1).sum(axis=1).min() >= wanted:
+            return D, I
+        ef *= 4
+    D, positions = faiss.knn(query_vecs, _stored_vectors(index, selected), n)
+    return D, np.where(positions >= 0, selected[positions], -1)
+
+
+def _nearest_many(texts, k, offset=0, filters=None):
+    """
+    For each text, hits `offset` to `offset + k` of its nearest papers as
+    (record bytes, distance), closest first, among the papers that pass
+    `filters` (see _selection). All texts are embedded in one batch and
+    searched with one FAISS call. Papers added or deleted since the last
+    update are synced first, and only the hits are read from the records.
+    """
+    manifest, index, records = _searcher.current()
+    if (manifest or {}).get("db_version") != db_version():
+        sync()
+        manifest, index, records = _searcher.current()
+
+    if not records or not texts:
+        return [[] for _ in texts]
+
+    query_vecs = embed_texts(texts)
+    if _embedding_changed(manifest, index, query_vecs.shape[1]):
+        # Built with another model: its vectors cannot be compared with the queries'
+        reembed()
+        manifest, index, records = _searcher.current()
+    if index is None or not index.ntotal:
+        return [[] for _ in texts]
+    # Over-fetch past orphan vectors left by deletions from an HNSW index
+    n = min(offset + k + manifest.get("orphans", 0), index.ntotal)
+    if filters:
+        D, I = _filtered_search(index, manifest, query_vecs, n, _selection(manifest, records, filters))
+    else:
+        D, I = index.search(query_vecs, n)
+    results = []
+    for distances, ids in zip(D, I):
+        hits, seen = [], set()
+        for distance, i in zip(distances, ids):
+            # A paper re-added to an HNSW index also matches through its old vector
+            if i == -1 or int(i) in seen or len(hits) == offset + k:
+                continue
+            seen.add(int(i))
+            data = records.get(int(i))
+            if data is not None:
+                hits.append((data, float(distance)))
+        results.append(hits[offset:])
+    return results
+
+
+def _nearest(text, k, offset=0, filters=None):
+    return _nearest_many([text], k, offset, filters)[0]
+
+
+def _similarity(distance):
+    # Higher is closer, in (0, 1]
+    return 1.0 / (1.0 + distance)
+
+
+def _passes(paper, filters):
+    """
+    Whether a paper passes `filters`; the in-memory counterpart of _selection.
+    """
+    if "sources" in filters and (paper.get("source") or "arxiv") not in filters["sources"]:
+        return False
+    if "ids" in filters and paper.get("id") not in set(filters["ids"]):
+        return False
+    if "since" in filters or "until" in filters:
+        seconds = _epoch_seconds(paper.get("timestamp"))
+        if seconds is None:
+            return False
+        if "since" in filters and seconds < _bound(filters["since"]):
+            return False
+        if "until" in filters and seconds > _bound(filters["until"], end=True):
+            return False
+    return True
+
+
+def _keyword_hits(query, k, offset, filters=None):
+    hits = rank_entries(query, None if filters else offset + k)
+    papers = {paper["id"]: paper for paper in get_entries([paper_id for paper_id, _ in hits])}
+    matching = [(papers[paper_id], score) for paper_id, score in hits
+                if paper_id in papers and (not filters or _passes(papers[paper_id], filters))]
+    return matching[offset:offset + k]
+
+
+def search_similar(text, k=5, offset=0, sources=None, since=None, until=None, ids=None):
+    """
+    Perform vector similarity search using FAISS: results `offset` to
+    `offset + k`, closest first. The index stays loaded between calls.
+    Optional filters restrict the search to papers from `sources` (e.g.
+    "arxiv", "upload"), stored between `since` and `until` (datetimes, dates
+    or ISO strings, inclusive) or among the paper `ids`; they are applied
+    inside the search, so k results come back whenever k papers match.
+    """
+    filters = _filters(sources, since, until, ids)
+    if not _HAS_VECTOR_ENGINE:
+        # In demo mode, fall back to keyword search
+        return [paper for paper, _ in _keyword_hits(text, k, offset, filters)]
+    return [ReadOnlyRecord(json.loads(data)) for data, _ in _nearest(text, k, offset, filters)]
+
+
+def search_similar_many(queries, k=5, offset=0, sources=None, since=None, until=None, ids=None):
+    """
+    search_similar for many queries at once: the queries are embedded in one
+    batched forward pass and searched with one FAISS call over the query matrix.
+    Returns, for each query, its hits `offset` to `offset + k` as
+    (paper, score) pairs, best first; scores are in (0, 1], higher is closer
+    (BM25 scores in demo mode). Filters are as for search_similar.
+    """
+    queries = list(queries)
+    filters = _filters(sources, since, until, ids)
+    if not _HAS_VECTOR_ENGINE:
+        # In demo mode, fall back to keyword search
+        return [_keyword_hits(query, k, offset, filters) for query in queries]
+    return [[(ReadOnlyRecord(json.loads(data)), _similarity(distance)) for data, distance in hits]
+            for hits in _nearest_many(queries, k, offset, filters)]
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="paperscope-hybrid")
+    return _executor
+
+
+def _vector_ranking(text, depth):
+    if not _HAS_VECTOR_ENGINE:
         return []
+    # Distances become similarities so that higher is better in both legs
+    return [(json.loads(data).get("id"), _similarity(distance)) for data, distance in _nearest(text, depth)]
+
 
-    index = faiss.read_index(VECTOR_INDEX_PATH)
-    query_vec = embed_text(text).reshape(1, -1)
-    D, I = index.search(query_vec, k)
-    with open("meta.json") as f:
-        metadata = json.load(f)
-    return [metadata[i] for i in I[0] if i < len(metadata)]
+def _fuse(rankings, weights, fusion):
+    """
+    Combine (paper_id, score) rankings, each best first, into one
+    {paper_id: score}. "rrf" adds weight / (HYBRID_RRF_K + rank) per list;
+    "weighted" adds the weighted scores, min-max normalized per list.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        if fusion == "rrf":
+            for rank, (paper_id, _) in enumerate(ranking, start=1):
+                fused[paper_id] = fused.get(paper_id, 0.0) + weight / (HYBRID_RRF_K + rank)
+        else:
+            if not ranking:
+                continue
+            scores = [score for _, score in ranking]
+            low, span = min(scores), (max(scores) - min(scores)) or 1.0
+            for paper_id, score in ranking:
+                fused[paper_id] = fused.get(paper_id, 0.0) + weight * (score - low) / span
+    return fused
+
+
+def hybrid_search(text, k=5, fusion=None, weight=None, depth=None):
+    """
+    Keyword (BM25) and vector search run concurrently and fused, so exact
+    acronyms and model names match as well as paraphrases. `fusion` is "rrf"
+    (reciprocal rank fusion) or "weighted"; `weight` is the vector leg's share
+    (0..1) and `depth` how many hits each leg contributes.
+    Returns up to k (paper_id, score) pairs, best first, each paper once.
+    """
+    fusion = (fusion or HYBRID_FUSION).lower()
+    if fusion not in HYBRID_FUSIONS:
+        raise ValueError(f"Unknown fusion '{fusion}'. Use one of: {', '.join(HYBRID_FUSIONS)}")
+    weight = HYBRID_VECTOR_WEIGHT if weight is None else weight
+    depth = max(depth or HYBRID_DEPTH, k)
+
+    # The vector leg runs on the pool while this thread runs the keyword leg
+    vector_leg = _pool().submit(_vector_ranking, text, depth)
+    try:
+        lexical = rank_entries(text, depth)
+    except Exception as e:
+        print(f"Warning: Keyword search failed: {str(e)}")
+        lexical = []
+    try:
+        vector = vector_leg.result()
+    except Exception as e:
+        print(f"Warning: Vector search failed: {str(e)}")
+        vector = []
 
+    fused = _fuse([lexical, vector], [1.0 - weight, weight], fusion)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
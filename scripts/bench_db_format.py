@@ -0,0 +1,96 @@
+"""Compare the on-disk database formats: save time, load time and file size.
+
+Run with: python3 scripts/bench_db_format.py [--sizes 1000 10000 100000] [--inline]
+
+Records are synthetic papers in their stored form (body fields as blob digests);
+--inline keeps abstracts and summaries in the record, as older databases do.
+Formats whose optional package is not installed are skipped.
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paperscope import db_format
+
+WORDS = ["model", "learning", "neural", "graph", "transformer", "attention", "data", "training",
+         "network", "optimization", "robust", "inference", "language", "vision", "benchmark",
+         "results"]
+
+
+def _text(i, n):
+    return " ".join(WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(n))
+
+
+def make_papers(count, inline=False):
+    papers = []
+    for i in range(count):
+        paper = {
+            "id": f"http://arxiv.org/abs/24{i % 12 + 1:02d}.{i:05d}v1",
+            "title": _text(i, 9).title(),
+            "authors": [f"Author {i % 97}", f"Author {i % 89}"],
+            "url": f"http://arxiv.org/pdf/24{i % 12 + 1:02d}.{i:05d}v1",
+            "source": "arxiv",
+            "timestamp": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:{i % 60:02d}",
+        }
+        if inline:
+            paper["abstract"] = _text(i, 180)
+            paper["summary"] = _text(i + 1, 60)
+        else:
+            paper["blobs"] = {field: hashlib.sha256(f"{field}{i}".encode()).hexdigest()
+                              for field in ("abstract", "summary")}
+        papers.append(paper)
+    return papers
+
+
+def bench(papers, fmt, compression, path, repeat):
+    save, load = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        raw = db_format.encode(1, len(papers), papers, fmt, compression)
+        with open(path, "wb") as f:
+            f.write(raw)
+        save.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            _, _, loaded = db_format.decode(f.read())
+        load.append(time.perf_counter() - start)
+        assert len(loaded) == len(papers)
+    return min(save), min(load), os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--inline", action="store_true", help="keep body fields inline")
+    args = parser.parse_args()
+
+    combos = [("json", "none"), ("json", "zstd"), ("msgpack", "none"), ("msgpack", "zstd")]
+    available = [(f, c) for f, c in combos
+                 if (f != "msgpack" or db_format._HAS_MSGPACK) and (c != "zstd" or db_format._HAS_ZSTD)]
+    skipped = [f"{f}+{c}" for f, c in combos if (f, c) not in available]
+    if skipped:
+        print(f"Skipping (package not installed): {', '.join(skipped)}")
+
+    print(f"{'records':>8}  {'format':<13} {'save ms':>9} {'load ms':>9} {'size KiB':>10} {'vs json':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "db.bin")
+        for size in args.sizes:
+            papers = make_papers(size, args.inline)
+            baseline = None
+            for fmt, compression in available:
+                save, load, nbytes = bench(papers, fmt, compression, path, args.repeat)
+                baseline = baseline or nbytes
+                name = fmt if compression == "none" else f"{fmt}+{compression}"
+                print(f"{size:>8}  {name:<13} {save * 1000:>9.1f} {load * 1000:>9.1f} "
+                      f"{nbytes / 1024:>10.0f} {nbytes / baseline:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compare the vector index types against the exact flat index: recall, latency and memory.
+
+Run with: python3 scripts/bench_vector_index.py [--count 100000] [--dim 384] [--types ivf ivfpq hnsw numpy]
+
+Vectors are synthetic and clustered like sentence embeddings (normalized, one
+Gaussian blob per topic); queries are perturbed corpus vectors. Each index is
+built with the same factory and parameters as the app (see the PAPERSCOPE_IVF_*,
+PAPERSCOPE_PQ_M and PAPERSCOPE_HNSW_* settings). Recall@k is the share of the
+exact top k found; latency is per single query, as the app searches. "numpy"
+is the exact NumPy engine used where FAISS is not installed.
+"""
+import argparse
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paperscope import numpy_index, vector_store
+
+
+def make_vectors(count, dim, queries, topics=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((topics, dim)).astype("float32")
+    vectors = centers[rng.integers(topics, size=count)] + 0.6 * rng.standard_normal((count, dim)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    picks = vectors[rng.integers(count, size=queries)]
+    query_vectors = picks + 0.1 * rng.standard_normal(picks.shape).astype("float32")
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+
+def bench(kind, vectors, queries, k, truth):
+    ids = np.arange(len(vectors), dtype="int64")
+    start = time.perf_counter()
+    if kind == "numpy":
+        params, index = {"type": "numpy"}, numpy_index.NumpyIndex(vectors.shape[1])
+    else:
+        params = vector_store.index_params(kind, vectors.shape[1], len(vectors))
+        index = vector_store.make_index(vectors.shape[1], vectors, params)
+    index.add_with_ids(vectors, ids)
+    build = time.perf_counter() - start
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, I = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - start)
+        found.append(I[0])
+    found = np.array(found)
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]) if truth is not None else 1.0
+    if kind == "numpy":
+        memory = sum(array.nbytes for array in index._matrix())
+    else:
+        memory = faiss.serialize_index(index).nbytes
+    return params, build, recall, np.percentile(latencies, 50), np.percentile(latencies, 99), memory, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=["ivf", "ivfpq", "hnsw"], choices=vector_store.VECTOR_INDEX_TYPES + ("numpy",))
+    args = parser.parse_args()
+
+    # Benchmark the requested types whatever the corpus size
+    vector_store.VECTOR_ANN_MIN_VECTORS = 0
+    faiss.omp_set_num_threads(1)
+    vectors, queries = make_vectors(args.count, args.dim, args.queries)
+
+    print(f"{args.count} vectors, dim {args.dim}, {args.queries} queries, k={args.k}")
+    print(f"{'index':<32} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'MiB':>8} {'vs flat':>8}")
+    truth, baseline = None, None
+    for kind in ["flat"] + [t for t in args.types if t != "flat"]:
+        params, build, recall, p50, p99, memory, found = bench(kind, vectors, queries, args.k, truth)
+        if truth is None:
+            truth, baseline = found, memory
+        name = "NumPy flat" if kind == "numpy" else vector_store._factory_string(params)
+        print(f"{name:<32} {build:>8.1f} {recall:>7.3f} {p50 * 1000:>8.3f} {p99 * 1000:>8.3f} "
+              f"{memory / 2 ** 20:>8.1f} {memory / baseline:>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Convert the paper database between its on-disk formats.
+
+Run with: python3 scripts/convert_db.py msgpack --compression zstd
+     or:  python3 scripts/convert_db.py json
+
+The database at DB_PATH (from paperscope/config.py) is rewritten in place; the
+append-only log is folded in at the same time. Loading detects the format by
+itself, so nothing else needs to change.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paperscope import db_format, storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert the paper database between JSON and msgpack.")
+    parser.add_argument("format", choices=db_format.FORMATS)
+    parser.add_argument("--compression", choices=db_format.COMPRESSIONS, default="none")
+    args = parser.parse_args()
+
+    before = os.path.getsize(storage.DB_PATH) if os.path.exists(storage.DB_PATH) else 0
+    count = storage.convert_db(args.format, args.compression)
+    fmt, compression = storage._snapshot_format()
+    print(f"Wrote {count} papers to {storage.DB_PATH} as {fmt} ({compression}): "
+          f"{before:,} -> {os.path.getsize(storage.DB_PATH):,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -53,14 +53,9 @@ def run_checks():
                 res = search_similar("demo query")
                 print("FAISS search returned:", res)
             else:
-                print("FAISS not available: performing simulated search by loading meta.json if present")
-                import json
-                if os.path.exists("meta.json"):
-                    with open("meta.json") as f:
-                        meta = json.load(f)
-                    print("Simulated search returned:", meta[:1])
-                else:
-                    print("No meta.json present — simulated search returns empty list")
+                print("FAISS not available: falling back to keyword search")
+                from paperscope.storage import search_entries
+                print("Keyword search returned:", list(search_entries("demo query", limit=1)))
     except Exception as e:
         print("FAISS search: FAIL", e)
         sys.exit(3)
@@ -12,22 +12,29 @@ from fpdf import FPDF
 # Import project modules
 from paperscope.main import fetch_and_summarize, query_db
 from paperscope.pdf_parser import extract_text_from_pdf
-from paperscope.vector_store import build_index, search_similar
+from paperscope.vector_store import build_index, search_similar, hybrid_search, warm_up, model_info
+from paperscope.passage_index import build_index as build_passage_index, search_passages
 
 # Optional: history storage API
 try:
-    from paperscope.storage import get_history, clear_history, delete_entry, save_history_entry
+    from paperscope.storage import get_history, count_history, clear_history, delete_entry, save_history_entry, get_entries, find_duplicate
     STORAGE_AVAILABLE = True
 except ImportError:
     STORAGE_AVAILABLE = False
-    def get_history():
+    def get_history(limit=None, offset=0, sort="newest", query=None):
         return []
+    def count_history(query=None, since=None):
+        return 0
     def clear_history():
         pass
     def delete_entry(entry_id):
         return False
     def save_history_entry(entry):
         pass
+    def get_entries(paper_ids):
+        return []
+    def find_duplicate(entry):
+        return None
 
 # Check for demo mode
 DEMO_MODE = os.getenv("DEMO_MODE", "").lower() in ("1", "true", "yes")
@@ -39,6 +46,13 @@ else:
 # Application configuration
 st.set_page_config(page_title="PaperScope", page_icon="📄", layout="wide")
 
+# Papers rendered per page in the History section
+HISTORY_PAGE_SIZE = 20
+
+# Semantic search results per page, and how many pages can be requested
+SEMANTIC_PAGE_SIZE = 5
+SEMANTIC_MAX_PAGES = 20
+
 # ---------------------------------------------------------------------
 # Utility helpers
 # ---------------------------------------------------------------------
@@ -676,7 +690,7 @@ if option == "Search arXiv Papers":
                         
                         if data:
                             st.success(f"Found and processed {len(data)} paper(s)")
-                            for idx, item in enumerate(data[-10:][::-1]):
+                            for idx, item in enumerate(data[:10]):
                                 with st.expander(f"{item.get('title', 'Untitled Paper')}"):
                                     st.markdown("**Summary:**")
                                     st.write(item.get("summary", "No summary available"))
@@ -830,12 +844,18 @@ elif option == "Upload & Summarize PDF":
                 st.error("No text extracted from PDF. The file may be scanned or encrypted")
                 st.stop()
 
-        with st.spinner("Generating AI-powered summary..."):
-            try:
-                summary_text = summarize(extracted_text)
-            except Exception as e:
-                st.error(f"Summarization failed: {e}")
-                st.stop()
+        # The same paper stored before (from arXiv or an earlier upload) is not summarized again
+        duplicate = find_duplicate({"text": extracted_text})
+        if duplicate is not None:
+            st.info(f"This paper is already stored as '{duplicate.get('title') or duplicate.get('id')}'; showing its saved summary")
+            summary_text = duplicate.get("summary")
+        else:
+            with st.spinner("Generating AI-powered summary..."):
+                try:
+                    summary_text = summarize(extracted_text)
+                except Exception as e:
+                    st.error(f"Summarization failed: {e}")
+                    st.stop()
 
         if not validate_summary(summary_text):
             st.error("Generated an empty summary. Try again or adjust summarizer settings")
@@ -846,13 +866,14 @@ elif option == "Upload & Summarize PDF":
         st.write(summary_text)
 
         # Save to history
-        if STORAGE_AVAILABLE:
+        if STORAGE_AVAILABLE and duplicate is None:
             try:
                 history_entry = {
                     "id": f"local-{uuid.uuid4().hex[:8]}",
                     "title": uploaded_file.name,
                     "abstract": "",
                     "summary": summary_text,
+                    "text": extracted_text,
                     "timestamp": datetime.now().isoformat(),
                     "source": "upload",
                     "annotations": ""
@@ -914,6 +935,15 @@ elif option == "Upload & Summarize PDF":
 elif option == "Semantic Search (FAISS)":
     st.markdown('<div class="section-wrapper">', unsafe_allow_html=True)
     st.markdown('<div class="section-title">Semantic Search (FAISS)</div>', unsafe_allow_html=True)
+
+    # Load the embedding model once, before the first query (the model is shared process-wide)
+    if not DEMO_MODE and not st.session_state.get("embedding_model_warmed"):
+        st.session_state["embedding_model_warmed"] = True
+        with st.spinner("Loading embedding model..."):
+            warm_up()
+    info = model_info()
+    if info:
+        st.caption(f"Embedding model: {info['name']}, {info['dim']} dimensions (loaded in {info['load_seconds']:.1f}s)")
     
     if st.button("Rebuild Index"):
         if DEMO_MODE:
@@ -922,6 +952,7 @@ elif option == "Semantic Search (FAISS)":
             with st.spinner("Rebuilding semantic vector index..."):
                 try:
                     build_index()
+                    build_passage_index()
                     st.success("Index rebuilt successfully")
                 except Exception as e:
                     st.error(f"Failed to rebuild index: {e}")
@@ -930,62 +961,99 @@ elif option == "Semantic Search (FAISS)":
         "Enter a semantic query",
         placeholder="e.g., visual prompt tuning in robotics"
     )
+    search_mode = st.radio(
+        "Match against",
+        ["Summaries", "Summaries + exact keywords (hybrid)", "Full-text passages"],
+        horizontal=True,
+        help="Hybrid also ranks papers containing the exact terms (acronyms, model names); "
+             "passages search the full text of stored papers"
+    )
+    # Filters only apply to the summary search; the other modes rank without them
+    filter_sources, filter_dates = [], ()
+    if search_mode == "Summaries":
+        with st.expander("Filters"):
+            filter_sources = st.multiselect("Sources", ["arxiv", "upload", "uploaded_pdf", "manual"], default=[])
+            filter_dates = st.date_input("Stored between", value=(), help="Leave empty for any date")
 
     if st.button("Search with FAISS"):
         if not semantic_query or semantic_query.strip() == "":
             st.warning("Please enter a semantic query")
+            st.session_state.pop("semantic_search", None)
         else:
-            with st.spinner("Running semantic search..."):
-                try:
-                    results = search_similar(semantic_query)
-                    
-                    if not results:
-                        st.info("No similar results found")
-                    else:
-                        st.success(f"Found {len(results)} similar items")
-                        for idx, item in enumerate(results):
-                            with st.expander(f"{item.get('title', 'Untitled')}", expanded=(idx == 0)):
-                                st.markdown("**Summary:**")
-                                st.write(item.get('summary', 'No summary available'))
+            # Kept across reruns so the results can be paged
+            dates = tuple(filter_dates) if isinstance(filter_dates, (list, tuple)) else (filter_dates,)
+            filters = {
+                "sources": filter_sources or None,
+                "since": dates[0] if dates else None,
+                "until": dates[-1] if dates else None,
+            }
+            st.session_state["semantic_search"] = (semantic_query, search_mode, filters)
 
-                                download_col1, download_col2, download_col3 = st.columns([1, 1, 1])
-                                summary_text = item.get('summary', '')
-                                md_bytes = f"# {item.get('title', '')}\n\n{summary_text}".encode("utf-8")
-                                txt_bytes = summary_text.encode("utf-8")
-                                pdf_buf = generate_pdf_from_text(
-                                    title=item.get('title', 'Summary'),
-                                    metadata={"id": item.get('id', '')},
-                                    body_text=summary_text,
-                                    annotations=item.get('annotations', '')
+    if st.session_state.get("semantic_search"):
+        query, query_mode, filters = st.session_state["semantic_search"]
+        # Each page is its own search for the next SEMANTIC_PAGE_SIZE hits
+        page = int(st.number_input("Results page", min_value=1, max_value=SEMANTIC_MAX_PAGES, value=1, step=1))
+        offset = (page - 1) * SEMANTIC_PAGE_SIZE
+        with st.spinner("Running semantic search..."):
+            try:
+                if query_mode == "Full-text passages":
+                    results = search_passages(query, k=offset + SEMANTIC_PAGE_SIZE)[offset:]
+                elif query_mode == "Summaries + exact keywords (hybrid)":
+                    hits = hybrid_search(query, k=offset + SEMANTIC_PAGE_SIZE)[offset:]
+                    results = get_entries([paper_id for paper_id, _ in hits])
+                else:
+                    results = search_similar(query, k=SEMANTIC_PAGE_SIZE, offset=offset, **filters)
+                
+                if not results:
+                    st.info("No similar results found" if page == 1 else "No more results")
+                else:
+                    st.success(f"Showing results {offset + 1}-{offset + len(results)}")
+                    for idx, item in enumerate(results, start=offset):
+                        with st.expander(f"{item.get('title', 'Untitled')}", expanded=(idx == 0)):
+                            if item.get('passage'):
+                                st.markdown(f"**Matching passage** ({item.get('passage_section') or 'text'}):")
+                                st.caption(item['passage'])
+                            st.markdown("**Summary:**")
+                            st.write(item.get('summary', 'No summary available'))
+
+                            download_col1, download_col2, download_col3 = st.columns([1, 1, 1])
+                            summary_text = item.get('summary', '')
+                            md_bytes = f"# {item.get('title', '')}\n\n{summary_text}".encode("utf-8")
+                            txt_bytes = summary_text.encode("utf-8")
+                            pdf_buf = generate_pdf_from_text(
+                                title=item.get('title', 'Summary'),
+                                metadata={"id": item.get('id', '')},
+                                body_text=summary_text,
+                                annotations=item.get('annotations', '')
+                            )
+                            
+                            with download_col1:
+                                st.download_button(
+                                    label="TXT",
+                                    data=txt_bytes,
+                                    file_name=f"{safe_filename(item.get('title', 'summary'))}.txt",
+                                    mime="text/plain",
+                                    key=f"faiss_txt_{idx}"
+                                )
+                            with download_col2:
+                                st.download_button(
+                                    label="MD",
+                                    data=md_bytes,
+                                    file_name=f"{safe_filename(item.get('title', 'summary'))}.md",
+                                    mime="text/markdown",
+                                    key=f"faiss_md_{idx}"
+                                )
+                            with download_col3:
+                                st.download_button(
+                                    label="PDF",
+                                    data=pdf_buf,
+                                    file_name=f"{safe_filename(item.get('title', 'summary'))}.pdf",
+                                    mime="application/pdf",
+                                    key=f"faiss_pdf_{idx}"
                                 )
-                                
-                                with download_col1:
-                                    st.download_button(
-                                        label="TXT",
-                                        data=txt_bytes,
-                                        file_name=f"{safe_filename(item.get('title', 'summary'))}.txt",
-                                        mime="text/plain",
-                                        key=f"faiss_txt_{idx}"
-                                    )
-                                with download_col2:
-                                    st.download_button(
-                                        label="MD",
-                                        data=md_bytes,
-                                        file_name=f"{safe_filename(item.get('title', 'summary'))}.md",
-                                        mime="text/markdown",
-                                        key=f"faiss_md_{idx}"
-                                    )
-                                with download_col3:
-                                    st.download_button(
-                                        label="PDF",
-                                        data=pdf_buf,
-                                        file_name=f"{safe_filename(item.get('title', 'summary'))}.pdf",
-                                        mime="application/pdf",
-                                        key=f"faiss_pdf_{idx}"
-                                    )
 
-                except Exception as e:
-                    st.error(f"Semantic search failed: {e}")
+            except Exception as e:
+                st.error(f"Semantic search failed: {e}")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -998,28 +1066,20 @@ elif option == "History":
     st.markdown('<div class="caption-text">View, filter, and download previously processed papers</div>', unsafe_allow_html=True)
     
     try:
-        history = get_history() or []
+        total_papers = count_history()
     except Exception:
-        history = []
+        total_papers = 0
     
-    if history:
+    if total_papers:
         metric_col1, metric_col2, metric_col3 = st.columns(3)
         with metric_col1:
-            st.metric("Total Papers", len(history))
+            st.metric("Total Papers", total_papers)
         with metric_col2:
-            today = datetime.now().date()
-            today_count = sum(
-                1 for item in history
-                if to_date(item.get("timestamp")) == today
-            )
-            st.metric("Added Today", today_count)
+            today_start = datetime.combine(datetime.now().date(), datetime.min.time())
+            st.metric("Added Today", count_history(since=today_start.isoformat()))
         with metric_col3:
             week_ago = datetime.now() - timedelta(days=7)
-            week_count = sum(
-                1 for item in history
-                if parse_iso(item.get("timestamp")) > week_ago
-            )
-            st.metric("Last 7 Days", week_count)
+            st.metric("Last 7 Days", count_history(since=week_ago.isoformat()))
         st.markdown("---")
     
     col_filter, col_sort, col_action = st.columns([3, 2, 1])
@@ -1043,29 +1103,33 @@ elif option == "History":
     
     st.markdown("---")
     
-    if not history:
+    if not total_papers:
         st.info("No papers in history yet. Start by searching or uploading papers!")
     else:
-        filtered = history
-        if search_filter and search_filter.strip():
-            q = search_filter.lower()
-            filtered = [
-                item for item in filtered
-                if q in (item.get('title', '').lower() + 
-                        item.get('abstract', '').lower() + 
-                        item.get('summary', '').lower())
-            ]
+        sort_key = {"Newest First": "newest", "Oldest First": "oldest", "Title A-Z": "title"}.get(sort_order, "newest")
+        try:
+            filtered_count = count_history(query=search_filter)
+        except Exception as e:
+            st.error(f"Failed to load history: {e}")
+            filtered_count = 0
         
-        if sort_order == "Newest First":
-            filtered = sorted(filtered, key=lambda x: x.get('timestamp', ''), reverse=True)
-        elif sort_order == "Oldest First":
-            filtered = sorted(filtered, key=lambda x: x.get('timestamp', ''))
-        elif sort_order == "Title A-Z":
-            filtered = sorted(filtered, key=lambda x: x.get('title', '').lower())
+        # Only one page of papers is loaded and rendered per run
+        page_count = max(1, -(-filtered_count // HISTORY_PAGE_SIZE))
+        page = 1
+        if page_count > 1:
+            page = int(st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, step=1))
+        offset = (page - 1) * HISTORY_PAGE_SIZE
         
-        st.caption(f"Showing {len(filtered)} paper(s)")
+        page_items = []
+        if filtered_count:
+            page_items = get_history(limit=HISTORY_PAGE_SIZE, offset=offset, sort=sort_key, query=search_filter)
+        
+        if page_items:
+            st.caption(f"Showing {offset + 1}-{offset + len(page_items)} of {filtered_count} paper(s)")
+        else:
+            st.caption("Showing 0 paper(s)")
         
-        for idx, item in enumerate(filtered):
+        for idx, item in enumerate(page_items, start=offset):
             with st.expander(f"{item.get('title', 'Untitled Paper')}", expanded=(idx == 0)):
                 top_col1, top_col2, top_col3 = st.columns([4, 1, 1])
                 
@@ -0,0 +1,157 @@
+import json
+import sys
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+# -----------------------------------------------------------------------------
+# Add project root to import path
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# -----------------------------------------------------------------------------
+# paperscope.config holds credentials and is not committed; stub it
+# -----------------------------------------------------------------------------
+if "paperscope.config" not in sys.modules:
+    m_config = ModuleType("paperscope.config")
+    m_config.DB_PATH = "db.json"
+    m_config.API_KEY = ""
+    m_config.MODEL = ""
+    sys.modules["paperscope.config"] = m_config
+
+from paperscope import chunking, passage_index, vector_store
+from paperscope.storage import ReadOnlyRecord
+
+FILLER = " ".join(f"Sentence {i} discusses general background on learning systems." for i in range(40))
+
+
+def _paper(paper_id, detail):
+    text = f"A Paper\nAbstract\nWe study learning.\n\n1 Introduction\n{FILLER}\n\n4 Experiments\n{detail}\n\nReferences\n[1] Cited work on {detail}\n"
+    return {"id": paper_id, "title": paper_id, "summary": "A paper about learning.", "text": text}
+
+
+@pytest.fixture
+def passages(monkeypatch, tmp_path):
+    """Passage index in tmp_path over in-memory papers, embedded with the hashing encoder."""
+    faiss = pytest.importorskip("faiss")
+    np = pytest.importorskip("numpy")
+    monkeypatch.setattr(vector_store, "faiss", faiss)
+    monkeypatch.setattr(vector_store, "np", np)
+    monkeypatch.setattr(vector_store, "_HAS_VECTOR_ENGINE", True)
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL", "hashing")
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_PATH", str(tmp_path / "faiss.index"))
+    monkeypatch.setattr(passage_index, "_searcher", vector_store._Searcher(passage_index._base))
+    papers = [_paper("annealing", "The quantum annealing schedule was tuned per instance."),
+              _paper("pruning", "Magnitude pruning removed half of the convolution filters."),
+              _paper("tokens", "A byte-level tokenizer handled rare scripts.")]
+    monkeypatch.setattr(passage_index, "load_db", lambda: tuple(papers))
+    monkeypatch.setattr(passage_index, "db_version", lambda: 1)
+    monkeypatch.setattr(passage_index, "get_entries",
+                        lambda ids: [ReadOnlyRecord(p) for i in ids for p in papers if p["id"] == i])
+    return papers
+
+
+# =========================
+#       TESTS
+# =========================
+def test_chunks_follow_sections_and_overlap():
+    chunks = list(chunking.chunk_text(_paper("p", "Final detail.")["text"], size=300, overlap=80))
+
+    assert [c["section"] for c in chunks][:2] == ["", "Abstract"]
+    assert chunks[-1] == {"section": "4 Experiments", "text": "Final detail."}
+    assert all(len(c["text"]) <= 300 for c in chunks)
+    assert not any("Cited work" in c["text"] for c in chunks)
+    intro = [c["text"] for c in chunks if c["section"] == "1 Introduction"]
+    assert len(intro) > 2
+    # Consecutive windows share their boundary sentences
+    assert intro[1].split(". ")[0] in intro[0]
+
+
+def test_search_finds_papers_by_passages_in_the_body(passages):
+    passage_index.build_index()
+
+    results = passage_index.search_passages("quantum annealing schedule", k=2)
+    assert results[0]["id"] == "annealing"
+    assert results[0]["passage_section"] == "4 Experiments"
+    assert "annealing schedule" in results[0]["passage"]
+    assert len({r["id"] for r in results}) == len(results) == 2
+
+
+def test_passages_are_embedded_in_bounded_batches(passages, monkeypatch):
+    sizes = []
+    real_embed = vector_store.embed_texts
+    monkeypatch.setattr(vector_store, "embed_texts", lambda texts, batch_size=None: sizes.append(len(texts)) or real_embed(texts))
+    passage_index.build_index(batch_size=4)
+
+    manifest, index, records = vector_store._load(base=passage_index._base())
+    assert max(sizes) == 4 and sum(sizes) == len(records) == index.ntotal
+    assert manifest["embedding"]["model"] == "hashing-512"
+
+
+def test_added_and_removed_papers_update_their_passages(passages, monkeypatch):
+    passage_index.build_index()
+    _, _, records = vector_store._load(base=passage_index._base())
+    before = len(records)
+
+    new = _paper("graphs", "Message passing over molecular graphs predicted solubility.")
+    passages.append(new)
+    passage_index.add_papers([new], before=1, after=2)
+    monkeypatch.setattr(passage_index, "db_version", lambda: 2)
+    assert passage_index.search_passages("molecular graphs solubility", k=1)[0]["id"] == "graphs"
+
+    passage_index.remove_papers(["graphs"], before=2, after=3)
+    monkeypatch.setattr(passage_index, "db_version", lambda: 3)
+    _, _, records = vector_store._load(base=passage_index._base())
+    assert len(records) == before
+    assert passage_index._paper_passage_ids(dict(records.items()), "graphs") == []
+
+
+def test_added_papers_are_written_batch_by_batch(passages, monkeypatch):
+    passage_index.build_index()
+    writes = []
+    real_write = vector_store._write_changes
+    monkeypatch.setattr(vector_store, "_write_changes", lambda *args, **kwargs: writes.append(len(args[1])) or real_write(*args, **kwargs))
+    monkeypatch.setattr(vector_store, "EMBED_BATCH_SIZE", 4)
+
+    new = _paper("graphs", "Message passing over molecular graphs predicted solubility.")
+    passages.append(new)
+    passage_index.add_papers([new], before=1, after=2)
+
+    manifest, _, records = vector_store._load(base=passage_index._base())
+    assert len(writes) > 1 and max(writes) == 4
+    assert sum(writes) == len(passage_index._paper_passage_ids(dict(records.items()), "graphs"))
+    assert manifest["papers"] == sorted(p["id"] for p in passages) and manifest["db_version"] == 2
+
+
+def test_interrupted_update_is_synced_again(passages, monkeypatch):
+    passage_index.build_index()
+    monkeypatch.setattr(vector_store, "EMBED_BATCH_SIZE", 2)
+    real_embed = vector_store.embed_texts
+    calls = []
+
+    def failing(texts, batch_size=None):
+        calls.append(len(texts))
+        if len(calls) == 3:
+            raise OSError("interrupted")
+        return real_embed(texts)
+
+    monkeypatch.setattr(vector_store, "embed_texts", failing)
+    new = _paper("graphs", "Message passing over molecular graphs predicted solubility.")
+    passages.append(new)
+    with pytest.raises(OSError):
+        passage_index.add_papers([new], before=1, after=2)
+    # The first batch was written, but the paper is not listed as indexed
+    manifest, _, records = vector_store._load(base=passage_index._base())
+    assert passage_index._paper_passage_ids(dict(records.items()), "graphs")
+    assert "graphs" not in manifest["papers"] and manifest["db_version"] == 1
+
+    monkeypatch.setattr(vector_store, "embed_texts", real_embed)
+    monkeypatch.setattr(passage_index, "db_version", lambda: 2)
+    assert passage_index.sync() == (1, 0)
+    _, _, records = vector_store._load(base=passage_index._base())
+    stored = [json.loads(records.get(key))["n"] for key in passage_index._paper_passage_ids(dict(records.items()), "graphs")]
+    assert stored == list(range(len(list(chunking.chunk_text(new["text"])))))
+    assert passage_index.sync() == (0, 0)
@@ -0,0 +1,630 @@
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from types import ModuleType
+
+import pytest
+
+# -----------------------------------------------------------------------------
+# Add project root to import path
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# -----------------------------------------------------------------------------
+# paperscope.config holds credentials and is not committed; stub it
+# -----------------------------------------------------------------------------
+if "paperscope.config" not in sys.modules:
+    m_config = ModuleType("paperscope.config")
+    m_config.DB_PATH = "db.json"
+    m_config.API_KEY = ""
+    m_config.MODEL = ""
+    sys.modules["paperscope.config"] = m_config
+
+from paperscope import (
+    blob_store,
+    db_format,
+    dedup,
+    embedding_cache,
+    paper_ids,
+    storage,
+    storage_sqlite,
+    text_index,
+    vector_store,
+)
+from paperscope.file_utils import file_lock
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Point the storage module at an empty database in tmp_path."""
+    db_path = tmp_path / "db.json"
+    monkeypatch.setattr(storage, "DB_PATH", str(db_path))
+    monkeypatch.setattr(storage, "LOG_PATH", str(db_path) + ".log")
+    monkeypatch.setattr(storage, "LOCK_PATH", str(db_path) + ".lock")
+    monkeypatch.setattr(text_index, "TEXT_INDEX_PATH", str(tmp_path / "db.index.sqlite3"))
+    monkeypatch.setattr(dedup, "DEDUP_INDEX_PATH", str(tmp_path / "db.minhash.sqlite3"))
+    monkeypatch.setattr(blob_store, "BLOB_DIR", str(tmp_path / "db.blobs"))
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_PATH", str(tmp_path / "faiss.index"))
+    monkeypatch.setattr(vector_store, "VECTOR_META_PATH", str(tmp_path / "meta.json"))
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path / "db.embeddings"))
+    monkeypatch.setattr(storage, "_state", None)
+    return db_path
+
+
+@pytest.fixture
+def sqlite_db(db, monkeypatch):
+    """Select the SQLite backend, backed by a file next to the JSON DB."""
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_migration_checked", False)
+    monkeypatch.setattr(storage_sqlite, "SQLITE_PATH", str(db.with_suffix(".sqlite3")))
+    return db
+
+
+def _paper(pid, ts="2024-01-01T00:00:00"):
+    return {"id": pid, "title": f"Paper {pid}", "summary": f"summary {pid}", "timestamp": ts}
+
+
+# =========================
+#       TESTS
+# =========================
+def test_add_entry_appends_without_rewriting_snapshot(db):
+    storage.save_db([_paper("a")])
+    snapshot = db.read_text(encoding="utf-8")
+
+    assert storage.add_entry(_paper("b"))
+    assert not storage.add_entry(_paper("b"))
+
+    assert db.read_text(encoding="utf-8") == snapshot
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+
+
+def test_delete_entry_writes_tombstone(db):
+    storage.save_db([_paper("a"), _paper("b")])
+
+    assert storage.delete_entry("a")
+    assert not storage.delete_entry("missing")
+    assert [p["id"] for p in storage.load_db()] == ["b"]
+
+
+def test_compact_folds_log_into_snapshot(db):
+    storage.add_entry(_paper("a"))
+    storage.add_entry(_paper("b"))
+    storage.delete_entry("a")
+
+    assert storage.compact() == 1
+    assert storage._read_log()[1] == []
+    assert [p["id"] for p in storage.load_db()] == ["b"]
+
+
+def test_torn_log_tail_is_ignored(db):
+    storage.add_entry(_paper("a"))
+    with open(storage.LOG_PATH, "a", encoding="utf-8") as f:
+        f.write('{"op": "put", "entry": {"id": "b"')
+
+    assert [p["id"] for p in storage.load_db()] == ["a"]
+
+
+def test_log_left_by_an_interrupted_compaction_is_ignored(db):
+    storage.add_entry(_paper("a"))
+    stale_log = Path(storage.LOG_PATH).read_bytes()
+    storage.compact()
+    # A crash between replacing the snapshot and the log leaves the old log behind
+    Path(storage.LOG_PATH).write_bytes(stale_log)
+
+    assert [p["id"] for p in storage.load_db()] == ["a"]
+    assert storage.add_entry(_paper("b"))
+    storage._written()
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+
+
+def test_readers_are_not_blocked_by_a_waiting_writer(db):
+    storage.add_entry(_paper("a"))
+    seen = []
+
+    def read():
+        storage._written()
+        seen.extend(p["id"] for p in storage.load_db())
+
+    # Another process holds the write lock; a writer here queues behind it
+    with file_lock(storage.LOCK_PATH):
+        writer = threading.Thread(target=storage.add_entry, args=(_paper("b"),))
+        writer.start()
+        time.sleep(0.1)
+        reader = threading.Thread(target=read)
+        reader.start()
+        reader.join(timeout=5)
+        assert not reader.is_alive()
+    writer.join()
+
+    assert seen == ["a"]
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+
+
+def test_readers_are_not_blocked_by_a_writer_in_progress(db, monkeypatch):
+    storage.add_entry(_paper("a"))
+    appending, release = threading.Event(), threading.Event()
+    real_append = storage._append_log
+
+    def slow_append(records, generation):
+        appending.set()
+        release.wait(5)
+        real_append(records, generation)
+
+    monkeypatch.setattr(storage, "_append_log", slow_append)
+    writer = threading.Thread(target=storage.add_entry, args=(_paper("b"),))
+    writer.start()
+    assert appending.wait(5)
+    seen = []
+    reader = threading.Thread(target=lambda: seen.append(([p["id"] for p in storage.load_db()],
+                                                          storage.db_version(), storage.find_paper("a")["id"])))
+    reader.start()
+    reader.join(timeout=5)
+    assert not reader.is_alive()
+    release.set()
+    writer.join()
+
+    assert seen == [(["a"], 1, "a")]
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"] and storage.db_version() == 2
+
+
+def test_add_entries_dedups_with_one_write(db):
+    storage.add_entry(_paper("a"))
+    batch = [_paper("a"), _paper("b"), _paper("b"), {"id": "c", "title": "no timestamp"}]
+
+    assert storage.add_entries(batch) == 2
+    assert [p["id"] for p in storage.load_db()] == ["a", "b", "c"]
+    assert "timestamp" in storage.load_db()[-1]
+    assert len(storage._read_log()[1]) == 3
+
+
+def test_get_history_newest_first(db):
+    storage.add_entry(_paper("old", "2023-01-01T00:00:00"))
+    storage.add_entry(_paper("new", "2024-01-01T00:00:00"))
+
+    assert [p["id"] for p in storage.get_history()] == ["new", "old"]
+    assert [p["id"] for p in storage.get_history(limit=1)] == ["new"]
+
+
+def test_load_db_is_cached_and_read_only(db):
+    storage.add_entry(_paper("a"))
+
+    first = storage.load_db()
+    assert storage.load_db() is first
+    with pytest.raises(TypeError):
+        first[0]["title"] = "changed"
+
+    storage.add_entry(_paper("b"))
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+
+
+def test_load_db_sees_writes_from_other_processes(db):
+    storage.save_db([_paper("a")])
+    assert len(storage.load_db()) == 1
+
+    # Simulate another process appending to the log behind our back
+    with open(storage.LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"op": "put", "entry": _paper("b")}) + "\n")
+
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+
+
+def test_save_db_rejects_stale_version(db):
+    storage.save_db([_paper("a")])
+    version = storage.db_version()
+    storage.add_entry(_paper("b"))
+
+    with pytest.raises(storage.ConcurrentModificationError):
+        storage.save_db([_paper("c")], expected_version=version)
+    storage.save_db([_paper("c")], expected_version=storage.db_version())
+    assert [p["id"] for p in storage.load_db()] == ["c"]
+
+
+def test_corrupt_snapshot_is_never_overwritten(db):
+    db.write_text('[{"id": "a"', encoding="utf-8")
+
+    with pytest.raises(storage.StorageError):
+        storage.add_entry(_paper("b"))
+    assert db.read_text(encoding="utf-8") == '[{"id": "a"'
+
+
+def test_json_that_is_not_a_database_is_refused(db):
+    db.write_text('"papers"', encoding="utf-8")
+
+    with pytest.raises(storage.StorageError):
+        storage.load_db()
+
+
+def _add_many(worker):
+    storage.add_entries([_paper(f"{worker}-{i}") for i in range(10)])
+    for i in range(10, 20):
+        storage.add_entry(_paper(f"{worker}-{i}"))
+    storage.compact()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                    reason="needs fork to share the patched storage paths")
+def test_concurrent_writer_processes_lose_nothing(db):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_add_many, args=(w,)) for w in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+
+    assert all(p.exitcode == 0 for p in workers)
+    assert len(storage.load_db()) == 80
+
+
+def test_search_entries_ranks_multi_term_queries(db):
+    storage.add_entries([
+        {"id": "a", "title": "Robot learning", "summary": "reinforcement learning for robots"},
+        {"id": "b", "title": "Vision", "summary": "contrastive learning of visual features"},
+        {"id": "c", "title": "Graphs", "summary": "message passing networks"},
+    ])
+
+    assert [p["id"] for p in storage.search_entries("robot reinforcement")] == ["a"]
+    assert next(p["id"] for p in storage.search_entries("contrastive learning")) == "b"
+
+    # The index follows incremental deletes
+    storage.delete_entry("b")
+    assert [p["id"] for p in storage.search_entries("contrastive")] == []
+
+
+def test_search_entries_rebuilds_a_stale_index(db):
+    storage.add_entry({"id": "a", "title": "Diffusion models", "summary": "denoising"})
+    text_index.remove_papers(["a"], None, None)
+
+    assert [p["id"] for p in storage.search_entries("diffusion")] == ["a"]
+
+
+def test_get_history_pages_sorts_and_filters(db):
+    storage.add_entries([
+        {"id": f"p{i}", "title": f"Paper {9 - i}", "summary": "robot learning" if i % 2 else "vision",
+         "timestamp": f"2024-01-0{i + 1}T00:00:00"}
+        for i in range(9)
+    ])
+
+    assert [p["id"] for p in storage.get_history(limit=3, offset=3)] == ["p5", "p4", "p3"]
+    assert [p["id"] for p in storage.get_history(limit=2, sort="oldest")] == ["p0", "p1"]
+    assert [p["id"] for p in storage.get_history(limit=2, sort="title")] == ["p8", "p7"]
+
+    # Filters match every word, by prefix
+    assert storage.count_history(query="robot learn") == 4
+    assert [p["id"] for p in storage.get_history(limit=2, offset=1, query="robot")] == ["p5", "p3"]
+    assert storage.count_history(since="2024-01-08T00:00:00") == 2
+    assert storage.count_history(query="vision", since="2024-01-05T00:00:00") == 3
+
+
+def test_large_fields_live_in_blob_store(db):
+    abstract = "transformers " * 100
+    storage.add_entries([
+        {"id": "a", "title": "A", "abstract": abstract, "summary": "short"},
+        {"id": "b", "title": "B", "abstract": abstract, "summary": "short"},
+    ])
+
+    # Only digests are stored inline, and the shared text is stored once
+    assert abstract not in db.with_suffix(".json.log").read_text(encoding="utf-8")
+    assert len([p for p in Path(blob_store.BLOB_DIR).rglob("*") if p.is_file()]) == 1
+
+    record = storage.get_entries(["a"])[0]
+    assert record["abstract"] == abstract
+    assert "blobs" not in record
+    assert json.loads(json.dumps(record)) == {"id": "a", "title": "A", "abstract": abstract,
+                                              "summary": "short", "timestamp": record["timestamp"]}
+    assert {p["id"] for p in storage.search_entries("transformers")} == {"a", "b"}
+
+
+def test_compact_moves_inline_bodies_and_collects_garbage(db):
+    summary = "diffusion " * 100
+    db.write_text(json.dumps([{"id": "a", "summary": summary}]), encoding="utf-8")
+
+    storage.compact()
+    assert summary not in db.read_text(encoding="utf-8")
+    assert storage.load_db()[0]["summary"] == summary
+
+    storage.delete_entry("a")
+    storage.compact()
+    assert blob_store.collect_garbage(set(), grace_seconds=-1) == 1
+
+
+def test_convert_db_round_trips_binary_formats(db):
+    pytest.importorskip("msgpack")
+    pytest.importorskip("zstandard")
+    storage.save_db([_paper("a"), {**_paper("b"), "summary": "ü" * 300}])
+    storage.add_entry(_paper("c"))
+
+    assert storage.convert_db("msgpack", "zstd") == 3
+    assert db.read_bytes().startswith(db_format.ZSTD_MAGIC)
+    assert storage._snapshot_format() == ("msgpack", "zstd")
+
+    # A fresh process detects the format, and later compactions keep it
+    storage._written()
+    assert [p["id"] for p in storage.load_db()] == ["a", "b", "c"]
+    assert storage.load_db()[1]["summary"] == "ü" * 300
+    storage.compact()
+    assert storage._snapshot_format() == ("msgpack", "zstd")
+
+    assert storage.convert_db("json") == 3
+    assert json.loads(db.read_text(encoding="utf-8"))["papers"][0]["id"] == "a"
+
+
+def test_truncated_binary_snapshot_is_an_error(db):
+    pytest.importorskip("msgpack")
+    storage.save_db([_paper("a"), _paper("b")])
+    storage.convert_db("msgpack")
+    db.write_bytes(db.read_bytes()[:-5])
+    storage._written()
+
+    with pytest.raises(storage.StorageError):
+        storage.load_db()
+
+
+def test_retention_drops_oldest_over_limits(db):
+    storage.add_entries([
+        _paper("old", "2023-01-01T00:00:00"),
+        {**_paper("up1", "2024-03-01T00:00:00"), "source": "upload"},
+        {**_paper("up2", "2024-04-01T00:00:00"), "source": "upload"},
+        _paper("a", "2024-02-01T00:00:00"),
+        _paper("b", "2024-05-01T00:00:00"),
+    ])
+    now = datetime(2024, 6, 1)
+
+    assert storage.apply_retention(max_age_days=365, now=now) == 1
+    assert storage.apply_retention(source_quotas={"upload": 1}, now=now) == 1
+    assert storage.apply_retention(max_papers=2, now=now) == 1
+    assert [p["id"] for p in storage.get_history()] == ["b", "up2"]
+    assert {p["id"] for p in storage.search_entries("paper")} == {"b", "up2"}
+    assert storage.apply_retention(max_papers=2, now=now) == 0
+
+
+def test_compact_applies_configured_retention(db, monkeypatch):
+    storage.add_entries([_paper(str(i), f"2024-01-0{i}T00:00:00") for i in range(1, 6)])
+    monkeypatch.setattr(storage, "RETENTION_MAX_PAPERS", 3)
+
+    assert storage.compact() == 3
+    assert [p["id"] for p in storage.get_history()] == ["5", "4", "3"]
+    assert storage.search_entries("1") == []
+
+
+def test_sqlite_migrates_json_db_once(db, monkeypatch):
+    storage.save_db([_paper("a")])
+    storage.add_entry(_paper("b"))
+
+    monkeypatch.setattr(storage, "STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_migration_checked", False)
+    monkeypatch.setattr(storage_sqlite, "SQLITE_PATH", str(db.with_suffix(".sqlite3")))
+
+    assert [p["id"] for p in storage.load_db()] == ["a", "b"]
+    assert storage.migrate_json_to_sqlite() == 0
+
+
+def test_sqlite_dedup_delete_and_history(sqlite_db):
+    assert storage.add_entry(_paper("old", "2023-01-01T00:00:00"))
+    assert storage.add_entry(_paper("new", "2024-01-01T00:00:00"))
+    assert not storage.add_entry(_paper("new"))
+    assert storage.add_entries([_paper("new"), _paper("mid", "2023-06-01T00:00:00")]) == 1
+
+    assert [p["id"] for p in storage.get_history(limit=2)] == ["new", "mid"]
+    assert [p["id"] for p in storage.get_history(offset=1, sort="oldest")] == ["mid", "new"]
+    assert storage.count_history(since="2023-06-01T00:00:00") == 2
+    assert storage.delete_entry("old")
+    assert not storage.delete_entry("old")
+    assert [p["id"] for p in storage.load_db()] == ["new", "mid"]
+    assert storage.apply_retention(max_papers=1) == 1
+    assert [p["id"] for p in storage.load_db()] == ["new"]
+
+
+ABSTRACT = ("We introduce a sparse mixture of experts layer that routes each token to two of sixty four "
+            "feed forward experts. A learned router balances the load across experts with an auxiliary "
+            "loss, so training remains stable at scale. On language modelling benchmarks the model matches "
+            "a dense baseline with four times the compute, and it transfers to translation and summarization "
+            "with fewer parameters active per token than any previous sparse model.")
+
+
+def _pdf_text(abstract):
+    # As a PDF extractor returns it: header, hard line breaks, and the body after the abstract
+    words = abstract.split()
+    lines = [" ".join(words[i:i + 9]) for i in range(0, len(words), 9)]
+    return ("Sparse Experts at Scale\nA. Author, B. Author\nExample University\n\nAbstract\n"
+            + "\n".join(lines) + "\n\n1 Introduction\nLarge language models keep growing in size.\n")
+
+
+def test_near_duplicates_are_found_across_ids_and_formats(db):
+    storage.add_entry({"id": "http://arxiv.org/abs/2401.00001v1", "title": "Sparse", "abstract": ABSTRACT})
+    storage.add_entry({"id": "other", "abstract": "Graph neural networks predict the solubility of small "
+                                                  "molecules from their bond structure and atom types."})
+
+    # The uploaded PDF of the same paper, under a new id
+    assert storage.find_duplicate({"id": "local-1", "text": _pdf_text(ABSTRACT)})["id"] == "http://arxiv.org/abs/2401.00001v1"
+    assert storage.find_duplicate({"abstract": ABSTRACT.replace("sixty four", "thirty two")}) is not None
+    assert storage.find_duplicate({"abstract": "Reinforcement learning controls a robot arm with sparse "
+                                               "rewards and a learned model of the contact dynamics."}) is None
+    # Too short to tell apart
+    assert storage.find_duplicate({"abstract": "Sparse experts."}) is None
+
+    storage.delete_entry("http://arxiv.org/abs/2401.00001v1")
+    assert storage.find_duplicate({"text": _pdf_text(ABSTRACT)}) is None
+
+
+def test_signatures_do_not_depend_on_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    vectorized = dedup.signature({"abstract": ABSTRACT})
+    monkeypatch.setattr(dedup, "np", None)
+    assert dedup.signature({"abstract": ABSTRACT}) == vectorized
+
+
+def test_duplicate_lookup_compares_only_lsh_candidates(db, monkeypatch):
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(2000)]
+    papers = [{"id": str(i), "abstract": " ".join(rng.choices(vocabulary, k=60))} for i in range(300)]
+    storage.save_db(papers + [{"id": "sparse", "abstract": ABSTRACT}])
+    # A missed write: the index is rebuilt on the next lookup
+    dedup.rebuild([], None)
+
+    compared = []
+    real_similarity = dedup.similarity
+    monkeypatch.setattr(dedup, "similarity", lambda a, b: compared.append(1) or real_similarity(a, b))
+    assert storage.find_duplicate({"text": _pdf_text(ABSTRACT)})["id"] == "sparse"
+    assert len(compared) <= 3
+
+
+@pytest.mark.parametrize("identifier", ["http://arxiv.org/abs/2401.00001v1", "2401.00001", "arXiv:2401.00001v3",
+                                        "https://arxiv.org/pdf/2401.00001v2.pdf", "https://www.arxiv.org/abs/2401.00001/",
+                                        "https://doi.org/10.48550/arXiv.2401.00001"])
+def test_arxiv_identifiers_share_a_canonical_id(identifier):
+    assert paper_ids.canonical_id(identifier) == "arxiv:2401.00001"
+
+
+def test_canonical_ids_of_dois_urls_and_local_ids():
+    assert paper_ids.canonical_id("https://dx.doi.org/10.1000/ABC.def") == "doi:10.1000/abc.def"
+    assert paper_ids.canonical_id("doi:10.1000/abc.DEF") == "doi:10.1000/abc.def"
+    assert paper_ids.canonical_id("http://arxiv.org/abs/hep-th/9901001v2") == "arxiv:hep-th/9901001"
+    assert (paper_ids.canonical_id("HTTP://WWW.Example.com:443/papers/x.pdf?utm_source=feed&b=2&a=1#page=3")
+            == "url:example.com/papers/x.pdf?a=1&b=2")
+    assert paper_ids.canonical_id("local-1a2b") == "local-1a2b"
+
+
+def test_papers_are_found_and_deduplicated_by_canonical_id(db):
+    storage.add_entry({"id": "http://arxiv.org/abs/2401.00001v1", "title": "Sparse"})
+    storage.add_entry({"id": "https://example.com/papers/x.pdf"})
+
+    assert storage.find_paper("https://arxiv.org/pdf/2401.00001v2.pdf")["title"] == "Sparse"
+    assert storage.find_paper("http://www.example.com/papers/x.pdf?utm_source=feed")["id"] == "https://example.com/papers/x.pdf"
+    assert storage.find_paper("2401.00002") is None
+    assert not storage.add_entry({"id": "2401.00001"})
+    assert storage.add_entries([{"id": "arXiv:2401.00001v2"}, {"id": "2401.00003v1"}, {"id": "2401.00003v2"}]) == 1
+
+    storage.delete_entry("http://arxiv.org/abs/2401.00001v1")
+    assert storage.find_paper("2401.00001") is None
+
+
+def test_sqlite_backend_checks_canonical_ids(sqlite_db, monkeypatch):
+    storage.add_entry(_paper("seed"))
+
+    # Checked against the indexed canonical_id column, never by loading every paper
+    def full_load():
+        raise AssertionError("full load")
+    monkeypatch.setattr(storage_sqlite, "load_db", full_load)
+
+    assert storage.add_entry({"id": "http://arxiv.org/abs/2401.00001v1"})
+    assert not storage.add_entry({"id": "2401.00001v2"})
+    assert storage.add_entries([{"id": "2401.00001"}, {"id": "2401.00002"}]) == 1
+    assert storage.find_paper("https://arxiv.org/abs/2401.00002")["id"] == "2401.00002"
+
+
+def test_sqlite_upgrade_fills_canonical_ids(sqlite_db):
+    import sqlite3
+
+    conn = sqlite3.connect(storage_sqlite.SQLITE_PATH)
+    conn.execute("CREATE TABLE papers (id TEXT PRIMARY KEY, timestamp TEXT NOT NULL DEFAULT '', "
+                 "title TEXT NOT NULL DEFAULT '', data TEXT NOT NULL)")
+    conn.execute("INSERT INTO papers (id, data) VALUES (?, ?)",
+                 ("2401.00001v1", json.dumps({"id": "2401.00001v1"})))
+    conn.commit()
+    conn.close()
+
+    assert storage.find_paper("arxiv:2401.00001")["id"] == "2401.00001v1"
+    assert not storage.add_entry({"id": "https://arxiv.org/pdf/2401.00001"})
+
+
+@pytest.fixture
+def ingest(db, monkeypatch, tmp_path):
+    """paperscope.main over the tmp_path database, with arXiv, URL fetching and the summarizer faked."""
+    import importlib
+
+    calls = {"search": [], "fetch": [], "summarize": 0, "writes": 0}
+    arxiv_client = ModuleType("paperscope.arxiv_client")
+    arxiv_client.search_papers = lambda keywords, max_results: calls["search"]
+    url_handler = ModuleType("paperscope.url_handler")
+    url_handler.is_url = lambda text: text.startswith("http")
+
+    def fetch_paper_from_url(url):
+        calls["fetch"].append(url)
+        pdf_path = tmp_path / "temp.pdf"
+        pdf_path.write_bytes(b"%PDF")
+        return url, "Fetched", str(pdf_path)
+
+    url_handler.fetch_paper_from_url = fetch_paper_from_url
+    pdf_parser = ModuleType("paperscope.pdf_parser")
+    pdf_parser.extract_text_from_pdf = lambda path: "Full text of the fetched paper."
+    for module in (arxiv_client, url_handler, pdf_parser, storage):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    # tests/test_streamlit_app.py leaves stubs of paperscope.main and paperscope.storage behind
+    monkeypatch.delitem(sys.modules, "paperscope.main", raising=False)
+    main = importlib.import_module("paperscope.main")
+
+    def summarize(text):
+        calls["summarize"] += 1
+        return f"summary of {text[:20]}"
+
+    def add_entries(entries):
+        calls["writes"] += 1
+        return storage.add_entries(entries)
+
+    monkeypatch.setenv("DEMO_MODE", "1")
+    monkeypatch.setattr("paperscope.summarizer_demo.summarize", summarize)
+    monkeypatch.setattr(main, "add_entries", add_entries)
+    return main, calls
+
+
+def test_search_returns_its_hits_and_skips_stored_papers(ingest):
+    main, calls = ingest
+    storage.add_entry({"id": "http://arxiv.org/abs/2401.00001v1", "title": "Sparse"})
+    calls["search"] = [("http://arxiv.org/abs/2401.00002v1", "Dense", "dense abstract"),
+                       ("http://arxiv.org/abs/2401.00001v2", "Sparse", "sparse abstract")]
+
+    hits = main.fetch_and_summarize("sparse dense")
+    assert [p["id"] for p in hits] == ["http://arxiv.org/abs/2401.00002v1", "http://arxiv.org/abs/2401.00001v1"]
+    assert calls["summarize"] == 1
+
+    # Every hit stored: nothing is summarized or written, and the hits come back
+    storage.add_entry({"id": "2401.00003", "title": "Newest"})
+    hits = main.fetch_and_summarize("sparse dense")
+    assert [p["title"] for p in hits] == ["Dense", "Sparse"]
+    assert calls["summarize"] == 1 and calls["writes"] == 1
+
+
+def test_url_of_a_stored_paper_is_not_fetched(ingest):
+    main, calls = ingest
+    storage.add_entry({"id": "http://arxiv.org/abs/2401.00001v1", "title": "Sparse"})
+    storage.add_entry({"id": "2401.00003", "title": "Newest"})
+
+    hits = main.fetch_and_summarize("https://arxiv.org/pdf/2401.00001v2.pdf")
+    assert [p["title"] for p in hits] == ["Sparse"]
+    assert calls["fetch"] == [] and calls["summarize"] == 0
+
+    hits = main.fetch_and_summarize("https://example.com/papers/new.pdf")
+    assert [p["title"] for p in hits] == ["Fetched"]
+    assert len(calls["fetch"]) == calls["summarize"] == 1
+
+
+def test_search_stores_its_new_hits_with_one_write(ingest):
+    main, calls = ingest
+    calls["search"] = [(f"http://arxiv.org/abs/2401.0000{n}v1", f"Paper {n}", f"abstract number {n}")
+                       for n in range(1, 4)]
+
+    hits = main.fetch_and_summarize("papers")
+    assert [p["title"] for p in hits] == ["Paper 1", "Paper 2", "Paper 3"]
+    assert calls["summarize"] == 3 and calls["writes"] == 1
+    assert storage.count_history() == 3
+
+
+def test_demo_data_replaces_the_database(db, monkeypatch):
+    import importlib
+
+    # tests/test_streamlit_app.py leaves stubs of paperscope.demo_data and paperscope.storage behind
+    monkeypatch.setitem(sys.modules, "paperscope.storage", storage)
+    monkeypatch.delitem(sys.modules, "paperscope.demo_data", raising=False)
+    demo_data = importlib.import_module("paperscope.demo_data")
+
+    storage.add_entry({"id": "2401.00001", "title": "Stored"})
+    ok, _ = demo_data.load_demo_data()
+    assert ok
+    assert [p["id"] for p in storage.load_db()] == ["demo:1", "demo:2"]
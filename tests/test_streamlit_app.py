@@ -36,13 +36,24 @@ m_pdf.extract_text_from_pdf = lambda p: "dummy text"
 m_vs = _mk_module("paperscope.vector_store")
 m_vs.build_index = lambda: None
 m_vs.search_similar = lambda q: [{"title": "x", "summary": "y", "id": "2"}]
+m_vs.warm_up = lambda name=None: None
+m_vs.model_info = lambda name=None: None
+m_vs.hybrid_search = lambda q: []
+
+# paperscope.passage_index
+m_pi = _mk_module("paperscope.passage_index")
+m_pi.build_index = lambda: None
+m_pi.search_passages = lambda q: []
 
 # Optional storage module (so STORAGE_AVAILABLE=True in app)
 m_storage = _mk_module("paperscope.storage")
-m_storage.get_history = lambda: []
+m_storage.get_history = lambda **_: []
+m_storage.count_history = lambda **_: 0
 m_storage.clear_history = lambda: None
 m_storage.delete_entry = lambda _id: True
 m_storage.save_history_entry = lambda _entry: None
+m_storage.get_entries = lambda ids: []
+m_storage.find_duplicate = lambda entry: None
 
 # Optional helpers referenced by the app in some paths
 m_url = _mk_module("paperscope.url_handler")
@@ -0,0 +1,576 @@
+import json
+import sys
+import threading
+import time
+from datetime import date, datetime
+from pathlib import Path
+from types import ModuleType
+from typing import ClassVar
+
+import pytest
+
+# -----------------------------------------------------------------------------
+# Add project root to import path
+# -----------------------------------------------------------------------------
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# -----------------------------------------------------------------------------
+# paperscope.config holds credentials and is not committed; stub it
+# -----------------------------------------------------------------------------
+if "paperscope.config" not in sys.modules:
+    m_config = ModuleType("paperscope.config")
+    m_config.DB_PATH = "db.json"
+    m_config.API_KEY = ""
+    m_config.MODEL = ""
+    sys.modules["paperscope.config"] = m_config
+
+from paperscope import embedding_cache, record_file, vector_store
+
+
+class _FakeModel:
+    loads = 0
+
+    def __init__(self, name):
+        time.sleep(0.05)
+        _FakeModel.loads += 1
+        self.name = name
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    """An empty model registry that loads _FakeModel instead of sentence-transformers."""
+    _FakeModel.loads = 0
+    monkeypatch.setattr(vector_store, "SentenceTransformer", _FakeModel)
+    monkeypatch.setattr(vector_store, "_HAS_SENTENCE_TRANSFORMERS", True)
+    monkeypatch.setattr(vector_store, "_HAS_VECTOR_ENGINE", True)
+    monkeypatch.setattr(vector_store, "_models", {})
+    monkeypatch.setattr(vector_store, "_model_info", {})
+    monkeypatch.setattr(vector_store, "_load_errors", {})
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_DIR", str(tmp_path / "db.embeddings"))
+    embedding_cache.reset_stats()
+
+
+# =========================
+#       TESTS
+# =========================
+def test_model_is_loaded_once_across_threads(registry):
+    assert vector_store.model_info() is None
+
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(vector_store.get_model())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert _FakeModel.loads == 1
+    assert all(model is models[0] for model in models)
+    info = vector_store.model_info()
+    assert info["name"] == vector_store.EMBEDDING_MODEL
+    assert info["load_seconds"] >= 0.05
+
+
+def test_failed_load_is_not_retried_until_warm_up(registry, monkeypatch):
+    def broken(name):
+        _FakeModel.loads += 1
+        raise OSError("offline")
+
+    monkeypatch.setattr(vector_store, "SentenceTransformer", broken)
+    for _ in range(3):
+        with pytest.raises(OSError):
+            vector_store.get_model()
+    assert _FakeModel.loads == 1
+
+    monkeypatch.setattr(vector_store, "SentenceTransformer", _FakeModel)
+    assert vector_store.warm_up()["name"] == vector_store.EMBEDDING_MODEL
+    assert _FakeModel.loads == 2
+
+
+class _BatchModel:
+    calls: ClassVar[list] = []
+
+    def __init__(self, name):
+        pass
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        import numpy as np
+        _BatchModel.calls.append(len(texts))
+        return np.array([[len(t), 1.0, 0.0] for t in texts], dtype="float64")
+
+
+@pytest.fixture
+def faiss_store(registry, monkeypatch, tmp_path):
+    """FAISS-backed vector store in tmp_path over an in-memory list of papers."""
+    faiss = pytest.importorskip("faiss")
+    np = pytest.importorskip("numpy")
+    monkeypatch.setattr(vector_store, "faiss", faiss)
+    monkeypatch.setattr(vector_store, "np", np)
+    monkeypatch.setattr(vector_store, "SentenceTransformer", _BatchModel)
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_PATH", str(tmp_path / "faiss.index"))
+    monkeypatch.setattr(vector_store, "VECTOR_META_PATH", str(tmp_path / "meta.json"))
+    papers = [{"id": str(i), "title": f"t{i}", "summary": "x" * i} for i in range(1, 11)]
+    monkeypatch.setattr(vector_store, "load_db", lambda: tuple(papers))
+    monkeypatch.setattr(vector_store, "db_version", lambda: 1)
+    _BatchModel.calls = []
+    return papers
+
+
+def test_build_index_embeds_in_batches(faiss_store):
+    vector_store.build_index(batch_size=4)
+
+    assert _BatchModel.calls == [4, 4, 2]
+    _, index, records = vector_store._load()
+    assert index.ntotal == len(records) == 10 and index.d == 3
+    assert index.reconstruct(vector_store._vector_id("7")).tolist() == [7.0, 1.0, 0.0]
+    assert [p["id"] for p in vector_store.search_similar("x" * 7, k=1)] == ["7"]
+
+
+def test_add_and_remove_only_touch_changed_papers(faiss_store, monkeypatch):
+    vector_store.build_index()
+    _BatchModel.calls = []
+
+    new = {"id": "new", "title": "n", "summary": "x" * 20}
+    vector_store.add_papers([new], before=1, after=2)
+    vector_store.remove_papers(["7"], before=2, after=3)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 3)
+
+    assert _BatchModel.calls == [1]
+    assert [p["id"] for p in vector_store.search_similar("x" * 20, k=1)] == ["new"]
+    assert "7" not in [p["id"] for p in vector_store.search_similar("x" * 7, k=3)]
+    # Both queries match cached summaries
+    assert _BatchModel.calls == [1]
+
+
+def test_search_syncs_missing_papers_after_a_gap(faiss_store, monkeypatch):
+    vector_store.build_index()
+    faiss_store.append({"id": "late", "title": "l", "summary": "x" * 30})
+    del faiss_store[0]
+    monkeypatch.setattr(vector_store, "db_version", lambda: 5)
+    _BatchModel.calls = []
+
+    assert [p["id"] for p in vector_store.search_similar("x" * 30, k=1)] == ["late"]
+    assert _BatchModel.calls == [1]
+    assert vector_store.sync() == (0, 0)
+
+
+def test_papers_are_not_indexed_without_the_model(faiss_store, monkeypatch):
+    vector_store.build_index()
+
+    def broken(name):
+        raise OSError("offline")
+
+    monkeypatch.setattr(vector_store, "_models", {})
+    monkeypatch.setattr(vector_store, "SentenceTransformer", broken)
+    new = {"id": "new", "title": "n", "summary": "x" * 20}
+    with pytest.raises(OSError):
+        vector_store.add_papers([new], before=1, after=2)
+    manifest, _, records = vector_store._load()
+    assert manifest["db_version"] == 1 and vector_store._vector_id("new") not in records
+
+    # Once the model loads again, the next search syncs the paper in
+    faiss_store.append(new)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 2)
+    monkeypatch.setattr(vector_store, "SentenceTransformer", _BatchModel)
+    vector_store.warm_up()
+    assert [p["id"] for p in vector_store.search_similar("x" * 20, k=1)] == ["new"]
+    _, index, _ = vector_store._load()
+    assert index.reconstruct(vector_store._vector_id("new")).tolist() == [20.0, 1.0, 0.0]
+
+
+def test_legacy_flat_index_is_converted(faiss_store):
+    faiss, np = vector_store.faiss, vector_store.np
+    index = faiss.IndexFlatL2(3)
+    index.add(np.array([[1, 1, 0], [2, 1, 0]], dtype="float32"))
+    faiss.write_index(index, vector_store.VECTOR_INDEX_PATH)
+    with open(vector_store.VECTOR_META_PATH, "w") as f:
+        json.dump([{"id": "1", "summary": "x"}, {"id": "2", "summary": "xx"}], f)
+
+    manifest, index, records = vector_store._load()
+    assert manifest["generation"] == 1
+    assert index.reconstruct(vector_store._vector_id("2")).tolist() == [2.0, 1.0, 0.0]
+    assert json.loads(records.get(vector_store._vector_id("1")))["id"] == "1"
+    assert [p["id"] for p in vector_store.search_similar("xx", k=1)] == ["2"]
+
+
+def test_rebuild_reuses_cached_embeddings(faiss_store, monkeypatch):
+    vector_store.build_index(batch_size=4)
+    assert embedding_cache.stats() == {"hits": 0, "misses": 10}
+
+    # A fresh process: nothing loaded, the cache on disk answers everything
+    monkeypatch.setattr(vector_store, "_models", {})
+    monkeypatch.setattr(vector_store, "_model_info", {})
+    monkeypatch.setattr(embedding_cache, "_maps", {})
+    _BatchModel.calls = []
+    vector_store.build_index(batch_size=4)
+
+    assert _BatchModel.calls == []
+    assert vector_store.model_info() is None
+    assert embedding_cache.stats() == {"hits": 10, "misses": 10}
+    _, index, _ = vector_store._load()
+    assert index.reconstruct(vector_store._vector_id("7")).tolist() == [7.0, 1.0, 0.0]
+
+
+def test_cache_keys_include_the_model_and_normalization(faiss_store, monkeypatch):
+    vector_store.embed_texts(["same text", "same text"])
+    assert embedding_cache.stats() == {"hits": 0, "misses": 2}
+    assert _BatchModel.calls == [1]
+
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL", "other-model")
+    vector_store.embed_texts(["same text"])
+    assert _BatchModel.calls == [1, 1]
+
+    # The same model without normalization gives other vectors
+    raw = dict(vector_store.EMBEDDING_BACKENDS["minilm"], normalize=False)
+    monkeypatch.setitem(vector_store.EMBEDDING_BACKENDS, "minilm-raw", raw)
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL", "minilm-raw")
+    vector_store.embed_texts(["same text"])
+    assert _BatchModel.calls == [1, 1, 1]
+
+
+def test_searcher_keeps_index_resident_until_files_change(faiss_store, monkeypatch):
+    monkeypatch.setattr(vector_store, "_searcher", vector_store._Searcher())
+    monkeypatch.setattr(vector_store, "VECTOR_MMAP", True)
+    vector_store.build_index()
+    loads = []
+    real_load = vector_store._load
+    monkeypatch.setattr(vector_store, "_load", lambda mmap=False, base=None: loads.append(mmap) or real_load(mmap, base))
+
+    for _ in range(3):
+        assert [p["id"] for p in vector_store.search_similar("x" * 3, k=1)] == ["3"]
+    assert loads == [True]
+
+    # The update writes a segment without loading the index
+    vector_store.add_papers([{"id": "new", "summary": "x" * 40}], before=1, after=1)
+    assert [p["id"] for p in vector_store.search_similar("x" * 40, k=1)] == ["new"]
+    assert loads == [True, True]
+
+
+def test_record_file_lookups(tmp_path):
+    path = str(tmp_path / "records")
+    record_file.write(path, 7, [(30, b"c"), (-5, b"a"), (10, b"bb")])
+
+    records = record_file.RecordFile(path)
+    assert (records.generation, len(records)) == (7, 3)
+    assert records.get(10) == b"bb" and records.get(-5) == b"a"
+    assert records.get(11) is None
+    assert records.ids() == [-5, 10, 30]
+
+
+def test_layered_records_hide_removed_ids(tmp_path):
+    paths = [str(tmp_path / f"records.{n}") for n in range(3)]
+    record_file.write(paths[0], 1, [(1, b"a"), (2, b"b"), (3, b"c")])
+    record_file.write(paths[1], 1, [(2, b"B"), (4, b"d")])
+    record_file.write(paths[2], 1, [(5, b"e")])
+
+    # The second file replaces 2 and removes 3, the third removes 4
+    records = record_file.LayeredRecords(paths, [[2, 3], [4]])
+    assert (records.generation, len(records)) == (1, 3)
+    assert [records.get(i) for i in range(1, 6)] == [b"a", b"B", None, None, b"e"]
+    assert sorted(records.items()) == [(1, b"a"), (2, b"B"), (5, b"e")]
+    assert 3 not in records and 5 in records
+
+
+def test_updates_are_segments_until_the_generation_is_rewritten(faiss_store, monkeypatch, tmp_path):
+    vector_store.build_index()
+    faiss_store.append({"id": "new", "summary": "x" * 40})
+    vector_store.add_papers(faiss_store[-1:], before=1, after=2)
+    faiss_store.pop(2)
+    vector_store.remove_papers(["3"], before=2, after=3)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 3)
+
+    # The second segment folded the first into itself; only segment files were written
+    manifest, index, records = vector_store._load()
+    assert (manifest["generation"], manifest["db_version"]) == (1, 3)
+    assert [segment["number"] for segment in manifest["segments"]] == [2]
+    assert index.ntotal == len(records) == manifest["count"] == 10
+    assert "3" not in [p["id"] for p in vector_store.search_similar("x" * 3, k=3)]
+    assert [p["id"] for p in vector_store.search_similar("x" * 40, k=1, sources="arxiv")] == ["new"]
+
+    # Past VECTOR_SEGMENT_SHARE the next update writes a new generation
+    vector_store.add_papers([{"id": "a", "summary": "x" * 50}, {"id": "b", "summary": "x" * 60}], before=3, after=4)
+    manifest, index, records = vector_store._load()
+    assert (manifest["generation"], manifest.get("segments")) == (2, None)
+    assert index.ntotal == len(records) == 12
+    # The previous generation is kept for readers still using it, older ones are removed
+    assert sorted(p.name for p in tmp_path.glob("faiss.index.[0-9]*") if "seg" not in p.name) == [
+        "faiss.index.1", "faiss.index.1.attrs.npy", "faiss.index.1.records",
+        "faiss.index.2", "faiss.index.2.attrs.npy", "faiss.index.2.records"]
+
+
+@pytest.fixture
+def ann_store(faiss_store, monkeypatch):
+    """faiss_store with approximate indexes allowed on its ten papers."""
+    monkeypatch.setattr(vector_store, "VECTOR_ANN_MIN_VECTORS", 5)
+    monkeypatch.setattr(vector_store, "IVF_NLIST", 2)
+    monkeypatch.setattr(vector_store, "HNSW_M", 4)
+    return faiss_store
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_configured_index_type_is_built_and_persisted(ann_store, monkeypatch, kind):
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", kind)
+    vector_store.build_index()
+
+    manifest, index, records = vector_store._load()
+    assert manifest["index_params"]["type"] == kind
+    assert index.ntotal == len(records) == 10
+    assert [p["id"] for p in vector_store.search_similar("x" * 7, k=1)] == ["7"]
+
+    # Search parameters are saved with the index; the environment overrides them
+    if kind == "ivf":
+        assert vector_store.faiss.extract_index_ivf(index).nprobe == 16
+        monkeypatch.setattr(vector_store, "IVF_NPROBE", 1)
+        _, index, _ = vector_store._load()
+        assert vector_store.faiss.extract_index_ivf(index).nprobe == 1
+    else:
+        assert vector_store.faiss.downcast_index(index.index).hnsw.efSearch == 64
+
+
+def test_small_corpus_stays_flat_until_it_grows(ann_store, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(vector_store, "VECTOR_ANN_MIN_VECTORS", 11)
+    vector_store.build_index()
+    assert vector_store._load()[0]["index_params"] == {"type": "flat"}
+
+    vector_store.add_papers([{"id": "new", "summary": "x" * 40}], before=1, after=2)
+    manifest, index, records = vector_store._load()
+    assert manifest["index_params"]["type"] == "hnsw"
+    assert index.ntotal == len(records) == 11
+    assert index.reconstruct(vector_store._vector_id("7")).tolist() == [7.0, 1.0, 0.0]
+
+
+def test_hnsw_deletions_are_skipped_then_rebuilt(ann_store, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", "hnsw")
+    vector_store.build_index()
+
+    vector_store.remove_papers(["7"], before=1, after=2)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 2)
+    manifest, index, records = vector_store._load()
+    assert (index.ntotal, len(records), manifest["orphans"]) == (10, 9, 1)
+    assert sorted(p["id"] for p in vector_store.search_similar("x" * 7, k=2)) == ["6", "8"]
+
+    # Past VECTOR_MAX_ORPHANS the index is rebuilt from the live vectors
+    vector_store.remove_papers(["1", "2"], before=2, after=3)
+    manifest, index, records = vector_store._load()
+    assert (index.ntotal, len(records), manifest["orphans"]) == (7, 7, 0)
+
+
+def test_hashing_encoder_is_deterministic_and_normalized():
+    np = pytest.importorskip("numpy")
+    from paperscope.hashing_encoder import HashingEncoder
+
+    encoder = HashingEncoder(64)
+    a, b, c, empty = encoder.encode(["graph neural networks", "graph neural networks",
+                                     "protein folding", ""])
+    assert a.shape == (64,) and np.allclose(a, b)
+    assert abs(np.linalg.norm(a) - 1) < 1e-6 and not empty.any()
+    near = encoder.encode(["neural networks for graphs"])[0]
+    assert a @ near > a @ c
+
+
+def test_manifest_records_the_embedding_backend(faiss_store):
+    vector_store.build_index()
+
+    manifest, _, _ = vector_store._load()
+    assert manifest["embedding"] == {"model": "all-MiniLM-L6-v2", "dim": 3, "metric": "l2", "normalize": True}
+    assert vector_store.embedding_backend("minilm") is vector_store.embedding_backend("all-MiniLM-L6-v2")
+    assert vector_store.embedding_backend("my/model")["dim"] is None
+
+
+def test_changed_model_is_re_embedded_on_search(faiss_store, monkeypatch):
+    vector_store.build_index()
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL", "hashing")
+
+    assert [p["id"] for p in vector_store.search_similar("x" * 7, k=1)] == ["7"]
+    manifest, index, records = vector_store._load()
+    assert manifest["embedding"]["model"] == "hashing-512" and index.d == 512
+    assert (manifest["generation"], manifest["db_version"], len(records)) == (2, 1, 10)
+    assert vector_store.model_info()["dim"] == 512
+
+
+def test_adding_after_a_model_change_re_embeds_the_index(faiss_store, monkeypatch):
+    vector_store.build_index()
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL", "hashing")
+
+    vector_store.add_papers([{"id": "new", "summary": "fresh words"}], before=1, after=2)
+    manifest, index, records = vector_store._load()
+    assert index.d == 512 and index.ntotal == len(records) == 11
+    assert manifest["db_version"] == 2
+
+
+def test_numpy_index_matches_exact_faiss_search():
+    faiss = pytest.importorskip("faiss")
+    np = pytest.importorskip("numpy")
+    from paperscope.numpy_index import NumpyIndex
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 16)).astype("float32")
+    ids = rng.choice(10 ** 9, size=500, replace=False).astype("int64")
+    queries = rng.standard_normal((7, 16)).astype("float32")
+    exact, index = faiss.index_factory(16, "IDMap2,Flat"), NumpyIndex(16)
+    for each in (exact, index):
+        each.add_with_ids(vectors[:300], ids[:300])
+        each.add_with_ids(vectors[300:], ids[300:])
+        each.remove_ids(ids[:50])
+
+    D, I = index.search(queries, 10)
+    D_exact, I_exact = exact.search(queries, 10)
+    assert index.ntotal == 450
+    assert (I == I_exact).all() and np.allclose(D, D_exact, atol=1e-3)
+    assert np.allclose(index.reconstruct_batch(ids[[60, 55]]), vectors[[60, 55]])
+    _, I = index.search(queries[:1], 5, ids=ids[100:103])
+    assert set(I[0][:3]) == set(ids[100:103]) and (I[0][3:] == -1).all()
+
+
+@pytest.fixture
+def numpy_store(faiss_store, monkeypatch):
+    """The same store on a host without FAISS."""
+    monkeypatch.setattr(vector_store, "faiss", None)
+    return faiss_store
+
+
+def test_vector_search_without_faiss_runs_on_numpy(numpy_store, monkeypatch):
+    faiss = pytest.importorskip("faiss")
+    vector_store.build_index()
+    manifest, index, _ = vector_store._load(mmap=True)
+    assert manifest["engine"] == "numpy" and isinstance(index._vectors, vector_store.np.memmap)
+    assert [p["id"] for p in vector_store.search_similar("x" * 7, k=1)] == ["7"]
+
+    vector_store.add_papers([{"id": "new", "summary": "x" * 20}], before=1, after=2)
+    vector_store.remove_papers(["7"], before=2, after=3)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 3)
+    assert [p["id"] for p in vector_store.search_similar("x" * 20, k=1)] == ["new"]
+    assert "7" not in [p["id"] for p in vector_store.search_similar("x" * 7, k=3)]
+    assert [p["id"] for p in vector_store.search_similar("x" * 7, k=5, ids=["1", "2"])] == ["2", "1"]
+
+    # Once FAISS is installed, the next update moves the index to it
+    monkeypatch.setattr(vector_store, "faiss", faiss)
+    vector_store.remove_papers(["1"], before=3, after=4)
+    manifest, index, records = vector_store._load()
+    assert manifest["engine"] == "faiss" and index.ntotal == len(records) == 9
+
+
+def test_without_sentence_transformers_the_hashing_encoder_is_used(numpy_store, monkeypatch):
+    np = vector_store.np
+    monkeypatch.setattr(vector_store, "_HAS_SENTENCE_TRANSFORMERS", False)
+    numpy_store[:] = [{"id": "gnn", "summary": "Graph neural networks predict molecule properties."},
+                      {"id": "rl", "summary": "Reinforcement learning for robot arm control."}]
+    vector_store.build_index()
+
+    manifest, _, _ = vector_store._load()
+    assert manifest["embedding"]["model"] == "hashing-512"
+    assert [p["id"] for p in vector_store.search_similar("neural networks on graphs", k=1)] == ["gnn"]
+    # Without numpy, embed_text returns the same vector as a list
+    monkeypatch.setattr(vector_store, "_HAS_VECTOR_ENGINE", False)
+    assert np.allclose(vector_store.embed_text("robot control"), vector_store.embed_texts(["robot control"])[0])
+
+
+def test_hybrid_search_fuses_keyword_and_vector_rankings(faiss_store, monkeypatch):
+    vector_store.build_index()
+    # The keyword leg knows an acronym the vectors cannot see
+    monkeypatch.setattr(vector_store, "rank_entries", lambda text, limit=None: [("2", 9.0), ("7", 3.0)])
+
+    ranked = vector_store.hybrid_search("x" * 7, k=3)
+    assert [paper_id for paper_id, _ in ranked][:2] == ["7", "2"]
+    assert len({paper_id for paper_id, _ in ranked}) == 3
+    assert ranked[0][1] == pytest.approx(0.5 / 62 + 0.5 / 61)
+
+    keyword_only = vector_store.hybrid_search("x" * 7, k=1, fusion="weighted", weight=0.0)
+    assert keyword_only == [("2", 1.0)]
+    with pytest.raises(ValueError):
+        vector_store.hybrid_search("x", fusion="max")
+
+
+def test_hybrid_search_survives_a_failing_leg(faiss_store, monkeypatch, capsys):
+    vector_store.build_index()
+
+    def broken(text, limit=None):
+        raise RuntimeError("index locked")
+
+    monkeypatch.setattr(vector_store, "rank_entries", broken)
+    assert vector_store.hybrid_search("x" * 4, k=1)[0][0] == "4"
+    assert "Keyword search failed" in capsys.readouterr().out
+
+    monkeypatch.setattr(vector_store, "_HAS_VECTOR_ENGINE", False)
+    monkeypatch.setattr(vector_store, "rank_entries", lambda text, limit=None: [("5", 2.0)])
+    assert [paper_id for paper_id, _ in vector_store.hybrid_search("x")] == ["5"]
+
+
+def test_many_queries_are_embedded_and_searched_together(faiss_store, monkeypatch):
+    vector_store.build_index()
+    _BatchModel.calls = []
+    searches = []
+    _, index, _ = vector_store._load()
+    real_search = type(index).search
+    monkeypatch.setattr(type(index), "search", lambda self, x, k, *a, **kw: searches.append(len(x)) or real_search(self, x, k, *a, **kw))
+
+    results = vector_store.search_similar_many(["q" * 3, "q" * 8, "q" * 10], k=2)
+    assert _BatchModel.calls == [3] and searches == [3]
+    assert [next(paper["id"] for paper, _ in hits) for hits in results] == ["3", "8", "10"]
+    assert all(len(hits) == 2 for hits in results)
+    assert results[0][0][1] == 1.0 and 0 < results[0][1][1] < 1.0
+
+
+def test_search_pages_with_offset(faiss_store):
+    vector_store.build_index()
+
+    first = [p["id"] for p in vector_store.search_similar("x" * 10, k=3)]
+    second = [p["id"] for p in vector_store.search_similar("x" * 10, k=3, offset=3)]
+    assert first == ["10", "9", "8"] and second == ["7", "6", "5"]
+    assert vector_store.search_similar_many(["x" * 10], k=3, offset=9)[0][0][0]["id"] == "1"
+    assert len(vector_store.search_similar_many(["x" * 10], k=3, offset=9)[0]) == 1
+
+
+def _with_attributes(papers):
+    for paper in papers:
+        n = int(paper["id"])
+        paper["source"] = "upload" if n % 2 else "arxiv"
+        paper["timestamp"] = f"2024-01-{n:02d}T12:00:00"
+
+
+def test_filters_are_applied_inside_the_search(faiss_store, monkeypatch):
+    _with_attributes(faiss_store)
+    vector_store.build_index()
+
+    def ids(**filters):
+        return [p["id"] for p in vector_store.search_similar("x" * 10, k=3, **filters)]
+
+    assert ids(sources="upload") == ["9", "7", "5"]
+    assert ids(sources=["arxiv"], until="2024-01-04") == ["4", "2"]
+    assert ids(since=date(2024, 1, 3), until=datetime(2024, 1, 5, 12)) == ["5", "4", "3"]
+    assert ids(ids=["1", "2", "unknown"]) == ["2", "1"]
+    assert ids(sources="manual") == []
+    with pytest.raises(ValueError):
+        ids(since="last week")
+
+    # Attributes of unchanged papers are carried over to the next generation
+    faiss_store.append({"id": "11", "summary": "x" * 11, "source": "manual"})
+    vector_store.add_papers(faiss_store[-1:], before=1, after=2)
+    monkeypatch.setattr(vector_store, "db_version", lambda: 2)
+    manifest, _, _ = vector_store._load()
+    assert manifest["sources"] == ["upload", "arxiv", "manual"]
+    assert vector_store.search_similar_many(["x"], k=2, sources="manual")[0][0][0]["id"] == "11"
+
+
+@pytest.mark.parametrize("kind", ["ivf", "hnsw"])
+def test_filtered_ann_search_returns_k_matches(ann_store, monkeypatch, kind):
+    _with_attributes(ann_store)
+    monkeypatch.setattr(vector_store, "VECTOR_INDEX_TYPE", kind)
+    monkeypatch.setattr(vector_store, "IVF_NPROBE", 1)
+    vector_store.build_index()
+
+    # The matches are far from the query, outside the IVF list it probes first
+    assert [p["id"] for p in vector_store.search_similar("x", k=2, ids=["9", "10"])] == ["9", "10"]
+    assert len(vector_store.search_similar("x", k=5, sources="arxiv")) == 5
+
+
+def test_filters_without_faiss_use_keyword_results(registry, monkeypatch):
+    monkeypatch.setattr(vector_store, "_HAS_VECTOR_ENGINE", False)
+    papers = {str(i): {"id": str(i), "source": "upload" if i % 2 else "arxiv"} for i in range(1, 7)}
+    monkeypatch.setattr(vector_store, "rank_entries", lambda text, limit=None: [(i, 1.0) for i in papers][:limit])
+    monkeypatch.setattr(vector_store, "get_entries", lambda ids: [papers[i] for i in ids])
+
+    assert [p["id"] for p in vector_store.search_similar("q", k=2, sources="arxiv")] == ["2", "4"]
+    assert [p["id"] for p in vector_store.search_similar("q", k=2, offset=1)] == ["2", "3"]